@@ -1,16 +1,43 @@
-from flask import Flask, render_template, jsonify, request, Response
-import json
-from translator import SocialAnxietyTranslator
+from flask import Flask, render_template, jsonify, request, Response, g
+from sessions import SessionRegistry, SessionLimitError, SESSION_COOKIE
+from translator import llm_cache, asr, llm_router, phrasebook, transcript_store
+from workers import Superseded
+from transcripts import format_entry
+from metrics import REGISTRY, CONTENT_TYPE
+import handlers
+from handlers import BadRequest
 import threading
-import time
-import os
 
 app = Flask(__name__)
-translator = SocialAnxietyTranslator()
+sessions = SessionRegistry()
+handlers.install_metrics(sessions)
 
-# 存储最新的翻译结果
-latest_result = None
-is_processing = False
+
+def current_session():
+    """获取（必要时创建）当前请求对应的会话"""
+    session = getattr(g, 'session', None)
+    if session is None:
+        session = sessions.get_or_create(handlers.requested_sid(request.headers, request.args, request.cookies))
+        g.session = session
+    return session
+
+
+@app.errorhandler(SessionLimitError)
+def session_limit(e):
+    return jsonify({'error': str(e)}), 503
+
+
+@app.errorhandler(BadRequest)
+def bad_request(e):
+    return jsonify(e.body()), e.status
+
+
+@app.after_request
+def remember_session(resp):
+    session = getattr(g, 'session', None)
+    if handlers.needs_cookie(session, request.cookies):
+        resp.set_cookie(SESSION_COOKIE, session.sid, httponly=True, samesite='Lax')
+    return resp
 
 @app.route('/favicon.ico')
 def favicon():
@@ -18,71 +45,73 @@ def favicon():
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_template('index.html', audio_input=sessions.audio_input)
 
 @app.route('/start_recording', methods=['POST'])
 def start_recording():
-    global latest_result, is_processing
-    
-    if is_processing:
+    session = current_session()
+    translator = session.translator
+
+    if not session.try_begin_processing():
         return jsonify({'error': '正在处理中，请稍候'})
-    
-    is_processing = True
-    
+    # 本次录音所属的代次：清除结果或重置会话之后，结果不再写回
+    alive = translator._generation_alive()
+
     def process_audio_async():
-        global latest_result, is_processing
         try:
-            latest_result = {'original_text': '正在准备麦克风...', 'translation': '等待AI分析...', 'status_hint': '🎤 正在激活麦克风...'}
-            def cb(msg):
-                global latest_result
-                base_text = (latest_result or {}).get('original_text') or '等待录音...'
-                translation_hint = (latest_result or {}).get('translation') or '等待AI分析...'
-                latest_result = {'original_text': base_text, 'translation': translation_hint, 'status_hint': msg}
-            text = translator.speech_to_text_with_progress(cb)
+            session.set_result(handlers.MIC_STARTING)
+            text = translator.speech_to_text_with_progress(handlers.progress_sink(session))
             if not text:
-                latest_result = {'original_text': '语音识别失败', 'translation': '请检查麦克风并重试'}
+                session.set_result(handlers.RECOGNITION_FAILED)
             else:
-                latest_result = {'original_text': text, 'translation': '分析中...', 'status_hint': '🧠 已识别，正在分析...'}
-                translation = translator.translate_politeness(text)
-                latest_result = {'original_text': text, 'translation': translation}
+                session.set_result(handlers.recognized(text))
+                translation = translator.translate_politeness(text, on_delta=handlers.partial_sink(session.set_result, text),
+                                                              alive=alive)
+                session.set_result(handlers.analyzed(text, translation))
+        except Superseded:
+            print("🗑️ 会话已重置，丢弃分析结果")
         except Exception as e:
-            latest_result = {
-                'original_text': '处理出错',
-                'translation': f'错误: {str(e)}'
-            }
+            session.set_result(handlers.processing_failed(e))
         finally:
-            is_processing = False
-    
+            session.end_processing()
+
     # 在新线程中处理音频，避免阻塞
     thread = threading.Thread(target=process_audio_async)
     thread.start()
-    
+
     return jsonify({'status': '开始录音处理'})
 
 @app.route('/get_result', methods=['GET'])
 def get_result():
-    global latest_result, is_processing
-    
-    if is_processing:
-        resp = {'status': 'processing'}
-        if latest_result:
-            resp['result'] = latest_result
-        return jsonify(resp)
-    
-    if latest_result:
-        return jsonify({
-            'status': 'completed',
-            'result': latest_result
-        })
-    
-    return jsonify({'status': 'waiting'})
+    """返回当前结果；带 since（或 If-None-Match）时若没有更新最多等待 wait 秒，仍无变化返回 304"""
+    session = current_session()
+    known, wait = handlers.result_wait(session, request.args, request.headers)
+    if known is not None and wait > 0:
+        state = session.wait_result(known, wait)
+    else:
+        state = session.result_state()
+    body, headers = handlers.result_reply(session, known, state)
+    resp = Response(status=304) if body is None else jsonify(body)
+    resp.headers.update(headers)
+    return resp
+
+@app.route('/stream_result')
+def stream_result():
+    """以 SSE 推送当前会话结果的每次变化（含生成中的分析），处理完成后结束"""
+    session = current_session()
+    stream = handlers.ResultStream()
+    def generate():
+        while not stream.done:
+            session.touch()
+            yield stream.frame(session.wait_result(stream.version, timeout=15))
+    return Response(generate(), mimetype='text/event-stream', headers=handlers.SSE_HEADERS)
 
 @app.route('/clear_result', methods=['POST'])
 def clear_result():
-    global latest_result
-    latest_result = None
+    session = current_session()
+    session.set_result(None)
     try:
-        translator._reset_stream_state()
+        session.translator._reset_stream_state()
     except Exception:
         pass
     return jsonify({'status': 'cleared'})
@@ -90,110 +119,185 @@ def clear_result():
 
 @app.route('/begin_manual_recording', methods=['POST'])
 def begin_manual_recording():
-    global latest_result
-    ok = translator.start_manual_recording()
+    session = current_session()
+    ok = session.translator.start_manual_recording()
     if ok:
-        latest_result = {'original_text': '正在录音...', 'translation': '等待结束', 'status_hint': '🎤 正在录音，点击结束'}
+        session.set_result(handlers.MANUAL_RECORDING)
         return jsonify({'status': 'recording_started'})
     return jsonify({'error': '无法开始录音'}), 500
 
 @app.route('/end_manual_recording', methods=['POST'])
 def end_manual_recording():
-    global latest_result, is_processing
-    is_processing = True
+    session = current_session()
+    translator = session.translator
+    with session.lock:
+        session.is_processing = True
+    alive = translator._generation_alive()
     try:
         text = translator.stop_manual_recording()
         if not text:
-            latest_result = {'original_text': '识别失败', 'translation': '请重试'}
-            is_processing = False
-            return jsonify({'status': 'completed', 'result': latest_result})
-        latest_result = {'original_text': text, 'translation': '分析中...', 'status_hint': '🧠 已识别，正在分析...'}
+            session.set_result(handlers.MANUAL_RECOGNITION_FAILED)
+            session.end_processing()
+            return jsonify({'status': 'completed', 'result': session.latest_result})
+        session.set_result(handlers.recognized(text))
         def _analyze_async(t):
-            global latest_result, is_processing
             try:
-                translation = translator.translate_politeness(t)
-                latest_result = {'original_text': t, 'translation': translation}
+                translation = translator.translate_politeness(t, on_delta=handlers.partial_sink(session.set_result, t),
+                                                              alive=alive)
+                session.set_result(handlers.analyzed(t, translation))
+            except Superseded:
+                print("🗑️ 会话已重置，丢弃分析结果")
             except Exception as e:
-                latest_result = {'original_text': t, 'translation': f'分析失败: {str(e)}'}
+                session.set_result(handlers.analysis_failed(t, e))
             finally:
-                is_processing = False
+                session.end_processing()
         threading.Thread(target=_analyze_async, args=(text,), daemon=True).start()
-        return jsonify({'status': 'recognized', 'result': latest_result})
+        return jsonify({'status': 'recognized', 'result': session.latest_result})
     except Exception as e:
-        is_processing = False
+        session.end_processing()
         return jsonify({'error': str(e)}), 500
 
+@app.route('/ingest_audio', methods=['POST'])
+def ingest_audio():
+    """接收浏览器上传的 PCM 音频帧（支持分块传输的长连接 POST）；每个会话同一时间只接受一路上传"""
+    session = current_session()
+    source = session.translator.audio_source
+    if source is None:
+        return jsonify({'error': '当前服务未启用浏览器音频上传（AUDIO_INPUT=browser）'}), 400
+    rate, channels, sample_format = handlers.audio_format(request.headers)
+    if not source.try_begin_ingest():
+        return jsonify(handlers.INGEST_BUSY), 409
+    received = 0
+    try:
+        while True:
+            chunk = request.stream.read(16384)
+            if not chunk:
+                break
+            received += source.feed(chunk, rate, channels, sample_format)
+            session.touch()
+    finally:
+        source.end_ingest()
+    return jsonify({'status': 'ok', 'samples': received})
+
 @app.route('/start_streaming', methods=['POST'])
 def start_streaming():
-    ok = translator.start_streaming()
+    ok = current_session().translator.start_streaming()
     if ok:
         return jsonify({'status': 'streaming_started'})
     return jsonify({'status': 'error'}), 500
 
 @app.route('/stop_streaming', methods=['POST'])
 def stop_streaming():
-    translator.stop_streaming()
+    current_session().translator.stop_streaming()
     return jsonify({'status': 'streaming_stopped'})
 
+@app.route('/transcript', methods=['GET'])
+def transcript():
+    """分页读取当前会话的转写记录：after 传上一页返回的 next，limit 为每页条数，kind 按类型过滤"""
+    session = current_session()
+    after, limit, kinds = handlers.transcript_query(request.args)
+    return jsonify(handlers.transcript_page(session.sid, after, limit, kinds))
+
+@app.route('/transcript/export', methods=['GET'])
+def export_transcript():
+    """导出当前会话的全部转写记录（jsonl 或 txt），逐页读取、边读边发送"""
+    session = current_session()
+    fmt, kinds = handlers.export_query(request.args)
+
+    def generate():
+        for item in transcript_store.iter_all(session.sid, kinds):
+            yield format_entry(item, fmt)
+
+    content_type, headers = handlers.export_headers(session.sid, fmt)
+    return Response(generate(), content_type=content_type, headers=headers)
+
+
+def _event_stream(session, types=None, to_payload=None, follow_streaming=False):
+    stream = handlers.EventStream(session, handlers.last_event_id(request.headers, request.args),
+                                  types, to_payload, follow_streaming)
+    channel = stream.channel
+    def generate():
+        yield stream.start()
+        while not stream.finished():
+            yield from stream.frames(channel.wait(stream.last_id, timeout=stream.poll, types=stream.types))
+    return Response(generate(), mimetype='text/event-stream', headers=handlers.SSE_HEADERS)
+
+@app.route('/events')
+def events():
+    """统一事件流：segment / analysis / summary / status，支持 Last-Event-ID 断线补发"""
+    return _event_stream(current_session())
+
 @app.route('/stream_transcription')
 def stream_transcription():
-    def generate():
-        while True:
-            if not translator._streaming:
-                break
-            try:
-                seg = translator.stream_queue.get(timeout=1)
-                yield f"data: {seg}\n\n"
-            except Exception:
-                yield f"data: \n\n"
-    resp = Response(generate(), mimetype='text/event-stream')
-    resp.headers['Cache-Control'] = 'no-cache'
-    resp.headers['X-Accel-Buffering'] = 'no'
-    return resp
+    return _event_stream(current_session(), *handlers.LEGACY_STREAMS['segment'], follow_streaming=True)
 
 @app.route('/stream_analysis')
 def stream_analysis():
-    def generate():
-        while True:
-            if not translator._streaming:
-                break
-            try:
-                seg = translator.analysis_queue.get(timeout=1)
-                payload = json.dumps({'analysis': seg})
-                yield f"data: {payload}\n\n"
-            except Exception:
-                yield f"data: \n\n"
-    resp = Response(generate(), mimetype='text/event-stream')
-    resp.headers['Cache-Control'] = 'no-cache'
-    resp.headers['X-Accel-Buffering'] = 'no'
-    return resp
+    return _event_stream(current_session(), *handlers.LEGACY_STREAMS['analysis'], follow_streaming=True)
 
 @app.route('/stream_summary')
 def stream_summary():
-    def generate():
-        while True:
-            if not translator._streaming:
-                break
-            try:
-                seg = translator.summary_queue.get(timeout=1)
-                payload = json.dumps({'summary': seg})
-                yield f"data: {payload}\n\n"
-            except Exception:
-                yield f"data: \n\n"
-    resp = Response(generate(), mimetype='text/event-stream')
-    resp.headers['Cache-Control'] = 'no-cache'
-    resp.headers['X-Accel-Buffering'] = 'no'
-    return resp
+    return _event_stream(current_session(), *handlers.LEGACY_STREAMS['summary'], follow_streaming=True)
+
+@app.route('/admin/cache', methods=['GET'])
+def cache_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(llm_cache.snapshot())
+
+@app.route('/admin/cache/flush', methods=['POST'])
+def flush_cache():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    llm_cache.flush()
+    return jsonify({'status': 'flushed', 'stats': llm_cache.snapshot()})
+
+@app.route('/admin/workers', methods=['GET'])
+def worker_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(handlers.worker_stats(sessions))
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/admin/asr', methods=['GET'])
+def asr_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(asr.snapshot())
+
+@app.route('/admin/llm', methods=['GET'])
+def llm_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(llm_router.snapshot())
+
+@app.route('/admin/phrasebook', methods=['GET'])
+def phrasebook_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(phrasebook.snapshot())
+
+@app.route('/admin/phrasebook/reload', methods=['POST'])
+def reload_phrasebook():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    ok = phrasebook.reload()
+    return jsonify({'status': 'reloaded' if ok else 'failed', 'stats': phrasebook.snapshot()}), (200 if ok else 400)
 
 @app.route('/reset_session', methods=['POST'])
 def reset_session():
+    session = current_session()
     try:
-        translator.stop_streaming()
-        translator._reset_stream_state()
+        session.translator.stop_streaming()
+        session.translator._reset_stream_state()
     except Exception:
         pass
-    global latest_result
-    latest_result = None
+    session.set_result(None)
     return jsonify({'status': 'reset'})
 
 if __name__ == '__main__':
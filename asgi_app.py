@@ -0,0 +1,367 @@
+"""ASGI / asyncio 服务模式
+
+与 app.py 提供相同的接口，请求解析与响应内容共用 handlers.py；SSE 连接与按键触发的大模型调用在事件循环上
+以协程运行，空闲的订阅连接不再各占一个线程。语音识别、转写记录与（共享后端下的）会话状态读写会阻塞，
+一律放到线程中执行；分句分析与 Flask 模式一样经过每个会话的 MicroBatcher 合并后交给分析线程池。
+
+运行方式（quart 与 uvicorn 已列入 requirements.txt）：
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8080
+"""
+import asyncio
+import os
+
+from quart import Quart, render_template, jsonify, request, Response, g
+
+ASYNC_LLM_CONCURRENCY = int(os.getenv('ASYNC_LLM_CONCURRENCY', '200'))
+# 协程模式下大模型调用不占线程，优先级调度的总名额与之对齐（须在导入 translator 之前设置）
+os.environ.setdefault('LLM_SLOTS', str(ASYNC_LLM_CONCURRENCY))
+
+from sessions import SessionRegistry, SessionLimitError, SESSION_COOKIE
+from translator import llm_cache, asr, llm_router, phrasebook, transcript_store
+from workers import KeyedSerialExecutor, Superseded
+from transcripts import PAGE_LIMIT, format_entry
+from metrics import REGISTRY, CONTENT_TYPE
+import handlers
+from handlers import BadRequest
+
+app = Quart(__name__)
+sessions = SessionRegistry()
+handlers.install_metrics(sessions)
+
+# 结果写入（共享后端下是一次 SQLite 事务）在线程中执行，同一会话的写入按提交顺序串行：
+# 生成中的局部结果与识别进度不必等待写完，也不会晚于随后写入的最终结果；不同会话的写入互不等待
+_state_writer = KeyedSerialExecutor(max_workers=int(os.getenv('STATE_WRITERS', '4')), name='state-write')
+
+
+async def _write(session, fn, *args):
+    return await asyncio.wrap_future(_state_writer.submit(session.sid, fn, *args))
+
+
+def _write_later(session, fn):
+    return lambda *args: _state_writer.submit(session.sid, fn, *args)
+
+
+async def current_session():
+    """获取（必要时创建）当前请求对应的会话"""
+    session = getattr(g, 'session', None)
+    if session is None:
+        sid = handlers.requested_sid(request.headers, request.args, request.cookies)
+        session = await asyncio.to_thread(sessions.get_or_create, sid)
+        g.session = session
+    return session
+
+
+@app.errorhandler(SessionLimitError)
+async def session_limit(e):
+    return jsonify({'error': str(e)}), 503
+
+
+@app.errorhandler(BadRequest)
+async def bad_request(e):
+    return jsonify(e.body()), e.status
+
+
+@app.after_request
+async def remember_session(resp):
+    session = getattr(g, 'session', None)
+    if handlers.needs_cookie(session, request.cookies):
+        resp.set_cookie(SESSION_COOKIE, session.sid, httponly=True, samesite='Lax')
+    return resp
+
+
+def _sse(generator):
+    resp = Response(generator, mimetype='text/event-stream', headers=handlers.SSE_HEADERS)
+    resp.timeout = None
+    return resp
+
+
+@app.route('/favicon.ico')
+async def favicon():
+    return '', 204
+
+
+@app.route('/')
+async def index():
+    return await render_template('index.html', audio_input=sessions.audio_input)
+
+
+@app.route('/start_recording', methods=['POST'])
+async def start_recording():
+    session = await current_session()
+    translator = session.translator
+
+    if not await _write(session, session.try_begin_processing):
+        return jsonify({'error': '正在处理中，请稍候'})
+
+    alive = translator._generation_alive()
+
+    async def process_audio_async():
+        try:
+            await _write(session, session.set_result, handlers.MIC_STARTING)
+            text = await asyncio.to_thread(translator.speech_to_text_with_progress,
+                                          _write_later(session, handlers.progress_sink(session)))
+            if not text:
+                await _write(session, session.set_result, handlers.RECOGNITION_FAILED)
+            else:
+                await _write(session, session.set_result, handlers.recognized(text))
+                translation = await translator.translate_politeness_async(
+                    text, on_delta=handlers.partial_sink(_write_later(session, session.set_result), text), alive=alive)
+                await _write(session, session.set_result, handlers.analyzed(text, translation))
+        except Superseded:
+            print("🗑️ 会话已重置，丢弃分析结果")
+        except Exception as e:
+            await _write(session, session.set_result, handlers.processing_failed(e))
+        finally:
+            await _write(session, session.end_processing)
+
+    app.add_background_task(process_audio_async)
+    return jsonify({'status': '开始录音处理'})
+
+
+@app.route('/get_result', methods=['GET'])
+async def get_result():
+    """返回当前结果；带 since（或 If-None-Match）时若没有更新最多等待 wait 秒，仍无变化返回 304"""
+    session = await current_session()
+    known, wait = handlers.result_wait(session, request.args, request.headers)
+    if known is not None and wait > 0:
+        state = await session.wait_result_async(known, wait)
+    else:
+        state = await asyncio.to_thread(session.result_state)
+    body, headers = handlers.result_reply(session, known, state)
+    resp = Response('', status=304) if body is None else jsonify(body)
+    resp.headers.update(headers)
+    return resp
+
+
+@app.route('/stream_result')
+async def stream_result():
+    session = await current_session()
+    stream = handlers.ResultStream()
+    async def generate():
+        while not stream.done:
+            session.touch()
+            yield stream.frame(await session.wait_result_async(stream.version, timeout=15))
+    return _sse(generate())
+
+
+@app.route('/clear_result', methods=['POST'])
+async def clear_result():
+    session = await current_session()
+    await _write(session, session.set_result, None)
+    try:
+        await asyncio.to_thread(session.translator._reset_stream_state)
+    except Exception:
+        pass
+    return jsonify({'status': 'cleared'})
+
+
+@app.route('/begin_manual_recording', methods=['POST'])
+async def begin_manual_recording():
+    session = await current_session()
+    ok = await asyncio.to_thread(session.translator.start_manual_recording)
+    if ok:
+        await _write(session, session.set_result, handlers.MANUAL_RECORDING)
+        return jsonify({'status': 'recording_started'})
+    return jsonify({'error': '无法开始录音'}), 500
+
+
+@app.route('/end_manual_recording', methods=['POST'])
+async def end_manual_recording():
+    session = await current_session()
+    translator = session.translator
+    def _claim():
+        with session.lock:
+            session.is_processing = True
+    await _write(session, _claim)
+    alive = translator._generation_alive()
+    try:
+        text = await asyncio.to_thread(translator.stop_manual_recording)
+        if not text:
+            await _write(session, session.set_result, handlers.MANUAL_RECOGNITION_FAILED)
+            await _write(session, session.end_processing)
+            return jsonify({'status': 'completed', 'result': handlers.MANUAL_RECOGNITION_FAILED})
+        await _write(session, session.set_result, handlers.recognized(text))
+        async def _analyze_async():
+            try:
+                # 按键触发的分析由优先级调度保证不排在分句分析之后
+                translation = await translator.translate_politeness_async(
+                    text, on_delta=handlers.partial_sink(_write_later(session, session.set_result), text), alive=alive)
+                await _write(session, session.set_result, handlers.analyzed(text, translation))
+            except Superseded:
+                print("🗑️ 会话已重置，丢弃分析结果")
+            except Exception as e:
+                await _write(session, session.set_result, handlers.analysis_failed(text, e))
+            finally:
+                await _write(session, session.end_processing)
+        app.add_background_task(_analyze_async)
+        return jsonify({'status': 'recognized', 'result': handlers.recognized(text)})
+    except Exception as e:
+        await _write(session, session.end_processing)
+        return jsonify({'error': str(e)}), 500
+
+
+@app.route('/ingest_audio', methods=['POST'])
+async def ingest_audio():
+    session = await current_session()
+    source = session.translator.audio_source
+    if source is None:
+        return jsonify({'error': '当前服务未启用浏览器音频上传（AUDIO_INPUT=browser）'}), 400
+    rate, channels, sample_format = handlers.audio_format(request.headers)
+    if not source.try_begin_ingest():
+        return jsonify(handlers.INGEST_BUSY), 409
+    received = 0
+    try:
+        async for chunk in request.body:
+            received += source.feed(chunk, rate, channels, sample_format)
+            session.touch()
+    finally:
+        source.end_ingest()
+    return jsonify({'status': 'ok', 'samples': received})
+
+
+@app.route('/start_streaming', methods=['POST'])
+async def start_streaming():
+    session = await current_session()
+    ok = await asyncio.to_thread(session.translator.start_streaming)
+    if ok:
+        return jsonify({'status': 'streaming_started'})
+    return jsonify({'status': 'error'}), 500
+
+
+@app.route('/stop_streaming', methods=['POST'])
+async def stop_streaming():
+    session = await current_session()
+    await asyncio.to_thread(session.translator.stop_streaming)
+    return jsonify({'status': 'streaming_stopped'})
+
+
+@app.route('/transcript', methods=['GET'])
+async def transcript():
+    """分页读取当前会话的转写记录：after 传上一页返回的 next，limit 为每页条数，kind 按类型过滤"""
+    session = await current_session()
+    after, limit, kinds = handlers.transcript_query(request.args)
+    return jsonify(await asyncio.to_thread(handlers.transcript_page, session.sid, after, limit, kinds))
+
+
+@app.route('/transcript/export', methods=['GET'])
+async def export_transcript():
+    """导出当前会话的全部转写记录（jsonl 或 txt），逐页读取、边读边发送"""
+    session = await current_session()
+    fmt, kinds = handlers.export_query(request.args)
+
+    async def generate():
+        after = 0
+        while after is not None:
+            # 数据库读取放到线程中，不阻塞事件循环
+            items, after = await asyncio.to_thread(transcript_store.page, session.sid, after, PAGE_LIMIT, kinds)
+            for item in items:
+                yield format_entry(item, fmt).encode('utf-8')
+
+    content_type, headers = handlers.export_headers(session.sid, fmt)
+    return Response(generate(), content_type=content_type, headers=headers)
+
+
+def _event_stream(session, types=None, to_payload=None, follow_streaming=False):
+    stream = handlers.EventStream(session, handlers.last_event_id(request.headers, request.args),
+                                  types, to_payload, follow_streaming)
+    channel = stream.channel
+    async def generate():
+        yield stream.start()
+        while not (await asyncio.to_thread(stream.finished) if stream.blocking else stream.finished()):
+            events = await channel.wait_async(stream.last_id, timeout=stream.poll, types=stream.types)
+            for frame in stream.frames(events):
+                yield frame
+    return _sse(generate())
+
+
+@app.route('/events')
+async def events():
+    return _event_stream(await current_session())
+
+
+@app.route('/stream_transcription')
+async def stream_transcription():
+    return _event_stream(await current_session(), *handlers.LEGACY_STREAMS['segment'], follow_streaming=True)
+
+
+@app.route('/stream_analysis')
+async def stream_analysis():
+    return _event_stream(await current_session(), *handlers.LEGACY_STREAMS['analysis'], follow_streaming=True)
+
+
+@app.route('/stream_summary')
+async def stream_summary():
+    return _event_stream(await current_session(), *handlers.LEGACY_STREAMS['summary'], follow_streaming=True)
+
+
+@app.route('/admin/cache', methods=['GET'])
+async def cache_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(await asyncio.to_thread(llm_cache.snapshot))
+
+
+@app.route('/admin/cache/flush', methods=['POST'])
+async def flush_cache():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    await asyncio.to_thread(llm_cache.flush)
+    return jsonify({'status': 'flushed', 'stats': await asyncio.to_thread(llm_cache.snapshot)})
+
+
+@app.route('/admin/workers', methods=['GET'])
+async def worker_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(handlers.worker_stats(sessions))
+
+
+@app.route('/metrics', methods=['GET'])
+async def metrics():
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
+
+
+@app.route('/admin/asr', methods=['GET'])
+async def asr_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(asr.snapshot())
+
+
+@app.route('/admin/llm', methods=['GET'])
+async def llm_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(llm_router.snapshot())
+
+
+@app.route('/admin/phrasebook', methods=['GET'])
+async def phrasebook_stats():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    return jsonify(phrasebook.snapshot())
+
+
+@app.route('/admin/phrasebook/reload', methods=['POST'])
+async def reload_phrasebook():
+    if not handlers.admin_allowed(request.headers):
+        return jsonify(handlers.FORBIDDEN), 403
+    ok = await asyncio.to_thread(phrasebook.reload)
+    return jsonify({'status': 'reloaded' if ok else 'failed', 'stats': phrasebook.snapshot()}), (200 if ok else 400)
+
+
+@app.route('/reset_session', methods=['POST'])
+async def reset_session():
+    session = await current_session()
+    try:
+        await asyncio.to_thread(session.translator.stop_streaming)
+        await asyncio.to_thread(session.translator._reset_stream_state)
+    except Exception:
+        pass
+    await _write(session, session.set_result, None)
+    return jsonify({'status': 'reset'})
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=8080)
@@ -0,0 +1,399 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import speech_recognition as sr
+
+from metrics import ASR_SECONDS, STAGE_SECONDS
+
+ASR_MODES = ('hedged', 'sequential')
+
+
+class RecognizerBackend:
+    """语音识别后端接口：recognize 返回 (文本, 置信度)，听不清时返回 (None, None)，服务出错时抛出异常
+
+    last_resort 为 True 的后端只在其他后端都没有结果时才调用，也不参与自适应排序。
+    """
+
+    name = 'base'
+    last_resort = False
+
+    def recognize(self, audio):
+        raise NotImplementedError
+
+
+class GoogleBackend(RecognizerBackend):
+    name = 'google'
+
+    def __init__(self, language='zh-CN'):
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio):
+        try:
+            result = self.recognizer.recognize_google(audio, language=self.language, show_all=True)
+        except sr.UnknownValueError:
+            return None, None
+        if isinstance(result, dict) and result.get('alternative'):
+            best = result['alternative'][0]
+            return (best.get('transcript') or '').strip() or None, best.get('confidence')
+        if isinstance(result, str):
+            return result.strip() or None, None
+        return None, None
+
+
+class SphinxBackend(RecognizerBackend):
+    # 本地识别很快但中文准确率低，也不给置信度：放在最后兜底，不能因为先返回就胜出
+    name = 'sphinx'
+    last_resort = True
+
+    def __init__(self, language='zh-CN'):
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio):
+        try:
+            text = self.recognizer.recognize_sphinx(audio, language=self.language)
+        except sr.UnknownValueError:
+            return None, None
+        return (text or '').strip() or None, None
+
+
+class ParaformerBackend(RecognizerBackend):
+    """Paraformer 实时识别：把内存中的 PCM 分帧推给流式接口，不再写临时 WAV 文件
+
+    Recognition 对象用完放回空闲池，下次识别直接复用（池的大小等于实际出现过的最大并发）。
+    """
+
+    name = 'paraformer'
+    FRAME_BYTES = 3200  # 16kHz 16 位单声道 100ms
+
+    def __init__(self, load_dashscope, model='paraformer-realtime-v2'):
+        self._load_dashscope = load_dashscope
+        self.model = model
+        self._callback_cls = None
+        self._idle = queue.SimpleQueue()
+
+    def _collector(self):
+        if self._callback_cls is None:
+            asr = self._load_dashscope().audio.asr
+
+            class _SentenceCollector(asr.RecognitionCallback):
+                def __init__(cb):
+                    cb.reset()
+
+                def reset(cb):
+                    cb.sentences = []
+                    cb.error = None
+
+                def on_event(cb, result):
+                    sentence = result.get_sentence()
+                    if isinstance(sentence, dict) and sentence.get('text') and asr.RecognitionResult.is_sentence_end(sentence):
+                        cb.sentences.append(sentence['text'])
+
+                def on_error(cb, result):
+                    cb.error = getattr(result, 'message', None) or str(result)
+
+            self._callback_cls = _SentenceCollector
+        return self._callback_cls()
+
+    def _acquire(self):
+        try:
+            recognition, callback = self._idle.get_nowait()
+        except queue.Empty:
+            callback = self._collector()
+            recognition = self._load_dashscope().audio.asr.Recognition(model=self.model, format='pcm', sample_rate=16000, language_hints=['zh'], callback=callback)
+        callback.reset()
+        return recognition, callback
+
+    def recognize(self, audio):
+        # 采样率与位宽一致时 get_raw_data 直接返回原缓冲区，不产生拷贝
+        pcm = memoryview(audio.get_raw_data(convert_rate=16000, convert_width=2))
+        recognition, callback = self._acquire()
+        recognition.start()
+        try:
+            for offset in range(0, len(pcm), self.FRAME_BYTES):
+                recognition.send_audio_frame(bytes(pcm[offset:offset + self.FRAME_BYTES]))
+        finally:
+            recognition.stop()
+            self._idle.put((recognition, callback))
+        if callback.error:
+            raise RuntimeError(f'Paraformer 识别失败: {callback.error}')
+        return "".join(callback.sentences).strip() or None, None
+
+
+class ParaformerStream:
+    """Paraformer 实时识别会话：持续推送 16kHz 音频帧，中间结果与整句结果分别回调"""
+
+    def __init__(self, load_dashscope, on_interim, on_final, model='paraformer-realtime-v2'):
+        self._load_dashscope = load_dashscope
+        self._on_interim = on_interim
+        self._on_final = on_final
+        self.model = model
+        self.error = None
+        self._recognition = None
+        self._running = False
+
+    @property
+    def failed(self):
+        return self.error is not None
+
+    def start(self):
+        asr = self._load_dashscope().audio.asr
+        owner = self
+
+        class _Callback(asr.RecognitionCallback):
+            def on_event(cb, result):
+                sentence = result.get_sentence()
+                if not isinstance(sentence, dict) or not sentence.get('text'):
+                    return
+                if asr.RecognitionResult.is_sentence_end(sentence):
+                    owner._on_final(sentence['text'])
+                else:
+                    owner._on_interim(sentence['text'])
+
+            def on_error(cb, result):
+                owner.error = getattr(result, 'message', None) or str(result)
+
+        self.error = None
+        # 重连时复用同一个 Recognition 对象
+        if self._recognition is None:
+            self._recognition = asr.Recognition(model=self.model, format='pcm', sample_rate=16000, language_hints=['zh'], callback=_Callback())
+        self._recognition.start()
+        self._running = True
+
+    def send(self, pcm):
+        try:
+            self._recognition.send_audio_frame(pcm)
+        except Exception as e:
+            # 会话已被服务端关闭（超时或出错），交给调用方重连
+            self.error = self.error or str(e)
+
+    def stop(self):
+        if not self._running:
+            return
+        self._running = False
+        try:
+            self._recognition.stop()
+        except Exception:
+            pass
+
+
+class BackendStats:
+    """单个后端的调用统计：成功率、获胜次数与最近若干次的耗时"""
+
+    def __init__(self, window=100):
+        self.calls = 0
+        self.recognized = 0
+        self.failures = 0
+        self.wins = 0
+        self.latencies = deque(maxlen=window)
+
+    def record(self, elapsed, text, failed):
+        self.calls += 1
+        self.latencies.append(elapsed)
+        if failed:
+            self.failures += 1
+        elif text:
+            self.recognized += 1
+
+    def p50(self):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[len(ordered) // 2]
+
+    def expected_cost(self, prior_latency):
+        # 期望耗时 = 中位耗时 / 识别成功率，越小越应排在前面；没有样本时用先验耗时，不会凭空排到最前
+        rate = (self.recognized + 1) / (self.calls + 2)
+        p50 = self.p50()
+        return (p50 if p50 is not None else prior_latency) / rate
+
+    def snapshot(self):
+        p50 = self.p50()
+        return {
+            'calls': self.calls,
+            'recognized': self.recognized,
+            'failures': self.failures,
+            'wins': self.wins,
+            'win_rate': round(self.wins / self.calls, 4) if self.calls else 0.0,
+            'p50_latency': round(p50, 4) if p50 is not None else None,
+        }
+
+
+class HedgedRecognizer:
+    """多个识别后端的对冲调用：
+
+    - sequential：按顺序逐个尝试，与原先 Google → Sphinx → Paraformer 的链路一致
+    - hedged：先启动排在最前的后端，hedge_delay 秒内没有结果（或它已失败）就启动下一个；
+      hedge_delay 为 0 时同时启动全部后端。置信度达标的结果立即返回，其余不再等待；
+      不带置信度的结果只有在排名更靠前的后端都已结束时才采用
+    - last_resort 后端（Sphinx）不参与对冲，其他后端都结束且没有结果时才调用
+
+    每个后端的成功率与耗时会被记录下来，样本足够后按期望耗时重新排序（last_resort 后端始终在最后）。
+    """
+
+    def __init__(self, backends, mode='hedged', hedge_delay=0.5, timeout=15.0, min_confidence=0.0,
+                 adapt_after=10, max_workers=8):
+        if mode not in ASR_MODES:
+            raise ValueError(f'未知的识别模式: {mode}')
+        self.backends = list(backends)
+        self.mode = mode
+        self.hedge_delay = hedge_delay
+        self.timeout = timeout
+        self.min_confidence = min_confidence
+        self.adapt_after = adapt_after
+        self.max_workers = max_workers
+        self._stats = {b.name: BackendStats() for b in self.backends}
+        self._lock = threading.Lock()
+        self._pool = None
+
+    @classmethod
+    def from_env(cls, load_dashscope):
+        available = {
+            'google': GoogleBackend,
+            'sphinx': SphinxBackend,
+            'paraformer': lambda: ParaformerBackend(load_dashscope),
+        }
+        names = [n.strip() for n in os.getenv('ASR_BACKENDS', 'google,sphinx,paraformer').split(',') if n.strip()]
+        unknown = [n for n in names if n not in available]
+        if unknown:
+            raise ValueError(f'未知的识别后端: {", ".join(unknown)}')
+        return cls(
+            [available[n]() for n in names],
+            mode=os.getenv('ASR_MODE', 'hedged'),
+            hedge_delay=float(os.getenv('ASR_HEDGE_DELAY', '0.5')),
+            timeout=float(os.getenv('ASR_TIMEOUT', '15')),
+            min_confidence=float(os.getenv('ASR_MIN_CONFIDENCE', '0')),
+            adapt_after=int(os.getenv('ASR_ADAPT_AFTER', '10')),
+            max_workers=int(os.getenv('ASR_WORKERS', '8')),
+        )
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='asr')
+            return self._pool
+
+    def ordered(self):
+        """当前的尝试顺序；每个后端都积累了足够样本后才按期望耗时排序，last_resort 后端排在最后"""
+        primary = [b for b in self.backends if not b.last_resort]
+        last = [b for b in self.backends if b.last_resort]
+        with self._lock:
+            if any(self._stats[b.name].calls < self.adapt_after for b in primary):
+                return primary + last
+            prior = self.timeout / 2
+            return sorted(primary, key=lambda b: self._stats[b.name].expected_cost(prior)) + last
+
+    def _run(self, backend, audio):
+        start = time.monotonic()
+        failed = False
+        try:
+            text, confidence = backend.recognize(audio)
+        except Exception as e:
+            print(f"⚠️ 识别后端 {backend.name} 出错: {e}")
+            text, confidence, failed = None, None, True
+        elapsed = time.monotonic() - start
+        with self._lock:
+            self._stats[backend.name].record(elapsed, text, failed)
+        ASR_SECONDS.observe(elapsed, backend=backend.name, outcome='error' if failed else ('ok' if text else 'empty'))
+        return backend.name, text, confidence
+
+    def _confident(self, confidence):
+        return confidence is not None and confidence >= self.min_confidence
+
+    def _win(self, name):
+        with self._lock:
+            self._stats[name].wins += 1
+
+    def recognize(self, audio):
+        """返回 (文本, 后端名)；全部后端都未识别时返回 (None, None)"""
+        with STAGE_SECONDS.time(stage='asr'):
+            if self.mode == 'sequential':
+                return self._recognize_sequential(audio)
+            return self._recognize_hedged(audio)
+
+    def _recognize_sequential(self, audio):
+        fallback = None
+        for backend in self.ordered():
+            name, text, confidence = self._run(backend, audio)
+            # 逐个尝试时不存在排名更靠前、仍在进行的后端，不带置信度的结果可直接采用
+            if text and (confidence is None or self._confident(confidence)):
+                self._win(name)
+                return text, name
+            if text and fallback is None:
+                fallback = (text, name)
+        if fallback:
+            self._win(fallback[1])
+            return fallback
+        return None, None
+
+    def _recognize_hedged(self, audio):
+        pool = self._executor()
+        order = self.ordered()
+        waiting = [b for b in order if not b.last_resort]
+        last_resort = [b for b in order if b.last_resort]
+        running = {}
+        unscored = {}
+        fallback = None
+        deadline = time.monotonic() + self.timeout
+        next_launch = time.monotonic()
+        try:
+            while waiting or running or last_resort:
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                if not waiting and not running:
+                    if unscored or fallback:
+                        break
+                    # 其他后端都没有任何文本，才轮到兜底后端
+                    waiting.append(last_resort.pop(0))
+                # 到点或手上已没有在跑的后端时，启动下一个
+                while waiting and (now >= next_launch or not running):
+                    backend = waiting.pop(0)
+                    running[pool.submit(self._run, backend, audio)] = order.index(backend)
+                    next_launch = now + self.hedge_delay
+                wake = deadline if not waiting else min(deadline, next_launch)
+                done, _ = wait(list(running), timeout=max(wake - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    rank = running.pop(fut)
+                    name, text, confidence = fut.result()
+                    if text and self._confident(confidence):
+                        self._win(name)
+                        return text, name
+                    if text and confidence is None:
+                        unscored[rank] = (text, name)
+                    elif text and fallback is None:
+                        fallback = (text, name)
+                # 不带置信度的结果：排名更靠前的后端都结束了才采用
+                if unscored:
+                    best = min(unscored)
+                    if all(rank > best for rank in running.values()):
+                        text, name = unscored[best]
+                        self._win(name)
+                        return text, name
+        finally:
+            # 还没开始执行的任务直接取消；已在执行的请求无法中断，结果会被忽略
+            for fut in running:
+                fut.cancel()
+        if unscored:
+            fallback = unscored[min(unscored)]
+        if fallback:
+            self._win(fallback[1])
+            return fallback
+        return None, None
+
+    def snapshot(self):
+        order = [b.name for b in self.ordered()]
+        with self._lock:
+            backends = {name: stats.snapshot() for name, stats in self._stats.items()}
+        return {
+            'mode': self.mode,
+            'hedge_delay': self.hedge_delay,
+            'min_confidence': self.min_confidence,
+            'order': order,
+            'backends': backends,
+        }
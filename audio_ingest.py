@@ -0,0 +1,252 @@
+import threading
+
+import numpy as np
+import speech_recognition as sr
+
+from vad import NoiseFloor
+
+TARGET_RATE = 16000
+SAMPLE_WIDTH = 2
+SAMPLE_FORMATS = ('s16le', 'f32le')
+
+
+def decode_pcm(raw, sample_format='s16le', channels=1):
+    """把浏览器上传的 PCM 字节解码为单声道 float32 数组（取值范围 -1~1）"""
+    if sample_format == 's16le':
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768.0
+    elif sample_format == 'f32le':
+        samples = np.frombuffer(raw, dtype='<f4').astype(np.float32)
+    else:
+        raise ValueError(f'不支持的采样格式: {sample_format}')
+    if channels > 1:
+        usable = len(samples) - len(samples) % channels
+        samples = samples[:usable].reshape(-1, channels).mean(axis=1)
+    return samples
+
+
+def to_int16_bytes(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767.0).astype('<i2').tobytes()
+
+
+class PcmBuffer:
+    """预分配、按需倍增的录音缓冲区：采集时原地写入，结束时把底层 bytearray 直接交给 sr.AudioData
+
+    相比逐块 append 再 b''.join，整段录音只占一份内存，也不再经过 WAV 编码与解析。
+    """
+
+    def __init__(self, sample_rate=TARGET_RATE, sample_width=SAMPLE_WIDTH, prealloc_seconds=30):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self._initial = int(sample_rate * sample_width * prealloc_seconds)
+        self._buf = None
+        self._len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._len
+
+    def write(self, data):
+        n = len(data)
+        with self._lock:
+            if self._buf is None:
+                self._buf = bytearray(max(self._initial, n))
+            end = self._len + n
+            if end > len(self._buf):
+                self._buf.extend(bytes(max(len(self._buf), end - len(self._buf))))
+            self._buf[self._len:end] = data
+            self._len = end
+
+    def slice(self, start, end=None):
+        """复制出 [start, end) 字节区间，用于边录边识别时截取已完成的片段"""
+        with self._lock:
+            end = self._len if end is None else min(end, self._len)
+            if self._buf is None or start >= end:
+                return b''
+            return bytes(memoryview(self._buf)[start:end])
+
+    def detach(self):
+        """取出全部录音（不复制），缓冲区随之清空"""
+        with self._lock:
+            buf = self._buf if self._buf is not None else bytearray()
+            del buf[self._len:]
+            self._buf = None
+            self._len = 0
+        return buf
+
+    def to_audio_data(self):
+        return sr.AudioData(self.detach(), self.sample_rate, self.sample_width)
+
+    def clear(self):
+        with self._lock:
+            self._buf = None
+            self._len = 0
+
+
+class LinearResampler:
+    """带状态的向量化重采样器：分块输入时保持相位连续
+
+    降采样时先做滑动平均（盒式低通）抑制混叠，再做线性插值。
+    """
+
+    def __init__(self, src_rate, dst_rate=TARGET_RATE):
+        self.src_rate = int(src_rate)
+        self.dst_rate = int(dst_rate)
+        self.step = self.src_rate / self.dst_rate
+        self._width = max(1, int(round(self.step))) if self.step > 1 else 1
+        self._history = np.zeros(self._width - 1, dtype=np.float32)
+        self._tail = None
+        self._pos = 0.0
+
+    def _lowpass(self, x):
+        if self._width == 1:
+            return x
+        padded = np.concatenate((self._history, x))
+        self._history = padded[len(padded) - (self._width - 1):]
+        csum = np.cumsum(padded, dtype=np.float64)
+        csum = np.concatenate(([0.0], csum))
+        return ((csum[self._width:] - csum[:-self._width]) / self._width).astype(np.float32)
+
+    def process(self, samples):
+        if self.src_rate == self.dst_rate:
+            return samples
+        x = self._lowpass(samples)
+        if self._tail is not None:
+            x = np.concatenate(([self._tail], x))
+        n = len(x)
+        if n == 0:
+            return x
+        last = n - 1
+        if last < self._pos:
+            # 数据不足以产生下一个输出点，留待下一块
+            self._tail = x[-1]
+            self._pos -= last
+            return np.zeros(0, dtype=np.float32)
+        count = int((last - self._pos) // self.step) + 1
+        positions = self._pos + self.step * np.arange(count)
+        out = np.interp(positions, np.arange(n), x).astype(np.float32)
+        self._pos = self._pos + self.step * count - last
+        self._tail = x[-1]
+        return out
+
+
+class PushAudioStream:
+    """供 speech_recognition 读取的阻塞式缓冲区，接口与 PyAudio 的 Stream 对齐"""
+
+    def __init__(self, max_seconds=10.0, starve_timeout=1.0):
+        self._buf = bytearray()
+        self._cond = threading.Condition()
+        self._max_bytes = int(max_seconds * TARGET_RATE) * SAMPLE_WIDTH
+        self.starve_timeout = starve_timeout
+        self.dropped_bytes = 0
+        self._stopped = False
+
+    def write(self, pcm):
+        with self._cond:
+            self._buf.extend(pcm)
+            overflow = len(self._buf) - self._max_bytes
+            if overflow > 0:
+                # 没人读取时只保留最近的音频，避免内存无限增长
+                overflow += overflow % SAMPLE_WIDTH
+                del self._buf[:overflow]
+                self.dropped_bytes += overflow
+            self._cond.notify_all()
+
+    def read(self, frames, exception_on_overflow=False):
+        size = frames * SAMPLE_WIDTH
+        with self._cond:
+            if len(self._buf) < size and not self._stopped:
+                self._cond.wait_for(lambda: len(self._buf) >= size or self._stopped, timeout=self.starve_timeout)
+            data = bytes(self._buf[:size])
+            del self._buf[:size]
+            stopped = self._stopped
+        if len(data) < size and not stopped:
+            # 浏览器长时间未上传时补静音，保证识别器的超时与停止判断能继续推进
+            data += b'\x00' * (size - len(data))
+        return data
+
+    def clear(self):
+        with self._cond:
+            self._buf.clear()
+            self._stopped = False
+
+    def resume(self):
+        with self._cond:
+            self._stopped = False
+
+    def available(self):
+        with self._cond:
+            return len(self._buf) // SAMPLE_WIDTH
+
+    def stop_stream(self):
+        # 唤醒阻塞中的 read 并让它立即返回剩余数据，结束录音时不必等满 starve_timeout
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def close(self):
+        self.stop_stream()
+
+
+class PushAudioSource(sr.AudioSource):
+    """由浏览器推送音频的输入源，可替代 sr.Microphone 用于无声卡的服务器"""
+
+    def __init__(self, chunk_size=1024):
+        self.SAMPLE_RATE = TARGET_RATE
+        self.SAMPLE_WIDTH = SAMPLE_WIDTH
+        self.CHUNK = chunk_size
+        self.device_index = None
+        self.stream = None
+        self._stream = PushAudioStream()
+        self._resampler = None
+        self._carry = b''
+        # 同一时间只接受一路上传，两路交错写入会打乱重采样状态与缓冲区
+        self._ingest_lock = threading.Lock()
+        self._ingesting = False
+        # 持续跟踪上传音频的环境噪音，识别前不必再校准
+        self.noise = NoiseFloor(TARGET_RATE)
+
+    def __enter__(self):
+        self._stream.resume()
+        self.stream = self._stream
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+    def open_stream(self):
+        """开始一次新的采集：丢弃之前残留的音频"""
+        self._stream.clear()
+        return self._stream
+
+    def try_begin_ingest(self):
+        """开始一路上传；已有上传在进行时返回 False"""
+        with self._ingest_lock:
+            if self._ingesting:
+                return False
+            self._ingesting = True
+            # 新的上传是一段新的音频流，丢弃上一路残留的半帧与重采样相位
+            self._resampler = None
+            self._carry = b''
+            return True
+
+    def end_ingest(self):
+        with self._ingest_lock:
+            self._ingesting = False
+
+    def feed(self, raw, sample_rate, channels=1, sample_format='s16le'):
+        """接收一段浏览器上传的 PCM，重采样为 16kHz Int16 后写入缓冲区"""
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f'不支持的采样格式: {sample_format}')
+        if self._resampler is None or self._resampler.src_rate != int(sample_rate):
+            self._resampler = LinearResampler(sample_rate)
+        frame_bytes = (2 if sample_format == 's16le' else 4) * channels
+        raw = self._carry + raw
+        usable = len(raw) - len(raw) % frame_bytes
+        self._carry = raw[usable:]
+        if not usable:
+            return 0
+        samples = self._resampler.process(decode_pcm(raw[:usable], sample_format, channels))
+        pcm = to_int16_bytes(samples)
+        self.noise.update(pcm)
+        self._stream.write(pcm)
+        return len(samples)
@@ -0,0 +1,253 @@
+"""批量转写与分析录音文件：与网页相同的识别 + translate_politeness 管线，适合夜间离线处理
+
+- 解码、分段与语音识别在进程池中并行（--asr-workers），大模型分析在线程池中限流（--llm-workers）
+- 每处理完一个文件就追加一行 JSONL 并立即落盘；中断后用同样的命令重跑，已成功的文件自动跳过，
+  失败的文件会重试（同一文件以最后一行为准）
+- 定期输出进度与吞吐（个/分钟）
+
+用法：
+    python batch.py recordings/ --output results.jsonl --asr-workers 4 --llm-workers 8
+    python batch.py --manifest calls.txt --output results.jsonl --skip-analysis
+
+清单文件每行一个音频路径（相对路径以清单所在目录为基准，# 开头为注释）。
+支持 WAV / AIFF / FLAC。
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+AUDIO_EXTENSIONS = ('.wav', '.aif', '.aiff', '.flac')
+
+_worker_asr = None
+
+
+def _init_worker():
+    # 子进程各自导入识别管线；不访问本机声卡
+    global _worker_asr
+    os.environ['HEADLESS'] = '1'
+    from translator import asr
+    _worker_asr = asr
+
+
+def transcribe_file(path):
+    """子进程中执行：解码音频、按停顿切段并逐段识别，返回 (文本, 音频秒数, 识别耗时)"""
+    import speech_recognition as sr
+    from vad import VADSegmenter
+    start = time.monotonic()
+    with sr.AudioFile(path) as source:
+        audio = sr.Recognizer().record(source)
+    pcm = audio.get_raw_data(convert_rate=16000, convert_width=2)
+    duration = len(pcm) / 32000
+    # 与手动录音一致：长录音在自然停顿处切开，分段识别后按顺序拼接
+    vad = VADSegmenter.from_env(16000)
+    segments = vad.feed(pcm)
+    tail = vad.flush()
+    if tail:
+        segments.append(tail)
+    texts = []
+    for segment in segments:
+        text, _ = _worker_asr.recognize(sr.AudioData(bytes(segment), 16000, 2))
+        if text:
+            texts.append(text)
+    return '，'.join(texts) or None, duration, time.monotonic() - start
+
+
+def collect_inputs(directory=None, manifest=None):
+    """返回 [(记录键, 文件路径)]；目录模式下键为相对路径，清单模式下为清单中的原始条目"""
+    items = []
+    if manifest:
+        base = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest, encoding='utf-8') as f:
+            for line in f:
+                entry = line.strip()
+                if entry and not entry.startswith('#'):
+                    items.append((entry, entry if os.path.isabs(entry) else os.path.join(base, entry)))
+    if directory:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    path = os.path.join(root, name)
+                    items.append((os.path.relpath(path, directory), path))
+    items.sort()
+    return items
+
+
+def load_checkpoint(output):
+    """读取已有结果，返回已成功处理的记录键集合；末尾写了一半的行会被忽略"""
+    done = set()
+    if not os.path.exists(output):
+        return done
+    with open(output, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get('status') in ('ok', 'empty'):
+                done.add(record['file'])
+            else:
+                done.discard(record.get('file'))
+    return done
+
+
+class ResultWriter:
+    """追加写入 JSONL：每行写完立即 flush + fsync，进程被杀也只会丢掉正在写的那一行"""
+
+    def __init__(self, path):
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+        # 上次中断时末行可能只写了一半，新记录从下一行开始，避免与其拼在一起
+        if self._file.tell() > 0:
+            with open(path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    self._file.write('\n')
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False) + '\n'
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        self._file.close()
+
+
+class Progress:
+    def __init__(self, total, interval):
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self.failed = 0
+        self.audio_seconds = 0.0
+        self.start = time.monotonic()
+        self._last_report = self.start
+        self._lock = threading.Lock()
+
+    def add(self, ok, audio_seconds):
+        with self._lock:
+            self.done += 1
+            self.failed += 0 if ok else 1
+            self.audio_seconds += audio_seconds or 0.0
+            now = time.monotonic()
+            if now - self._last_report >= self.interval or self.done == self.total:
+                self._last_report = now
+                print(self.line(now))
+
+    def rate(self, now=None):
+        elapsed = (now or time.monotonic()) - self.start
+        return self.done / elapsed * 60 if elapsed > 0 else 0.0
+
+    def line(self, now=None):
+        rate = self.rate(now)
+        remaining = (self.total - self.done) / rate if rate else 0
+        return (f"📊 {self.done}/{self.total}（失败 {self.failed}），{rate:.1f} 个/分钟，"
+                f"音频 {self.audio_seconds / 60:.1f} 分钟，预计还需 {remaining:.1f} 分钟")
+
+
+def run(args):
+    items = collect_inputs(args.directory, args.manifest)
+    done = load_checkpoint(args.output)
+    pending = [(key, path) for key, path in items if key not in done]
+    print(f"🗂️ 共 {len(items)} 个文件，已完成 {len(items) - len(pending)} 个，待处理 {len(pending)} 个")
+    if not pending:
+        return 0
+
+    os.environ['HEADLESS'] = '1'
+    # 模型路由的线程池要容纳全部并发分析（含对冲请求），调度名额不少于分析并发数
+    os.environ.setdefault('LLM_WORKERS', str(max(16, args.llm_workers * 2)))
+    os.environ.setdefault('LLM_SLOTS', str(max(8, args.llm_workers)))
+    translator = None
+    if not args.skip_analysis:
+        from translator import SocialAnxietyTranslator
+        translator = SocialAnxietyTranslator(session_id='batch')
+
+    writer = ResultWriter(args.output)
+    progress = Progress(len(pending), args.report_interval)
+
+    def finish(record):
+        record['finished_at'] = time.time()
+        writer.write(record)
+        progress.add(record['status'] != 'error', record.get('audio_seconds'))
+
+    def analyze(record):
+        start = time.monotonic()
+        try:
+            record['translation'] = translator.translate_politeness(record['text'])
+            if record['translation'] is None:
+                record['status'], record['error'] = 'error', '大模型分析失败'
+        except Exception as e:
+            record['status'], record['error'] = 'error', f'大模型分析失败: {e}'
+        record['llm_seconds'] = round(time.monotonic() - start, 3)
+        finish(record)
+
+    # spawn 而非 fork：父进程里已有大模型与识别的线程，fork 后子进程可能继承被持有的锁
+    asr_pool = ProcessPoolExecutor(max_workers=args.asr_workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker)
+    llm_pool = ThreadPoolExecutor(max_workers=args.llm_workers, thread_name_prefix='batch-llm')
+    llm_slots = threading.BoundedSemaphore(args.llm_workers * 2)
+    queue = list(reversed(pending))
+    running = {}
+    interrupted = False
+    try:
+        while queue or running:
+            # 进程池中保持少量排队任务即可，中断时不必等待大量已提交的任务
+            while queue and len(running) < args.asr_workers * 2:
+                key, path = queue.pop()
+                running[asr_pool.submit(transcribe_file, path)] = key
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in finished:
+                key = running.pop(fut)
+                record = {'file': key}
+                try:
+                    text, duration, asr_seconds = fut.result()
+                except Exception as e:
+                    record.update(status='error', error=f'识别失败: {e}')
+                    finish(record)
+                    continue
+                record.update(text=text, audio_seconds=round(duration, 3), asr_seconds=round(asr_seconds, 3))
+                if not text:
+                    record['status'] = 'empty'
+                    finish(record)
+                elif translator is None:
+                    record['status'] = 'ok'
+                    finish(record)
+                else:
+                    record['status'] = 'ok'
+                    # 分析积压过多时暂停识别，避免识别结果在内存中无限堆积
+                    llm_slots.acquire()
+                    llm_pool.submit(analyze, record).add_done_callback(lambda _: llm_slots.release())
+    except KeyboardInterrupt:
+        interrupted = True
+        print("\n⏸️ 已中断，正在等待进行中的分析写入结果；重新运行同样的命令即可从断点继续")
+    finally:
+        asr_pool.shutdown(wait=not interrupted, cancel_futures=True)
+        llm_pool.shutdown(wait=True)
+        writer.close()
+    print(f"✅ 结束：{progress.line()}")
+    return 130 if interrupted else (1 if progress.failed else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量转写与分析录音文件（可断点续跑）')
+    parser.add_argument('directory', nargs='?', help='录音目录（递归查找 WAV / AIFF / FLAC）')
+    parser.add_argument('--manifest', help='清单文件，每行一个音频路径')
+    parser.add_argument('--output', default='batch_results.jsonl', help='结果文件（JSONL，同时作为断点记录）')
+    parser.add_argument('--asr-workers', type=int, default=os.cpu_count() or 4, help='识别进程数')
+    parser.add_argument('--llm-workers', type=int, default=8, help='同时进行的大模型分析数')
+    parser.add_argument('--skip-analysis', action='store_true', help='只转写，不调用大模型')
+    parser.add_argument('--report-interval', type=float, default=10.0, help='进度输出间隔（秒）')
+    args = parser.parse_args()
+    if not args.directory and not args.manifest:
+        parser.error('需要提供录音目录或 --manifest')
+    sys.exit(run(args))
+
+
+if __name__ == '__main__':
+    main()
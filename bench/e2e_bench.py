@@ -0,0 +1,298 @@
+"""端到端基准：不依赖麦克风和云端账号，把一组 WAV 录音回放进手动录音与连续转写两条链路
+
+识别与大模型请求都指向本地模拟服务（bench/fake_asr_server.py、bench/fake_llm_server.py），
+可设置延迟、抖动与失败率。输出 JSON 报告：p50/p95/p99 延迟、吞吐、CPU 与峰值内存。
+
+用法：
+    python bench/e2e_bench.py --corpus recordings/ --speed 4 --concurrency 4 --output report.json
+    python bench/e2e_bench.py --synthetic 20 --llm-latency 0.3 --llm-error-rate 0.05 --baseline report.json
+
+未提供 --corpus 时使用合成的语音样本。指定 --baseline 时与基线报告比较 p95，
+超过 --tolerance 视为性能回退并以非零状态码退出。
+"""
+import argparse
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import wave
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+RATE = 16000
+FEED_CHUNK = 0.1  # 每次推送 100ms 音频
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_server(script, port, extra):
+    proc = subprocess.Popen(
+        [sys.executable, os.path.join(ROOT, 'bench', script), '--port', str(port)] + extra,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f'模拟服务 {script} 启动超时')
+
+
+def percentiles(values):
+    if not values:
+        return {'count': 0}
+    arr = np.asarray(values, dtype=float)
+    return {
+        'count': len(values),
+        'mean': round(float(arr.mean()), 4),
+        'p50': round(float(np.percentile(arr, 50)), 4),
+        'p95': round(float(np.percentile(arr, 95)), 4),
+        'p99': round(float(np.percentile(arr, 99)), 4),
+        'max': round(float(arr.max()), 4),
+    }
+
+
+def load_wav(path):
+    """读取 WAV 并转成 16kHz 单声道 Int16"""
+    from audio_ingest import LinearResampler, decode_pcm, to_int16_bytes
+    with wave.open(path, 'rb') as wf:
+        if wf.getsampwidth() != 2:
+            raise ValueError('只支持 16 位 PCM')
+        channels, rate = wf.getnchannels(), wf.getframerate()
+        raw = wf.readframes(wf.getnframes())
+    samples = decode_pcm(raw, 's16le', channels)
+    if rate != RATE:
+        samples = LinearResampler(rate).process(samples)
+    return to_int16_bytes(samples)
+
+
+def load_corpus(path):
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        if not name.lower().endswith('.wav'):
+            continue
+        try:
+            corpus.append((name, load_wav(os.path.join(path, name))))
+        except (ValueError, wave.Error) as e:
+            print(f"⚠️ 跳过 {name}: {e}", file=sys.stderr)
+    return corpus
+
+
+def synthetic_corpus(count, seed=0):
+    """合成样本：底噪中夹着 1~3 段“语音”（带包络的谐波），每段 1~2.5 秒"""
+    rng = np.random.default_rng(seed)
+    corpus = []
+    for i in range(count):
+        parts = [rng.normal(0, 30, int(RATE * 0.5))]
+        for _ in range(rng.integers(1, 4)):
+            dur = rng.uniform(1.0, 2.5)
+            t = np.arange(int(RATE * dur)) / RATE
+            f0 = rng.uniform(120, 260)
+            voice = sum(np.sin(2 * np.pi * f0 * k * t) / k for k in (1, 2, 3))
+            envelope = 0.6 + 0.4 * np.sin(2 * np.pi * rng.uniform(2, 5) * t)
+            parts.append(2500 * voice * envelope + rng.normal(0, 30, len(t)))
+            parts.append(rng.normal(0, 30, int(RATE * rng.uniform(0.8, 1.2))))
+        pcm = np.clip(np.concatenate(parts), -32768, 32767).astype('<i2').tobytes()
+        corpus.append((f'synthetic_{i:03d}', pcm))
+    return corpus
+
+
+def _feed(source, pcm, speed):
+    step = int(RATE * FEED_CHUNK) * 2
+    for offset in range(0, len(pcm), step):
+        source.feed(pcm[offset:offset + step], RATE)
+        time.sleep(FEED_CHUNK / speed)
+
+
+def run_manual(name, pcm, speed):
+    from audio_ingest import PushAudioSource
+    from translator import SocialAnxietyTranslator
+    source = PushAudioSource()
+    tr = SocialAnxietyTranslator(audio_source=source)
+    tr.start_manual_recording()
+    _feed(source, pcm, speed)
+    start = time.perf_counter()
+    text = tr.stop_manual_recording()
+    recognized = time.perf_counter()
+    translation = tr.translate_politeness(text) if text else None
+    done = time.perf_counter()
+    return {'file': name, 'stop_to_text': recognized - start, 'end_to_end': done - start, 'ok': bool(translation)}
+
+
+def run_streaming(name, pcm, speed, settle):
+    from audio_ingest import PushAudioSource
+    from translator import SocialAnxietyTranslator
+    source = PushAudioSource()
+    tr = SocialAnxietyTranslator(audio_source=source)
+    tr.start_streaming()
+    _feed(source, pcm, speed)
+    fed = time.perf_counter()
+    # 送完音频后等待：不再有新分句，且每个分句都有了分析结果
+    last_change, seen = time.perf_counter(), -1
+    while time.perf_counter() - last_change < settle:
+        events = tr.events.since(0, ('segment', 'analysis'))
+        segments = sum(1 for e in events if e[1] == 'segment')
+        analyses = sum(1 for e in events if e[1] == 'analysis' and 'analysis' in e[2])
+        if len(events) != seen:
+            seen, last_change = len(events), time.perf_counter()
+        elif segments and analyses >= segments:
+            break
+        time.sleep(0.05)
+    drained = time.perf_counter()
+    tr.stop_streaming()
+    events = tr.events.since(0, ('segment', 'analysis'))
+    segment_times = [e[3] for e in events if e[1] == 'segment']
+    latencies = []
+    for _, _, data, ts in events:
+        seq = data.get('seq') if isinstance(data, dict) and 'analysis' in data else None
+        if seq is not None and seq < len(segment_times):
+            latencies.append(ts - segment_times[seq])
+    return {
+        'file': name, 'segments': len(segment_times), 'analyses': len(latencies),
+        'segment_to_analysis': latencies, 'drain': drained - fed,
+    }
+
+
+def _run_all(fn, corpus, concurrency, *args):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda item: fn(item[0], item[1], *args), corpus))
+    return results, time.perf_counter() - start
+
+
+def _configure_env(args, asr_port, llm_port):
+    os.environ.update({
+        'HEADLESS': '1',
+        'DASHSCOPE_API_KEY': os.environ.get('DASHSCOPE_API_KEY') or 'fake',
+        'LLM_BASE_URL': f'http://127.0.0.1:{llm_port}/compatible-mode/v1',
+        'DASHSCOPE_HTTP_BASE_URL': f'http://127.0.0.1:{llm_port}/api/v1',
+        'DASHSCOPE_WEBSOCKET_BASE_URL': f'ws://127.0.0.1:{asr_port}/api-ws/v1/inference',
+        'ASR_BACKENDS': 'paraformer',
+        'STREAMING_ASR': args.streaming_asr,
+        'LLM_CACHE_ENABLED': '1' if args.cache else '0',
+        'TRANSCRIPT_PATH': os.path.join(tempfile.mkdtemp(prefix='e2e_bench_'), 'transcripts.sqlite3'),
+    })
+
+
+def compare(report, baseline, tolerance):
+    """对比各链路的 p95，返回超过容忍度的回退项"""
+    regressions = []
+    for mode, metric in (('manual', 'end_to_end'), ('manual', 'stop_to_text'),
+                         ('streaming', 'segment_to_analysis'), ('streaming', 'drain')):
+        current = report.get(mode, {}).get(metric, {}).get('p95')
+        previous = baseline.get(mode, {}).get(metric, {}).get('p95')
+        if current is None or not previous:
+            continue
+        ratio = current / previous
+        if ratio > 1 + tolerance:
+            regressions.append({'metric': f'{mode}.{metric}.p95', 'baseline': previous, 'current': current, 'ratio': round(ratio, 3)})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='离线端到端基准')
+    parser.add_argument('--corpus', help='WAV 录音目录')
+    parser.add_argument('--synthetic', type=int, default=10, help='未指定 --corpus 时合成的样本数')
+    parser.add_argument('--modes', default='manual,streaming')
+    parser.add_argument('--speed', type=float, default=4.0, help='回放速度（相对实时）')
+    parser.add_argument('--concurrency', type=int, default=4, help='同时回放的会话数')
+    parser.add_argument('--settle', type=float, default=3.0, help='连续转写送完音频后等待结果的最长静默时间（秒）')
+    parser.add_argument('--streaming-asr', default='vad', choices=('vad', 'paraformer'))
+    parser.add_argument('--cache', action='store_true', help='启用分析缓存（默认关闭以测量真实调用）')
+    parser.add_argument('--asr-latency', type=float, default=0.05)
+    parser.add_argument('--asr-jitter', type=float, default=0.02)
+    parser.add_argument('--asr-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-latency', type=float, default=0.3)
+    parser.add_argument('--llm-jitter', type=float, default=0.1)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-token-interval', type=float, default=0.01)
+    parser.add_argument('--output', help='报告输出文件（默认打印到标准输出）')
+    parser.add_argument('--baseline', help='基线报告，用于对比 p95')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='p95 允许的相对增幅')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else synthetic_corpus(args.synthetic)
+    if not corpus:
+        parser.error('语料为空')
+    asr_port, llm_port = _free_port(), _free_port()
+    servers = [
+        _start_server('fake_asr_server.py', asr_port, [
+            '--latency', str(args.asr_latency), '--jitter', str(args.asr_jitter), '--error-rate', str(args.asr_error_rate)]),
+        _start_server('fake_llm_server.py', llm_port, [
+            '--latency', str(args.llm_latency), '--jitter', str(args.llm_jitter), '--error-rate', str(args.llm_error_rate),
+            '--token-interval', str(args.llm_token_interval)]),
+    ]
+    _configure_env(args, asr_port, llm_port)
+    try:
+        import translator  # noqa: F401  在计时前完成导入
+        usage_before = resource.getrusage(resource.RUSAGE_SELF)
+        wall_start = time.perf_counter()
+        report = {
+            'config': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+            'corpus': {'files': len(corpus), 'audio_seconds': round(sum(len(p) for _, p in corpus) / (RATE * 2), 2)},
+        }
+        modes = [m.strip() for m in args.modes.split(',') if m.strip()]
+        if 'manual' in modes:
+            results, wall = _run_all(run_manual, corpus, args.concurrency, args.speed)
+            report['manual'] = {
+                'stop_to_text': percentiles([r['stop_to_text'] for r in results]),
+                'end_to_end': percentiles([r['end_to_end'] for r in results]),
+                'errors': sum(1 for r in results if not r['ok']),
+                'wall_s': round(wall, 3),
+                'files_per_s': round(len(results) / wall, 3),
+            }
+        if 'streaming' in modes:
+            results, wall = _run_all(run_streaming, corpus, args.concurrency, args.speed, args.settle)
+            report['streaming'] = {
+                'segment_to_analysis': percentiles([x for r in results for x in r['segment_to_analysis']]),
+                'drain': percentiles([r['drain'] for r in results]),
+                'segments': sum(r['segments'] for r in results),
+                'analyses': sum(r['analyses'] for r in results),
+                'wall_s': round(wall, 3),
+                'files_per_s': round(len(results) / wall, 3),
+            }
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        wall = time.perf_counter() - wall_start
+        cpu = (usage.ru_utime - usage_before.ru_utime) + (usage.ru_stime - usage_before.ru_stime)
+        report['resources'] = {
+            'wall_s': round(wall, 3),
+            'cpu_s': round(cpu, 3),
+            'cpu_utilization': round(cpu / wall, 3) if wall else 0.0,
+            # Linux 下 ru_maxrss 单位为 KB
+            'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+        }
+    finally:
+        for proc in servers:
+            proc.terminate()
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report['regressions'] = regressions
+        status = 1 if regressions else 0
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    sys.exit(status)
+
+
+if __name__ == '__main__':
+    main()
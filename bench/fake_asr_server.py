@@ -0,0 +1,150 @@
+"""本地模拟的 Paraformer 实时识别服务（DashScope WebSocket 协议），用于离线联调与压测
+
+不做真正的识别：按能量检测语音段，语音进行中定期返回中间结果，停顿处返回整句结果，
+文本依次取自 --script 文件的各行（默认“第N句话”）。可模拟首包延迟、抖动与失败率。
+
+用法：
+    python bench/fake_asr_server.py --port 8765 --latency 0.05 --jitter 0.02
+    DASHSCOPE_WEBSOCKET_BASE_URL=ws://127.0.0.1:8765/api-ws/v1/inference \
+    DASHSCOPE_API_KEY=fake STREAMING_ASR=paraformer python app.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+from aiohttp import web, WSMsgType
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from vad import VADSegmenter  # noqa: E402
+
+SAMPLE_RATE = 16000
+
+
+class FakeRecognizer:
+    """单个识别任务的状态：累计语音时长，按间隔生成中间结果"""
+
+    def __init__(self, script, interim_interval):
+        self.script = script
+        self.interim_interval = interim_interval
+        self.vad = VADSegmenter(SAMPLE_RATE, hangover=0.4, min_speech=0.2)
+        self.index = 0
+        self.audio_ms = 0
+        self.speech_start = None
+        self.last_interim = 0
+
+    def _text(self):
+        if self.script:
+            return self.script[self.index % len(self.script)]
+        return f'第{self.index + 1}句话'
+
+    def _sentence(self, text, final):
+        return {
+            'begin_time': self.speech_start or 0,
+            'end_time': self.audio_ms if final else None,
+            'text': text,
+            'sentence_end': final,
+        }
+
+    def feed(self, pcm):
+        """返回这段音频产生的识别结果（sentence 字典列表）"""
+        self.audio_ms += len(pcm) * 1000 // (SAMPLE_RATE * 2)
+        results = []
+        for _ in self.vad.feed(pcm):
+            results.append(self._final())
+        if self.vad.in_speech:
+            if self.speech_start is None:
+                self.speech_start = self.audio_ms
+                self.last_interim = self.audio_ms
+            if self.audio_ms - self.last_interim >= self.interim_interval:
+                self.last_interim = self.audio_ms
+                text = self._text()
+                # 中间结果随语音时长逐字增长
+                shown = max(1, min(len(text), (self.audio_ms - self.speech_start) // 200))
+                results.append(self._sentence(text[:shown], False))
+        return results
+
+    def _final(self):
+        sentence = self._sentence(self._text(), True)
+        self.index += 1
+        self.speech_start = None
+        return sentence
+
+    def finish(self):
+        return [self._final()] if self.vad.flush() else []
+
+
+def _message(event, task_id, payload=None, **header):
+    message = {'header': {'event': event, 'task_id': task_id, 'attributes': {}, **header}, 'payload': payload or {}}
+    return json.dumps(message, ensure_ascii=False)
+
+
+async def _send_result(ws, task_id, sentence, args):
+    delay = args.latency + random.uniform(-args.jitter, args.jitter)
+    if delay > 0:
+        await asyncio.sleep(delay)
+    await ws.send_str(_message('result-generated', task_id, {'output': {'sentence': sentence}, 'usage': None}))
+
+
+async def handle(request):
+    args = request.app['args']
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    task_id = None
+    recognizer = None
+    async for msg in ws:
+        if msg.type == WSMsgType.TEXT:
+            data = json.loads(msg.data)
+            header = data.get('header', {})
+            action = header.get('action')
+            task_id = header.get('task_id', task_id)
+            if action == 'run-task':
+                if random.random() < args.error_rate:
+                    await ws.send_str(_message('task-failed', task_id, error_code='FakeError', error_message='模拟的识别失败'))
+                    break
+                recognizer = FakeRecognizer(request.app['script'], args.interim_interval)
+                await ws.send_str(_message('task-started', task_id))
+            elif action == 'finish-task':
+                for sentence in recognizer.finish() if recognizer else []:
+                    await _send_result(ws, task_id, sentence, args)
+                await ws.send_str(_message('task-finished', task_id, {'output': {}, 'usage': None}))
+                break
+        elif msg.type == WSMsgType.BINARY and recognizer is not None:
+            for sentence in recognizer.feed(msg.data):
+                await _send_result(ws, task_id, sentence, args)
+        elif msg.type == WSMsgType.ERROR:
+            break
+    await ws.close()
+    return ws
+
+
+def build_app(args):
+    app = web.Application()
+    app['args'] = args
+    script = []
+    if args.script:
+        with open(args.script, encoding='utf-8') as f:
+            script = [line.strip() for line in f if line.strip()]
+    app['script'] = script
+    app.router.add_get('/{tail:.*}', handle)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的 Paraformer 实时识别服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--script', help='每行一句的识别文本')
+    parser.add_argument('--latency', type=float, default=0.0, help='每条结果的附加延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的随机抖动（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='任务直接失败的概率')
+    parser.add_argument('--interim-interval', type=int, default=300, help='中间结果间隔（毫秒音频）')
+    args = parser.parse_args()
+    web.run_app(build_app(args), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
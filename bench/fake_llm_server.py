@@ -0,0 +1,124 @@
+"""本地模拟的大模型服务：同时提供 OpenAI 兼容的 /chat/completions 与 dashscope Generation 接口
+
+返回固定格式的分析文本（批量分析请求返回对应条数的 JSON 数组），可模拟首包延迟、
+抖动、逐字输出间隔与失败率。
+
+用法：
+    python bench/fake_llm_server.py --port 8766 --latency 0.3 --jitter 0.1 --error-rate 0.05
+    LLM_BASE_URL=http://127.0.0.1:8766/compatible-mode/v1 \
+    DASHSCOPE_HTTP_BASE_URL=http://127.0.0.1:8766/api/v1 python app.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+
+from aiohttp import web
+
+_BATCH_RE = re.compile(r'下面是按编号排列的(\d+)条文本')
+
+
+def _reply(prompt):
+    match = _BATCH_RE.search(prompt or '')
+    if match:
+        count = int(match.group(1))
+        return json.dumps([
+            {'id': i, 'analysis': f'类型：客套话\n真实意图：第{i}条的真实意图\n建议回应：礼貌回应'}
+            for i in range(1, count + 1)
+        ], ensure_ascii=False)
+    if '摘要' in (prompt or ''):
+        return '1. 对方在寒暄\n2. 建议简短礼貌地回应'
+    return '类型：客套话\n真实意图：只是礼貌寒暄，并非真的邀请\n建议回应：好呀，有空再约'
+
+
+async def _delay(args):
+    delay = args.latency + random.uniform(-args.jitter, args.jitter)
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+
+def _failed(args):
+    return random.random() < args.error_rate
+
+
+async def chat_completions(request):
+    args = request.app['args']
+    body = await request.json()
+    await _delay(args)
+    if _failed(args):
+        return web.json_response({'error': {'message': '模拟的服务错误', 'type': 'server_error'}}, status=500)
+    prompt = '\n'.join(m.get('content', '') for m in body.get('messages', []))
+    text = _reply(prompt)
+    completion_id = f'chatcmpl-{uuid.uuid4().hex}'
+    created = int(time.time())
+    model = body.get('model', 'fake')
+    if not body.get('stream'):
+        return web.json_response({
+            'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': text}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': len(prompt), 'completion_tokens': len(text), 'total_tokens': len(prompt) + len(text)},
+        })
+    resp = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await resp.prepare(request)
+    step = max(args.chunk_chars, 1)
+    for i in range(0, len(text), step):
+        chunk = {
+            'id': completion_id, 'object': 'chat.completion.chunk', 'created': created, 'model': model,
+            'choices': [{'index': 0, 'delta': {'content': text[i:i + step]}, 'finish_reason': None}],
+        }
+        await resp.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+        if args.token_interval > 0:
+            await asyncio.sleep(args.token_interval)
+    await resp.write(b'data: [DONE]\n\n')
+    await resp.write_eof()
+    return resp
+
+
+async def generation(request):
+    args = request.app['args']
+    body = await request.json()
+    await _delay(args)
+    request_id = uuid.uuid4().hex
+    if _failed(args):
+        return web.json_response({'request_id': request_id, 'code': 'InternalError', 'message': '模拟的服务错误'}, status=500)
+    text = _reply(body.get('input', {}).get('prompt', ''))
+    return web.json_response({
+        'request_id': request_id,
+        'output': {'text': text, 'finish_reason': 'stop'},
+        'usage': {'input_tokens': 0, 'output_tokens': len(text)},
+    })
+
+
+async def route(request):
+    if request.path.endswith('/chat/completions'):
+        return await chat_completions(request)
+    if request.path.endswith('/generation'):
+        return await generation(request)
+    raise web.HTTPNotFound()
+
+
+def build_app(args):
+    app = web.Application()
+    app['args'] = args
+    app.router.add_post('/{tail:.*}', route)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='本地模拟的大模型服务')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency', type=float, default=0.0, help='首包延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='延迟的随机抖动（秒）')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='请求失败的概率')
+    parser.add_argument('--token-interval', type=float, default=0.0, help='流式输出时每块的间隔（秒）')
+    parser.add_argument('--chunk-chars', type=int, default=4, help='流式输出时每块的字数')
+    args = parser.parse_args()
+    web.run_app(build_app(args), host=args.host, port=args.port, print=None)
+
+
+if __name__ == '__main__':
+    main()
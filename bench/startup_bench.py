@@ -0,0 +1,55 @@
+"""启动耗时基准：在全新的子进程中多次导入服务模块，统计导入耗时
+
+用法：
+    python bench/startup_bench.py --module app --runs 5 --budget 1.0
+
+中位数超过预算（秒）时以非零状态码退出，可直接放进 CI 防止启动变慢。
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_SNIPPET = "import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+
+
+def measure(module, runs):
+    env = dict(os.environ, HEADLESS='1')
+    timings = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, '-c', _SNIPPET.format(module=module)],
+            cwd=ROOT, env=env, capture_output=True, text=True, check=True
+        )
+        timings.append(float(out.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='测量服务模块的导入耗时')
+    parser.add_argument('--module', default='app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=1.0, help='导入耗时中位数上限（秒）')
+    args = parser.parse_args()
+
+    timings = measure(args.module, args.runs)
+    median = statistics.median(timings)
+    report = {
+        'module': args.module,
+        'runs': args.runs,
+        'median_s': round(median, 4),
+        'max_s': round(max(timings), 4),
+        'min_s': round(min(timings), 4),
+        'budget_s': args.budget,
+        'ok': median <= args.budget,
+    }
+    print(json.dumps(report, ensure_ascii=False))
+    sys.exit(0 if report['ok'] else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""常驻的本机麦克风采集：进程内每个设备只打开一次输入流并持续读取
+
+手动录音、连续转写与单次识别各自订阅一份音频（订阅即开始，不再每次创建 PyAudio 与打开设备），
+同时持续跟踪环境噪音，识别前不再需要 0.8~1 秒的校准。
+"""
+import os
+import threading
+import time
+
+import speech_recognition as sr
+
+from audio_ingest import PushAudioStream, SAMPLE_WIDTH
+from vad import NoiseFloor
+
+
+class _Subscription(PushAudioStream):
+    """某个使用方的音频副本，接口与 PyAudio 的 Stream 对齐；close 时退订"""
+
+    def __init__(self, engine, max_seconds):
+        super().__init__(max_seconds=max_seconds)
+        self._engine = engine
+
+    def close(self):
+        self.stop_stream()
+        self._engine._unsubscribe(self)
+
+
+class EngineSource(sr.AudioSource):
+    """供 speech_recognition 使用的音频源：进入时订阅采集引擎，退出时退订"""
+
+    def __init__(self, engine):
+        self.SAMPLE_RATE = engine.sample_rate
+        self.SAMPLE_WIDTH = SAMPLE_WIDTH
+        self.CHUNK = engine.chunk_size
+        self.device_index = engine.device_index
+        self.noise = engine.noise
+        self.stream = None
+        self._engine = engine
+
+    def __enter__(self):
+        self.stream = self._engine.open_stream()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream.close()
+        self.stream = None
+
+
+class CaptureEngine:
+    """单个输入设备的常驻采集线程：读到的每块音频更新噪音基底并分发给所有订阅者；
+    设备读取出错时每 retry_interval 秒重新打开"""
+
+    def __init__(self, device_index=None, sample_rate=16000, chunk_size=1024, retry_interval=1.0,
+                 buffer_seconds=10.0, opener=None):
+        self.device_index = device_index
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.retry_interval = retry_interval
+        self.buffer_seconds = buffer_seconds
+        self.noise = NoiseFloor(sample_rate)
+        self._opener = opener or self._open_pyaudio
+        self._pa = None
+        self._stream = None
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+
+    def _open_pyaudio(self):
+        import pyaudio
+        if self._pa is None:
+            self._pa = pyaudio.PyAudio()
+        kwargs = {'input_device_index': self.device_index} if self.device_index is not None else {}
+        return self._pa.open(format=pyaudio.paInt16, channels=1, rate=self.sample_rate, input=True,
+                             frames_per_buffer=self.chunk_size, **kwargs)
+
+    def start(self):
+        """首次调用时打开设备并启动采集线程，之后保持常开"""
+        with self._lock:
+            if self._thread is not None or self._closed:
+                return
+            # 在调用方线程打开设备，打不开时直接把异常抛给调用方
+            self._stream = self._opener()
+            self._thread = threading.Thread(target=self._run, name='capture', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._closed:
+            try:
+                if self._stream is None:
+                    self._stream = self._opener()
+                data = self._stream.read(self.chunk_size, exception_on_overflow=False)
+            except Exception as e:
+                print(f"⚠️ 麦克风读取出错，{self.retry_interval}秒后重新打开: {e}")
+                self._close_stream()
+                time.sleep(self.retry_interval)
+                continue
+            self.noise.update(data)
+            with self._lock:
+                subscribers = list(self._subscribers)
+            for sub in subscribers:
+                sub.write(data)
+        self._close_stream()
+
+    def _close_stream(self):
+        stream, self._stream = self._stream, None
+        if stream is None:
+            return
+        try:
+            stream.stop_stream()
+            stream.close()
+        except Exception:
+            pass
+
+    def open_stream(self):
+        """订阅一份从此刻开始的音频，返回可 read 的流；用完调用 close 退订"""
+        self.start()
+        sub = _Subscription(self, self.buffer_seconds)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def _unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def source(self):
+        return EngineSource(self)
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            subscribers = list(self._subscribers)
+            self._subscribers.clear()
+        for sub in subscribers:
+            sub.stop_stream()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+        if self._pa is not None:
+            try:
+                self._pa.terminate()
+            except Exception:
+                pass
+            self._pa = None
+
+
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def get_engine(device_index=None):
+    """每个设备共享一个采集引擎"""
+    with _engines_lock:
+        engine = _engines.get(device_index)
+        if engine is None:
+            engine = _engines[device_index] = CaptureEngine(
+                device_index,
+                retry_interval=float(os.getenv('CAPTURE_RETRY_INTERVAL', '1.0')),
+            )
+        return engine
@@ -0,0 +1,161 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+
+
+class AsyncWaiters:
+    """让 asyncio 协程等待其他线程发出的通知，等待期间不占用线程"""
+
+    def __init__(self):
+        self._waiters = set()
+        self._lock = threading.Lock()
+
+    def notify(self):
+        with self._lock:
+            waiters = list(self._waiters)
+        for loop, fut in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, fut)
+            except RuntimeError:
+                # 事件循环已关闭
+                pass
+
+    async def wait_for(self, predicate, timeout, blocking=False):
+        """等待 predicate() 为真或超时，返回 predicate() 的最终结果
+
+        blocking=True 表示 predicate 会读数据库等阻塞操作，放到线程中执行，不占用事件循环。
+        """
+        loop = asyncio.get_running_loop()
+        check = (lambda: asyncio.to_thread(predicate)) if blocking else None
+        deadline = loop.time() + timeout
+        while True:
+            fut = loop.create_future()
+            entry = (loop, fut)
+            # 先登记再检查条件，避免检查与等待之间漏掉通知
+            with self._lock:
+                self._waiters.add(entry)
+            try:
+                result = await check() if check else predicate()
+                remaining = deadline - loop.time()
+                if result or remaining <= 0:
+                    return result
+                try:
+                    await asyncio.wait_for(fut, remaining)
+                except asyncio.TimeoutError:
+                    return await check() if check else predicate()
+            finally:
+                with self._lock:
+                    self._waiters.discard(entry)
+
+
+def _wake(fut):
+    if not fut.done():
+        fut.set_result(None)
+
+
+class EventChannel:
+    """单个会话的事件通道：为事件分配递增ID，保留最近的事件用于断线重连补发"""
+
+    shared = False
+
+    def __init__(self, replay_size=None):
+        self.replay_size = replay_size or int(os.getenv('EVENTS_REPLAY_SIZE', '500'))
+        self._buffer = deque(maxlen=self.replay_size)
+        self._cond = threading.Condition()
+        self._last_id = 0
+        self._async = AsyncWaiters()
+        self.closed = False
+        # 连续转写是否在运行，旧版 /stream_* 接口据此结束
+        self.streaming = False
+        # 会话的重置代次；单进程时只有本进程会重置，仅为与共享通道接口一致
+        self.generation = 0
+
+    def bump_generation(self):
+        self.generation += 1
+        return self.generation
+
+    def publish(self, event_type, data, coalesce=False):
+        """发布事件；coalesce=True 时若上一条是同类事件则替换它（用于高频的中间结果，避免挤掉补发缓冲）"""
+        with self._cond:
+            self._last_id += 1
+            if coalesce and self._buffer and self._buffer[-1][1] == event_type:
+                self._buffer.pop()
+            self._buffer.append((self._last_id, event_type, data, time.time()))
+            self._cond.notify_all()
+            event_id = self._last_id
+        self._async.notify()
+        return event_id
+
+    def topic(self, event_type):
+        return EventTopic(self, event_type)
+
+    @property
+    def last_id(self):
+        with self._cond:
+            return self._last_id
+
+    def since(self, after_id, types=None):
+        with self._cond:
+            return self._collect(after_id, types)
+
+    def _collect(self, after_id, types):
+        return [e for e in self._buffer if e[0] > after_id and (types is None or e[1] in types)]
+
+    def wait(self, after_id, timeout, types=None):
+        """等待 after_id 之后的新事件；超时返回空列表"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self.closed:
+                events = self._collect(after_id, types)
+                if events:
+                    return events
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            return []
+
+    async def wait_async(self, after_id, timeout, types=None):
+        """wait 的协程版本，供 ASGI 模式使用"""
+        result = await self._async.wait_for(lambda: self.since(after_id, types) or self.closed, timeout)
+        return result if isinstance(result, list) else []
+
+    def clear(self):
+        # 只清空补发缓冲，事件ID继续递增，已连接的客户端不会收到重复ID
+        with self._cond:
+            self._buffer.clear()
+
+    def close(self):
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+        self._async.notify()
+
+    def qsize(self, event_type=None):
+        with self._cond:
+            if event_type is None:
+                return len(self._buffer)
+            return sum(1 for e in self._buffer if e[1] == event_type)
+
+
+class EventTopic:
+    """某一类事件的发布入口，保留 put 接口以替代原来的 queue.Queue"""
+
+    def __init__(self, channel, event_type):
+        self.channel = channel
+        self.event_type = event_type
+
+    def put(self, item):
+        return self.channel.publish(self.event_type, item)
+
+    def qsize(self):
+        return self.channel.qsize(self.event_type)
+
+
+def format_sse(event_id, event_type, data):
+    payload = data if isinstance(data, str) else json.dumps(data)
+    lines = ''.join(f"data: {line}\n" for line in payload.split('\n'))
+    return f"id: {event_id}\nevent: {event_type}\n{lines}\n"
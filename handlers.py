@@ -0,0 +1,264 @@
+"""app.py（Flask）与 asgi_app.py（ASGI）共用的请求解析、结果内容与响应构造
+
+这里只放与框架无关的部分：请求头、查询参数与 Cookie 以映射传入，参数错误抛出 BadRequest；
+两个服务模式只负责取出请求、以线程或协程执行阻塞调用，再把结果包装成各自的 Response。
+"""
+import json
+import os
+import re
+import time
+
+from sessions import SESSION_COOKIE, SESSION_HEADER, result_payload
+from audio_ingest import SAMPLE_FORMATS
+from translator import analysis_pool, summary_pool, transcript_store
+from transcripts import EXPORT_FORMATS, PAGE_LIMIT, parse_kinds
+from events import format_sse
+from metrics import SSE_LAG_SECONDS, QUEUE_DEPTH, ACTIVE_SESSIONS
+
+SSE_HEARTBEAT = float(os.getenv('SSE_HEARTBEAT', '15'))
+SSE_HEADERS = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+FORBIDDEN = {'error': '无权限'}
+INGEST_BUSY = {'error': '当前会话已有音频上传在进行中'}
+
+_SID_RE = re.compile(r'^[A-Za-z0-9_-]{8,64}$')
+
+
+class BadRequest(Exception):
+    """请求参数错误，status 为返回的 HTTP 状态码"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+    def body(self):
+        return {'error': str(self)}
+
+
+def requested_sid(headers, args, cookies):
+    # 优先使用请求头（每个标签页独立），其次是查询参数（EventSource 无法设置请求头），最后是 Cookie
+    sid = headers.get(SESSION_HEADER) or args.get('sid') or cookies.get(SESSION_COOKIE)
+    if sid and _SID_RE.match(sid):
+        return sid
+    return None
+
+
+def needs_cookie(session, cookies):
+    return session is not None and cookies.get(SESSION_COOKIE) != session.sid
+
+
+def admin_allowed(headers):
+    token = os.getenv('ADMIN_TOKEN')
+    return not token or headers.get('X-Admin-Token') == token
+
+
+def last_event_id(headers, args):
+    # 浏览器断线重连时会带上 Last-Event-ID，据此补发错过的事件
+    raw = headers.get('Last-Event-ID') or args.get('last_event_id')
+    try:
+        return max(int(raw), 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+# ---- 结果槽内容：录音与分析各阶段显示的文案 ----
+
+MIC_STARTING = {'original_text': '正在准备麦克风...', 'translation': '等待AI分析...', 'status_hint': '🎤 正在激活麦克风...'}
+MANUAL_RECORDING = {'original_text': '正在录音...', 'translation': '等待结束', 'status_hint': '🎤 正在录音，点击结束'}
+RECOGNITION_FAILED = {'original_text': '语音识别失败', 'translation': '请检查麦克风并重试'}
+MANUAL_RECOGNITION_FAILED = {'original_text': '识别失败', 'translation': '请重试'}
+
+
+def recognized(text):
+    return {'original_text': text, 'translation': '分析中...', 'status_hint': '🧠 已识别，正在分析...'}
+
+
+def analyzed(text, translation):
+    return {'original_text': text, 'translation': translation}
+
+
+def processing_failed(error):
+    return {'original_text': '处理出错', 'translation': f'错误: {str(error)}'}
+
+
+def analysis_failed(text, error):
+    return {'original_text': text, 'translation': f'分析失败: {str(error)}'}
+
+
+def progress_sink(session):
+    """识别过程中的状态提示，保留已有的原文与分析
+
+    ASGI 模式下整个更新（读取当前结果再写入）交给该会话的写入队列执行，与其他写入保持提交顺序。
+    """
+    def _update(msg):
+        base_text = (session.latest_result or {}).get('original_text') or '等待录音...'
+        translation_hint = (session.latest_result or {}).get('translation') or '等待AI分析...'
+        session.set_result({'original_text': base_text, 'translation': translation_hint, 'status_hint': msg})
+    return _update
+
+
+def partial_sink(write, text):
+    # 大模型边生成边更新结果，前端可通过 /stream_result 实时看到
+    def _update(partial):
+        write({'original_text': text, 'translation': partial, 'status_hint': '🧠 正在生成分析...'})
+    return _update
+
+
+# ---- /get_result 与 /stream_result ----
+
+def result_wait(session, args, headers):
+    try:
+        return session.parse_result_wait(args.get('since'), args.get('wait'), headers.get('If-None-Match'))
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+
+def result_reply(session, known, state):
+    """返回 (响应体, 响应头)；版本号与客户端已知的相同时响应体为 None，调用方返回 304"""
+    version, processing, result = state
+    body = None if version == known else result_payload(version, processing, result)
+    return body, {'ETag': session.result_etag(version), 'Cache-Control': 'no-cache'}
+
+
+class ResultStream:
+    """/stream_result 的推送状态：结果每次变化推送一帧，处理结束后 done 为 True"""
+
+    def __init__(self):
+        self.version = -1
+        self.done = False
+
+    def frame(self, state):
+        new_version, processing, result = state
+        if new_version == self.version:
+            return ": keep-alive\n\n"
+        self.version = new_version
+        status = 'processing' if processing else ('completed' if result else 'waiting')
+        self.done = not processing
+        return f"data: {json.dumps({'status': status, 'result': result})}\n\n"
+
+
+# ---- 事件流 ----
+
+# 旧版 /stream_* 接口：只推送一类事件，数据格式与原来的队列一致
+LEGACY_STREAMS = {
+    'segment': (('segment',), lambda data: data['segment']),
+    'analysis': (('analysis',), json.dumps),
+    'summary': (('summary',), json.dumps),
+}
+
+
+class EventStream:
+    """SSE 事件流的游标与帧格式；等待新事件由调用方以线程或协程完成"""
+
+    def __init__(self, session, last_id=0, types=None, to_payload=None, follow_streaming=False):
+        self.session = session
+        self.channel = session.translator.events
+        self.last_id = last_id
+        self.types = types
+        self.to_payload = to_payload
+        self.follow_streaming = follow_streaming
+        # 兼容旧接口时每秒检查一次是否已停止转写；统一通道只在心跳间隔醒来
+        self.poll = 1.0 if follow_streaming else SSE_HEARTBEAT
+        # 共享后端下读取转写标记要访问数据库
+        self.blocking = follow_streaming and self.channel.shared
+        self.last_write = time.monotonic()
+
+    def start(self):
+        self.last_write = time.monotonic()
+        return "retry: 3000\n\n"
+
+    def finished(self):
+        if self.channel.closed or (self.follow_streaming and not self.channel.streaming):
+            return True
+        # 保持连接期间会话不会被当作空闲回收
+        self.session.touch()
+        return False
+
+    def frames(self, events):
+        now = time.monotonic()
+        if not events:
+            if now - self.last_write >= SSE_HEARTBEAT:
+                self.last_write = now
+                return [": heartbeat\n\n"]
+            return []
+        frames = []
+        for event_id, event_type, data, published in events:
+            self.last_id = event_id
+            SSE_LAG_SECONDS.observe(max(time.time() - published, 0.0), event=event_type)
+            if self.to_payload is None:
+                frames.append(format_sse(event_id, event_type, data))
+            else:
+                frames.append(f"id: {event_id}\ndata: {self.to_payload(data)}\n\n")
+        self.last_write = now
+        return frames
+
+
+# ---- 音频上传与转写记录 ----
+
+def audio_format(headers):
+    """解析 /ingest_audio 的音频格式请求头，返回 (采样率, 声道数, 采样格式)"""
+    try:
+        rate = int(headers.get('X-Sample-Rate', '16000'))
+        channels = int(headers.get('X-Channels', '1'))
+    except ValueError:
+        raise BadRequest('采样率或声道数无效')
+    sample_format = headers.get('X-Sample-Format', 's16le')
+    if sample_format not in SAMPLE_FORMATS or not (8000 <= rate <= 192000) or not (1 <= channels <= 8):
+        raise BadRequest('不支持的音频格式', 415)
+    return rate, channels, sample_format
+
+
+def transcript_query(args):
+    try:
+        after = int(args.get('after', 0))
+        limit = min(max(int(args.get('limit', 100)), 1), PAGE_LIMIT)
+        kinds = parse_kinds(args.get('kind'))
+    except ValueError as e:
+        raise BadRequest(f'参数错误: {e}')
+    return after, limit, kinds
+
+
+def transcript_page(sid, after, limit, kinds):
+    # 读取转写数据库，ASGI 模式下在线程中调用
+    items, next_after = transcript_store.page(sid, after, limit, kinds)
+    return {'items': items, 'next': next_after, 'total': transcript_store.count(sid)}
+
+
+def export_query(args):
+    fmt = args.get('format', 'jsonl')
+    if fmt not in EXPORT_FORMATS:
+        raise BadRequest(f'不支持的导出格式: {fmt}')
+    try:
+        kinds = parse_kinds(args.get('kind'))
+    except ValueError as e:
+        raise BadRequest(f'参数错误: {e}')
+    return fmt, kinds
+
+
+def export_headers(sid, fmt):
+    return EXPORT_FORMATS[fmt], {'Content-Disposition': f'attachment; filename=transcript-{sid}.{fmt}'}
+
+
+# ---- 管理接口与指标 ----
+
+def batching_stats(registry):
+    # 汇总各会话的分句批处理计数
+    totals = {}
+    for session in registry.active():
+        for key, value in session.translator._batcher.snapshot().items():
+            if key not in ('limit', 'latency'):
+                totals[key] = totals.get(key, 0) + value
+    return totals
+
+
+def worker_stats(registry):
+    return {'analysis': analysis_pool.snapshot(), 'summary': summary_pool.snapshot(), 'batching': batching_stats(registry),
+            'state': registry.backend.snapshot()}
+
+
+def install_metrics(registry):
+    def _queue_depths():
+        depths = {('analysis',): analysis_pool.snapshot()['queue_depth'], ('summary',): summary_pool.snapshot()['queue_depth']}
+        depths[('analysis_batch',)] = batching_stats(registry).get('pending', 0)
+        return depths
+    QUEUE_DEPTH.set_function(_queue_depths)
+    ACTIVE_SESSIONS.set_function(lambda: {(): len(registry)})
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_SPACE_RE = re.compile(r'\s+')
+_TRAILING_PUNCT = '。！？!?.，,、~～…'
+
+
+def normalize_text(text):
+    """归一化文本：去掉首尾空白与句末标点，合并空白，统一大小写"""
+    text = _SPACE_RE.sub(' ', (text or '').strip())
+    return text.rstrip(_TRAILING_PUNCT).strip().lower()
+
+
+def make_key(text, variant, model, temperature):
+    raw = json.dumps([normalize_text(text), variant, model, round(float(temperature), 3)], ensure_ascii=False)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LLMCache:
+    """大模型分析结果缓存：内存 LRU 前端 + SQLite 持久化后端，支持 TTL 与容量淘汰"""
+
+    def __init__(self, path='llm_cache.sqlite3', ttl=7 * 24 * 3600, memory_size=1024, max_rows=100000, enabled=True):
+        self.path = path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self.max_rows = max_rows
+        self.enabled = enabled
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_trim = 0
+        self.stats = {'memory_hits': 0, 'disk_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv('LLM_CACHE_PATH', 'llm_cache.sqlite3'),
+            ttl=float(os.getenv('LLM_CACHE_TTL', str(7 * 24 * 3600))),
+            memory_size=int(os.getenv('LLM_CACHE_MEMORY_SIZE', '1024')),
+            max_rows=int(os.getenv('LLM_CACHE_MAX_ROWS', '100000')),
+            enabled=os.getenv('LLM_CACHE_ENABLED', '1') not in ('0', 'false', 'False'),
+        )
+
+    def _db(self):
+        # 首次使用时才打开数据库，避免拖慢启动
+        if self._conn is None and self.path:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS llm_cache ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, model TEXT, '
+                'created_at REAL NOT NULL, accessed_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_llm_cache_accessed ON llm_cache(accessed_at)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def get(self, text, variant, models, temperature):
+        """按模型优先顺序查找缓存；models 可以是单个模型名或模型名列表"""
+        if not self.enabled:
+            return None
+        if isinstance(models, str):
+            models = (models,)
+        keys = [make_key(text, variant, model, temperature) for model in models]
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._memory.get(key)
+                if entry is None:
+                    continue
+                value, created_at = entry
+                if now - created_at <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+            try:
+                db = self._db()
+                for key in keys if db else ():
+                    row = db.execute('SELECT value, created_at FROM llm_cache WHERE key = ?', (key,)).fetchone()
+                    if row and now - row[1] <= self.ttl:
+                        db.execute('UPDATE llm_cache SET accessed_at = ? WHERE key = ?', (now, key))
+                        db.commit()
+                        self._remember(key, row[0], row[1])
+                        self.stats['disk_hits'] += 1
+                        return row[0]
+            except sqlite3.Error as e:
+                print(f"⚠️ 读取分析缓存失败: {e}")
+            self.stats['misses'] += 1
+            return None
+
+    def set(self, text, variant, model, temperature, value):
+        if not self.enabled or not value:
+            return
+        key = make_key(text, variant, model, temperature)
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self.stats['stores'] += 1
+            try:
+                db = self._db()
+                if db:
+                    db.execute(
+                        'INSERT OR REPLACE INTO llm_cache (key, value, model, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)',
+                        (key, value, model, now, now)
+                    )
+                    db.commit()
+                    self._writes_since_trim += 1
+                    if self._writes_since_trim >= 100:
+                        self._trim(db, now)
+            except sqlite3.Error as e:
+                print(f"⚠️ 写入分析缓存失败: {e}")
+
+    def _remember(self, key, value, created_at):
+        self._memory[key] = (value, created_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _trim(self, db, now):
+        self._writes_since_trim = 0
+        removed = db.execute('DELETE FROM llm_cache WHERE created_at < ?', (now - self.ttl,)).rowcount
+        removed += db.execute(
+            'DELETE FROM llm_cache WHERE key IN ('
+            'SELECT key FROM llm_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)',
+            (self.max_rows,)
+        ).rowcount
+        db.commit()
+        self.stats['evictions'] += max(removed, 0)
+
+    def flush(self):
+        """清空内存与磁盘中的全部缓存"""
+        with self._lock:
+            self._memory.clear()
+            try:
+                db = self._db()
+                if db:
+                    db.execute('DELETE FROM llm_cache')
+                    db.commit()
+            except sqlite3.Error as e:
+                print(f"⚠️ 清空分析缓存失败: {e}")
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats['memory_entries'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+        stats['hit_rate'] = round((stats['memory_hits'] + stats['disk_hits']) / lookups, 4) if lookups else 0.0
+        stats['enabled'] = self.enabled
+        return stats
@@ -0,0 +1,485 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from metrics import LLM_FALLBACKS, LLM_SECONDS, Gauge
+from workers import PriorityScheduler, Superseded
+
+BREAKER_STATES = ('closed', 'half_open', 'open')
+LLM_BREAKER_STATE = Gauge('sa_llm_breaker_state', '各模型熔断器状态（0 关闭，1 半开，2 打开）', ('model',))
+LLM_SLOTS = Gauge('sa_llm_slots', '各优先级占用与等待的大模型调用名额', ('class', 'state'))
+
+
+class LLMUnavailable(RuntimeError):
+    """全部模型都失败、熔断或超过截止时间"""
+
+
+class CircuitBreaker:
+    """连续失败 failure_threshold 次后打开，reset_timeout 秒后半开放行一次探测请求，
+    探测成功则关闭，失败则重新打开；探测在出结果之前被放弃（对冲落选、被取消）时由 abandon 让出探测名额"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def _state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.probing or time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+
+    def available(self):
+        """不占用探测名额，只判断当前是否可能放行（用于排序）"""
+        with self._lock:
+            state = self._state()
+            return state == 'closed' or (state == 'half_open' and not self.probing)
+
+    def allow(self):
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record(self, ok):
+        with self._lock:
+            if ok:
+                self.failures = 0
+                self.opened_at = None
+            else:
+                self.failures += 1
+                if self.probing or self.failures >= self.failure_threshold:
+                    self.opened_at = time.monotonic()
+            self.probing = False
+
+    def abandon(self):
+        """放行的调用没有结果就被放弃：不改变熔断状态，只让出探测名额，下次调用可以重新探测"""
+        with self._lock:
+            self.probing = False
+
+
+class EndpointStats:
+    """单个模型的调用统计：按阶段分别记录最近的耗时，用于计算对冲阈值
+
+    健康度只看最近 health_window 秒内的调用：被降级的模型不再被调用，旧的失败样本过期后自然恢复原来的顺序。
+    """
+
+    def __init__(self, window=100, health_window=60.0):
+        self.calls = 0
+        self.failures = 0
+        self.wins = 0
+        self.health_window = health_window
+        self.recent = deque(maxlen=window)  # 最近调用的 (时间, 是否成功)
+        self.latencies = {}
+
+    def record(self, stage, elapsed, ok):
+        self.calls += 1
+        self.recent.append((time.monotonic(), ok))
+        if ok:
+            self.latencies.setdefault(stage, deque(maxlen=self.recent.maxlen)).append(elapsed)
+        else:
+            self.failures += 1
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.health_window
+        while self.recent and self.recent[0][0] < cutoff:
+            self.recent.popleft()
+
+    def health_samples(self):
+        self._expire()
+        return len(self.recent)
+
+    def error_rate(self):
+        self._expire()
+        if not self.recent:
+            return 0.0
+        return 1 - sum(ok for _, ok in self.recent) / len(self.recent)
+
+    def percentile(self, stage, q):
+        samples = self.latencies.get(stage)
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+    def samples(self, stage):
+        return len(self.latencies.get(stage, ()))
+
+    def snapshot(self):
+        return {
+            'calls': self.calls,
+            'failures': self.failures,
+            'wins': self.wins,
+            'error_rate': round(self.error_rate(), 4),
+            'p50_latency': {s: round(self.percentile(s, 0.5), 4) for s in self.latencies},
+            'p95_latency': {s: round(self.percentile(s, 0.95), 4) for s in self.latencies},
+        }
+
+
+class ModelEndpoint:
+    """一个模型入口：call(request, timeout) 返回生成的文本，失败时抛出异常；
+    call_async 缺省时在线程中执行 call"""
+
+    def __init__(self, name, call, call_async=None, breaker=None):
+        self.name = name
+        self.call = call
+        self._call_async = call_async
+        self.breaker = breaker or CircuitBreaker()
+
+    async def call_async(self, request, timeout):
+        if self._call_async is not None:
+            return await self._call_async(request, timeout)
+        return await asyncio.to_thread(self.call, request, timeout)
+
+
+class LLMRequest:
+    """一次路由调用的参数：chat 类模型用 messages，Generation 类模型用 prompt；
+    alive 返回 False 表示发起方已被重置，不再需要结果
+
+    每次尝试的副本带有截止时间 deadline_at 与取消标记：模型入口在流式读取时检查 expired()，
+    并可把关闭连接的函数登记到 on_cancel，落选或超时的尝试被放弃时立即断开，不再占用线程。
+    """
+
+    def __init__(self, stage, messages, prompt, temperature, on_delta=None, alive=None):
+        self.stage = stage
+        self.messages = messages
+        self.prompt = prompt
+        self.temperature = temperature
+        self._on_delta = on_delta
+        self.alive = alive
+        self.progressed = threading.Event()
+        self.finished = False
+        self.deadline_at = None
+        self.cancelled = threading.Event()
+        self.on_cancel = None
+
+    def expired(self):
+        return self.cancelled.is_set() or (self.deadline_at is not None and time.monotonic() >= self.deadline_at)
+
+    def cancel(self):
+        self.cancelled.set()
+        closer = self.on_cancel
+        if closer is not None:
+            try:
+                closer()
+            except Exception:
+                pass
+
+    def for_attempt(self, deadline_at=None):
+        """每次尝试独立的副本：已有输出说明模型在正常生成，不再对冲；结果确定后丢弃落选者的增量"""
+        attempt = LLMRequest(self.stage, self.messages, self.prompt, self.temperature)
+        attempt.deadline_at = deadline_at
+        if self._on_delta is not None:
+            def _on_delta(partial):
+                attempt.progressed.set()
+                if not self.finished and (self.alive is None or self.alive()):
+                    self._on_delta(partial)
+            attempt.on_delta = _on_delta
+        else:
+            attempt.on_delta = None
+        return attempt
+
+
+class ModelRouter:
+    """在多个模型之间路由一次调用：
+
+    - 按健康状况排序：熔断中的模型排到最后并直接跳过，最近 health_window 秒内至少有 min_health_samples 次调用
+      且错误率超过 unhealthy_rate 的模型排在健康模型之后，其余保持配置顺序（首个为主模型）
+    - 对冲：主模型超过它在该阶段的 hedge_percentile 分位耗时（样本不足时为 hedge_delay）仍没有任何输出，
+      就同时启动下一个模型，先成功者胜出；主模型报错时立即改用下一个
+    - 截止时间：整个调用不超过该阶段的 deadline，每次尝试的超时取剩余时间，超时视为失败
+    - 排队：配置了 scheduler 时，每次调用先按阶段所属的优先级取得名额（排队时间计入截止时间）；
+      发起方已重置的调用在排队中直接丢弃，调用结束时已重置的结果也不再返回，两者都抛出 Superseded
+    """
+
+    def __init__(self, endpoints, deadline=30.0, stage_deadlines=None, hedge_percentile=0.95, hedge_delay=5.0,
+                 min_hedge_delay=1.0, min_samples=20, unhealthy_rate=0.5, health_window=60.0, min_health_samples=3,
+                 max_workers=16, scheduler=None, stage_classes=None):
+        self.endpoints = list(endpoints)
+        self.deadline = deadline
+        self.stage_deadlines = dict(stage_deadlines or {})
+        self.hedge_percentile = hedge_percentile
+        self.hedge_delay = hedge_delay
+        self.min_hedge_delay = min_hedge_delay
+        self.min_samples = min_samples
+        self.unhealthy_rate = unhealthy_rate
+        self.min_health_samples = min_health_samples
+        self.max_workers = max_workers
+        self.scheduler = scheduler
+        self.stage_classes = dict(stage_classes or {})
+        self._stats = {e.name: EndpointStats(health_window=health_window) for e in self.endpoints}
+        self._lock = threading.Lock()
+        self._pool = None
+        LLM_BREAKER_STATE.set_function(self._breaker_states)
+        LLM_SLOTS.set_function(self._slot_states)
+
+    @classmethod
+    def from_env(cls, endpoints, stages=(), stage_classes=None):
+        failure_threshold = int(os.getenv('LLM_BREAKER_FAILURES', '5'))
+        reset_timeout = float(os.getenv('LLM_BREAKER_RESET', '30'))
+        for endpoint in endpoints:
+            endpoint.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        deadline = float(os.getenv('LLM_DEADLINE', '30'))
+        return cls(
+            endpoints,
+            deadline=deadline,
+            # 例如 LLM_DEADLINE_SEGMENT=8 收紧分句分析的截止时间
+            stage_deadlines={s: float(os.getenv(f'LLM_DEADLINE_{s.upper()}', deadline)) for s in stages},
+            hedge_percentile=float(os.getenv('LLM_HEDGE_PERCENTILE', '0.95')),
+            hedge_delay=float(os.getenv('LLM_HEDGE_DELAY', '5')),
+            min_hedge_delay=float(os.getenv('LLM_HEDGE_MIN_DELAY', '1')),
+            min_samples=int(os.getenv('LLM_HEDGE_MIN_SAMPLES', '20')),
+            unhealthy_rate=float(os.getenv('LLM_UNHEALTHY_RATE', '0.5')),
+            health_window=float(os.getenv('LLM_HEALTH_WINDOW', '60')),
+            min_health_samples=int(os.getenv('LLM_HEALTH_MIN_SAMPLES', '3')),
+            max_workers=int(os.getenv('LLM_WORKERS', '16')),
+            scheduler=PriorityScheduler.from_env(),
+            stage_classes=stage_classes,
+        )
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='llm')
+            return self._pool
+
+    def _breaker_states(self):
+        return {(e.name,): BREAKER_STATES.index(e.breaker.state) for e in self.endpoints}
+
+    def _slot_states(self):
+        if self.scheduler is None:
+            return {}
+        classes = self.scheduler.snapshot()['classes']
+        return {(k, state): v[state] for k, v in classes.items() for state in ('active', 'waiting')}
+
+    def ordered(self):
+        """当前的尝试顺序（熔断中的模型排在最后）"""
+        with self._lock:
+            unhealthy = {
+                name: stats.health_samples() >= self.min_health_samples and stats.error_rate() > self.unhealthy_rate
+                for name, stats in self._stats.items()
+            }
+        return sorted(self.endpoints, key=lambda e: (not e.breaker.available(), unhealthy[e.name]))
+
+    def hedge_after(self, endpoint, stage):
+        """主模型在该阶段的对冲阈值"""
+        with self._lock:
+            stats = self._stats[endpoint.name]
+            if stats.samples(stage) < self.min_samples:
+                return self.hedge_delay
+            return max(self.min_hedge_delay, stats.percentile(stage, self.hedge_percentile))
+
+    def _record(self, endpoint, stage, elapsed, ok):
+        endpoint.breaker.record(ok)
+        with self._lock:
+            self._stats[endpoint.name].record(stage, elapsed, ok)
+        LLM_SECONDS.observe(elapsed, model=endpoint.name, outcome='ok' if ok else 'error')
+
+    def _run(self, endpoint, request, timeout):
+        start = time.monotonic()
+        try:
+            text = endpoint.call(request, timeout)
+        except Exception as e:
+            if request.cancelled.is_set() and time.monotonic() < request.deadline_at:
+                # 截止时间前被放弃（对冲落选），不算模型失败；超过截止时间仍算
+                endpoint.breaker.abandon()
+                raise
+            self._record(endpoint, request.stage, time.monotonic() - start, False)
+            print(f"⚠️ 模型 {endpoint.name} 调用失败: {e}")
+            raise
+        self._record(endpoint, request.stage, time.monotonic() - start, True)
+        return text
+
+    async def _run_async(self, endpoint, request, timeout):
+        start = time.monotonic()
+        try:
+            text = await asyncio.wait_for(endpoint.call_async(request, timeout), timeout)
+        except asyncio.CancelledError:
+            endpoint.breaker.abandon()
+            raise
+        except Exception as e:
+            self._record(endpoint, request.stage, time.monotonic() - start, False)
+            print(f"⚠️ 模型 {endpoint.name} 调用失败: {e!r}")
+            raise
+        self._record(endpoint, request.stage, time.monotonic() - start, True)
+        return text
+
+    def _win(self, endpoint, request):
+        request.finished = True
+        with self._lock:
+            self._stats[endpoint.name].wins += 1
+        return endpoint.name
+
+    def _next(self, waiting, request, reason, primary):
+        """取出下一个熔断器放行的模型"""
+        while waiting:
+            endpoint = waiting.pop(0)
+            if endpoint.breaker.allow():
+                if endpoint is not primary:
+                    LLM_FALLBACKS.inc(stage=request.stage, reason=reason)
+                return endpoint
+        return None
+
+    def call(self, stage, messages, prompt, temperature, on_delta=None, deadline=None, alive=None):
+        """返回 (文本, 模型名)；全部失败时抛出 LLMUnavailable，发起方已重置时抛出 Superseded"""
+        request = LLMRequest(stage, messages, prompt, temperature, on_delta, alive)
+        budget = deadline or self.stage_deadlines.get(stage, self.deadline)
+        deadline_at = time.monotonic() + budget
+        klass = self.stage_classes.get(stage)
+        if self.scheduler is None or klass is None:
+            return self._call(request, deadline_at)
+        if not self.scheduler.acquire(klass, alive, budget):
+            raise LLMUnavailable(f'{stage} 排队超过截止时间')
+        try:
+            result = self._call(request, deadline_at)
+        finally:
+            self.scheduler.release(klass)
+        if alive is not None and not alive():
+            raise Superseded()
+        return result
+
+    def _call(self, request, deadline_at):
+        stage = request.stage
+        waiting = self.ordered()
+        primary = self.endpoints[0]
+        pool = self._executor()
+        running = {}
+        reason = 'unhealthy' if waiting[0] is not primary else None
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    raise LLMUnavailable(f'{stage} 调用超过截止时间')
+                if not running:
+                    endpoint = self._next(waiting, request, reason or 'error', primary)
+                    if endpoint is None:
+                        raise LLMUnavailable(f'{stage} 没有可用的模型')
+                    attempt = request.for_attempt(deadline_at)
+                    running[pool.submit(self._run, endpoint, attempt, deadline_at - now)] = (endpoint, attempt, now)
+                wake = deadline_at
+                hedge_at = None
+                if waiting and len(running) == 1:
+                    endpoint, attempt, started = next(iter(running.values()))
+                    if not attempt.progressed.is_set():
+                        hedge_at = started + self.hedge_after(endpoint, stage)
+                        wake = min(wake, hedge_at)
+                done, _ = wait(list(running), timeout=max(wake - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    endpoint, _, _ = running.pop(fut)
+                    if fut.exception() is None:
+                        return fut.result(), self._win(endpoint, request)
+                    reason = 'error'
+                if not done and hedge_at is not None and time.monotonic() >= hedge_at \
+                        and not next(iter(running.values()))[1].progressed.is_set():
+                    endpoint = self._next(waiting, request, 'slow', primary)
+                    if endpoint is not None:
+                        attempt = request.for_attempt(deadline_at)
+                        now = time.monotonic()
+                        running[pool.submit(self._run, endpoint, attempt, deadline_at - now)] = (endpoint, attempt, now)
+        finally:
+            # 落选或超时的尝试：还在排队的直接取消，已开始的断开连接，尽快让出线程
+            request.finished = True
+            for fut, (endpoint, attempt, _) in running.items():
+                if fut.cancel():
+                    # 还没开始就被取消，_run 不会执行，由这里让出探测名额
+                    endpoint.breaker.abandon()
+                attempt.cancel()
+
+    async def call_async(self, stage, messages, prompt, temperature, on_delta=None, deadline=None, alive=None):
+        """call 的协程版本，供 ASGI 模式使用"""
+        request = LLMRequest(stage, messages, prompt, temperature, on_delta, alive)
+        budget = deadline or self.stage_deadlines.get(stage, self.deadline)
+        deadline_at = time.monotonic() + budget
+        klass = self.stage_classes.get(stage)
+        if self.scheduler is None or klass is None:
+            return await self._call_async(request, deadline_at)
+        if not await self.scheduler.acquire_async(klass, alive, budget):
+            raise LLMUnavailable(f'{stage} 排队超过截止时间')
+        try:
+            result = await self._call_async(request, deadline_at)
+        finally:
+            self.scheduler.release(klass)
+        if alive is not None and not alive():
+            raise Superseded()
+        return result
+
+    async def _call_async(self, request, deadline_at):
+        stage = request.stage
+        loop = asyncio.get_running_loop()
+        waiting = self.ordered()
+        primary = self.endpoints[0]
+        running = {}
+        reason = 'unhealthy' if waiting[0] is not primary else None
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline_at:
+                    raise LLMUnavailable(f'{stage} 调用超过截止时间')
+                if not running:
+                    endpoint = self._next(waiting, request, reason or 'error', primary)
+                    if endpoint is None:
+                        raise LLMUnavailable(f'{stage} 没有可用的模型')
+                    attempt = request.for_attempt(deadline_at)
+                    task = loop.create_task(self._run_async(endpoint, attempt, deadline_at - now))
+                    running[task] = (endpoint, attempt, now)
+                wake = deadline_at
+                hedge_at = None
+                if waiting and len(running) == 1:
+                    endpoint, attempt, started = next(iter(running.values()))
+                    if not attempt.progressed.is_set():
+                        hedge_at = started + self.hedge_after(endpoint, stage)
+                        wake = min(wake, hedge_at)
+                done, _ = await asyncio.wait(list(running), timeout=max(wake - time.monotonic(), 0),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    endpoint, _, _ = running.pop(task)
+                    if task.exception() is None:
+                        return task.result(), self._win(endpoint, request)
+                    reason = 'error'
+                if not done and hedge_at is not None and time.monotonic() >= hedge_at \
+                        and not next(iter(running.values()))[1].progressed.is_set():
+                    endpoint = self._next(waiting, request, 'slow', primary)
+                    if endpoint is not None:
+                        attempt = request.for_attempt(deadline_at)
+                        now = time.monotonic()
+                        task = loop.create_task(self._run_async(endpoint, attempt, deadline_at - now))
+                        running[task] = (endpoint, attempt, now)
+        finally:
+            request.finished = True
+            for task, (endpoint, attempt, _) in running.items():
+                attempt.cancelled.set()
+                task.cancel()
+                # 还没开始运行的任务被取消时不会进入 _run_async，这里同样让出探测名额
+                endpoint.breaker.abandon()
+
+    def snapshot(self):
+        order = [e.name for e in self.ordered()]
+        with self._lock:
+            models = {name: stats.snapshot() for name, stats in self._stats.items()}
+        for endpoint in self.endpoints:
+            models[endpoint.name]['breaker'] = endpoint.breaker.state
+        return {
+            'order': order,
+            'deadline': self.deadline,
+            'stage_deadlines': self.stage_deadlines,
+            'hedge_percentile': self.hedge_percentile,
+            'hedge_delay': self.hedge_delay,
+            'models': models,
+            'scheduler': self.scheduler.snapshot() if self.scheduler is not None else None,
+        }
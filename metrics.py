@@ -0,0 +1,170 @@
+"""轻量的进程内指标：直方图、计数器与仪表，按 Prometheus 文本格式输出
+
+只依赖标准库；每次记录只做一次二分查找和加法，可放在热路径上。
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labels)
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} 需要标签 {self.labelnames}，实际为 {tuple(labels)}')
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        lines.extend(self._samples())
+        return '\n'.join(lines)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {v}' for k, v in items]
+
+
+class Gauge(_Metric):
+    """仪表：可直接 set，也可注册回调在输出时取值（回调返回 {标签值元组: 数值}）"""
+
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labels=()):
+        super().__init__(name, documentation, labels)
+        self._values = {}
+        self._callbacks = []
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def set_function(self, fn):
+        self._callbacks.append(fn)
+
+    def _samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for fn in self._callbacks:
+            try:
+                values.update(fn())
+            except Exception as e:
+                print(f"⚠️ 指标回调出错({self.name}): {e}")
+        return [f'{self.name}{_format_labels(self.labelnames, k)} {v}' for k, v in sorted(values.items())]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][idx] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """记录代码块耗时；直方图带 outcome 标签时自动填入 ok / error"""
+        start = time.perf_counter()
+        outcome = 'ok'
+        try:
+            yield
+        except BaseException:
+            outcome = 'error'
+            raise
+        finally:
+            if 'outcome' in self.labelnames:
+                labels['outcome'] = outcome
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        lines = []
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", bound))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        return '\n'.join(m.render() for m in metrics) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# 各处理阶段：mic_open、calibration、capture、asr、manual_stop、summary 等
+STAGE_SECONDS = Histogram('sa_stage_seconds', '各处理阶段耗时（秒）', ('stage', 'outcome'))
+ASR_SECONDS = Histogram('sa_asr_backend_seconds', '各语音识别后端单次调用耗时（秒）', ('backend', 'outcome'))
+LLM_SECONDS = Histogram('sa_llm_seconds', '各大模型单次调用耗时（秒）', ('model', 'outcome'))
+SSE_LAG_SECONDS = Histogram('sa_sse_delivery_lag_seconds', '事件从发布到写出 SSE 的延迟（秒）', ('event',))
+# reason：error 主模型出错，slow 主模型过慢触发对冲，unhealthy 主模型熔断或错误率过高
+LLM_FALLBACKS = Counter('sa_llm_fallbacks_total', '启用备用模型的次数', ('stage', 'reason'))
+# outcome：hit 本地直接作答，miss 未匹配，partial 覆盖率不足，ambiguous 条目冲突或含排除词
+FAST_PATH = Counter('sa_fast_path_total', '本地短语词典的匹配结果', ('stage', 'outcome'))
+FAILURES = Counter('sa_failures_total', '各阶段最终失败的次数', ('stage',))
+QUEUE_DEPTH = Gauge('sa_queue_depth', '后台线程池排队任务数', ('pool',))
+ACTIVE_SESSIONS = Gauge('sa_active_sessions', '当前会话数')
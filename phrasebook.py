@@ -0,0 +1,231 @@
+"""常用客套话的本地快速判定：在调用大模型前用多模式匹配自动机（Aho-Corasick）查短语词典
+
+词典（默认 phrases.json）中每个条目是一组短语及其类型、真实意图和建议回应模板。只有把握足够的
+匹配才直接作答——匹配到的短语覆盖了整句话的大部分、没有命中排除词、也没有与其他类型的条目冲突；
+其余文本照常交给大模型。词典文件修改后自动重新加载。
+"""
+import json
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import FAST_PATH
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'phrases.json')
+
+# 与大模型输出一致的两种格式：分句分析（连续转写）与单次翻译
+_TEMPLATES = {
+    'segment': '类型：{type}\n真实意图：{intent}\n建议回应：{reply}',
+    'translate': '分析: {analysis}\n类型: {type}\n真实意图: {intent}\n建议回应: {reply}',
+}
+
+
+def clean_text(text):
+    """只保留文字和数字（统一小写），匹配与覆盖率都在清洗后的文本上计算"""
+    return ''.join(ch for ch in (text or '').lower() if ch.isalnum())
+
+
+class PhraseAutomaton:
+    """Aho-Corasick 自动机：一次扫描找出文本中出现的全部短语，耗时只与文本长度有关"""
+
+    def __init__(self, phrases):
+        # phrases: [(短语, 值)]；节点以列表存储：goto 字典、失配指针、输出 [(短语长度, 值)]
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for phrase, value in phrases:
+            node = 0
+            for ch in phrase:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                node = nxt
+            self._out[node].append((len(phrase), value))
+        self._build_links()
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                # 后缀上的短语也算匹配
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def __len__(self):
+        return len(self._goto)
+
+    def find(self, text):
+        """返回 [(起始位置, 结束位置, 值)]"""
+        matches = []
+        node = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for length, value in out[node]:
+                matches.append((i + 1 - length, i + 1, value))
+        return matches
+
+
+class PhraseBook:
+    """可热更新的短语词典；lookup 命中时返回与大模型相同格式的分析文本，否则返回 None"""
+
+    def __init__(self, path=DEFAULT_PATH, min_coverage=0.6, reload_interval=5.0, enabled=True):
+        self.path = path
+        self.min_coverage = min_coverage
+        self.reload_interval = reload_interval
+        self.enabled = enabled and bool(path)
+        self._lock = threading.Lock()
+        self._automaton = None
+        self._entries = []
+        self._mtime = None
+        self._checked_at = 0.0
+        self._loaded_at = None
+        self.stats = {}
+        self._lookup_seconds = 0.0
+        self._lookups = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv('PHRASEBOOK_PATH', DEFAULT_PATH),
+            min_coverage=float(os.getenv('PHRASEBOOK_MIN_COVERAGE', '0.6')),
+            reload_interval=float(os.getenv('PHRASEBOOK_RELOAD_INTERVAL', '5')),
+            enabled=os.getenv('PHRASEBOOK_ENABLED', '1') not in ('0', 'false', 'False'),
+        )
+
+    def reload(self):
+        """重新读取词典文件；文件有误时保留原词典并返回 False"""
+        try:
+            mtime = os.path.getmtime(self.path)
+            with open(self.path, encoding='utf-8') as f:
+                raw = json.load(f)
+            entries, phrases = self._compile(raw)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ 加载短语词典失败，继续使用原词典: {e}")
+            return False
+        automaton = PhraseAutomaton(phrases)
+        with self._lock:
+            self._automaton, self._entries = automaton, entries
+            self._mtime, self._loaded_at = mtime, time.time()
+        print(f"📖 已加载短语词典: {len(entries)} 个条目，{len(phrases)} 个短语")
+        return True
+
+    def _compile(self, raw):
+        entries, phrases = [], []
+        for i, item in enumerate(raw.get('entries', [])):
+            entry = {
+                'id': item.get('id') or f'entry_{i}',
+                'type': item['type'],
+                'intent': item['intent'],
+                'reply': item['reply'],
+                'analysis': item.get('analysis') or f"常见{item['type']}，{item['intent']}",
+                'exclude': [clean_text(w) for w in item.get('exclude', []) if clean_text(w)],
+                'min_coverage': float(item.get('min_coverage', self.min_coverage)),
+            }
+            # 提前渲染一次，模板里有未知占位符时整个词典加载失败，而不是等到命中时才报错
+            for template in _TEMPLATES.values():
+                self._render(template, entry, '', '')
+            for phrase in item['phrases']:
+                cleaned = clean_text(phrase)
+                if not cleaned:
+                    raise ValueError(f"条目 {entry['id']} 含空短语")
+                phrases.append((cleaned, len(entries)))
+            entries.append(entry)
+        return entries, phrases
+
+    @staticmethod
+    def _render(template, entry, phrase, text):
+        fields = {k: entry[k].format(phrase=phrase, text=text) for k in ('type', 'intent', 'reply', 'analysis')}
+        return template.format(**fields)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._automaton is not None and now - self._checked_at < self.reload_interval:
+            return
+        self._checked_at = now
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            mtime = None
+        if self._automaton is None or (mtime is not None and mtime != self._mtime):
+            if not self.reload() and self._automaton is None:
+                # 首次加载就失败时用空词典，避免每次查询都重新读文件
+                self._automaton, self._entries = PhraseAutomaton([]), []
+
+    def match(self, text):
+        """返回 (结果, 条目, 短语)；结果为 hit / miss / partial（覆盖率不足）/ ambiguous（冲突或含排除词）"""
+        self._maybe_reload()
+        with self._lock:
+            automaton, entries = self._automaton, self._entries
+        cleaned = clean_text(text)
+        if not cleaned or not entries:
+            return 'miss', None, None
+        covered, longest = {}, {}
+        for start, end, index in automaton.find(cleaned):
+            covered.setdefault(index, set()).update(range(start, end))
+            if end - start > len(longest.get(index, '')):
+                longest[index] = cleaned[start:end]
+        if not covered:
+            return 'miss', None, None
+        index = max(covered, key=lambda k: len(covered[k]))
+        entry = entries[index]
+        if any(entries[k]['type'] != entry['type'] for k in covered):
+            return 'ambiguous', entry, None
+        if any(word in cleaned for word in entry['exclude']):
+            return 'ambiguous', entry, None
+        phrase = longest[index]
+        if len(covered[index]) / len(cleaned) < entry['min_coverage']:
+            return 'partial', entry, phrase
+        return 'hit', entry, phrase
+
+    def lookup(self, text, stage):
+        """stage 为 segment 或 translate；命中时返回分析文本"""
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        outcome, entry, phrase = self.match(text)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            counts = self.stats.setdefault(stage, {'hit': 0, 'miss': 0, 'partial': 0, 'ambiguous': 0})
+            counts[outcome] += 1
+            self._lookups += 1
+            self._lookup_seconds += elapsed
+        FAST_PATH.inc(stage=stage, outcome=outcome)
+        if outcome != 'hit':
+            return None
+        return self._render(_TEMPLATES[stage], entry, phrase, text)
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self.stats.items()}
+            lookups, seconds = self._lookups, self._lookup_seconds
+            entries = len(self._entries)
+            loaded_at = self._loaded_at
+        for counts in stages.values():
+            total = sum(counts.values())
+            counts['hit_rate'] = round(counts['hit'] / total, 4) if total else 0.0
+        hits = sum(c['hit'] for c in stages.values())
+        return {
+            'enabled': self.enabled,
+            'path': self.path,
+            'entries': entries,
+            'loaded_at': loaded_at,
+            'stages': stages,
+            'hit_rate': round(hits / lookups, 4) if lookups else 0.0,
+            # 每次命中都省掉一次大模型调用（快速判定先于分析缓存）
+            'llm_calls_saved': hits,
+            'avg_lookup_us': round(seconds / lookups * 1e6, 2) if lookups else 0.0,
+        }
@@ -0,0 +1,600 @@
+"""会话状态后端：结果槽（结果、处理标记、版本号）与事件通道放在哪里
+
+- memory（默认）：进程内对象，单进程部署时与原来完全相同
+- sqlite：多个工作进程共享的 SQLite（WAL）文件。结果与事件写入数据库，事件ID全局递增，
+  任一进程都能响应任一会话的 /get_result、/stream_result、/events（含 Last-Event-ID 补发）。
+  本进程的写入立即唤醒本进程的等待者；其他进程的写入由每个进程一个后台线程每
+  STATE_POLL_INTERVAL 秒检查 PRAGMA data_version 发现，再只唤醒有变化的会话
+
+处理标记记录持有者进程号与开始时间：持有者进程已退出或超过 STATE_CLAIM_TIMEOUT 秒的标记视为已释放，
+工作进程崩溃或被回收后会话不会一直停留在处理中。停止连续转写、重置会话可以落在任一进程：
+它们清除共享的转写标记并把会话的重置代次加一，正在采集或分析的进程发现后自行停止并丢弃重置前的工作。
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from events import AsyncWaiters, EventChannel, EventTopic
+
+
+class ResultSlot:
+    """进程内的结果槽：结果每次变化（含处理状态结束）版本号加一，并唤醒等待的连接"""
+
+    shared = False
+
+    def __init__(self):
+        self.result = None
+        self.processing = False
+        self.version = 0
+        # ETag 中带上随机的会话纪元，服务重启或重建会话后旧的 ETag 不会误匹配
+        self.epoch = uuid.uuid4().hex[:8]
+        self._cond = threading.Condition()
+        self._waiters = AsyncWaiters()
+
+    def _bump(self):
+        self.version += 1
+        self._cond.notify_all()
+
+    def set(self, result):
+        with self._cond:
+            self.result = result
+            self._bump()
+        self._waiters.notify()
+
+    def set_processing(self, processing):
+        with self._cond:
+            self.processing = processing
+
+    def try_begin(self):
+        with self._cond:
+            if self.processing:
+                return False
+            self.processing = True
+            return True
+
+    def end(self):
+        # 处理状态变化同样算一次结果更新
+        with self._cond:
+            self.processing = False
+            self._bump()
+        self._waiters.notify()
+
+    def touch(self):
+        pass
+
+    def state(self):
+        with self._cond:
+            return self.version, self.processing, self.result
+
+    def wait(self, after_version, timeout):
+        with self._cond:
+            self._cond.wait_for(lambda: self.version > after_version, timeout=timeout)
+            return self.version, self.processing, self.result
+
+    async def wait_async(self, after_version, timeout):
+        await self._waiters.wait_for(lambda: self.version > after_version, timeout)
+        return self.state()
+
+
+class MemoryBackend:
+    name = 'memory'
+    shared = False
+
+    def result_slot(self, sid):
+        return ResultSlot()
+
+    def event_channel(self, sid):
+        return EventChannel()
+
+    def snapshot(self):
+        return {'backend': self.name}
+
+
+class _Signal:
+    """某个会话在本进程内的等待者（线程与协程）"""
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.waiters = AsyncWaiters()
+
+    def notify(self):
+        with self.cond:
+            self.cond.notify_all()
+        self.waiters.notify()
+
+    def wait(self, predicate, timeout):
+        with self.cond:
+            return self.cond.wait_for(predicate, timeout=timeout)
+
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS session_state (
+    sid TEXT PRIMARY KEY, epoch TEXT NOT NULL, version INTEGER NOT NULL DEFAULT 0,
+    processing INTEGER NOT NULL DEFAULT 0, streaming INTEGER NOT NULL DEFAULT 0, result TEXT,
+    change_id INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL, owner_pid INTEGER, claimed_at REAL,
+    reset_gen INTEGER NOT NULL DEFAULT 0);
+CREATE INDEX IF NOT EXISTS idx_session_state_change ON session_state(change_id);
+CREATE INDEX IF NOT EXISTS idx_session_state_updated ON session_state(updated_at);
+CREATE TABLE IF NOT EXISTS session_event (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, sid TEXT NOT NULL, type TEXT NOT NULL,
+    data TEXT NOT NULL, ts REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_session_event_sid ON session_event(sid, id);
+CREATE INDEX IF NOT EXISTS idx_session_event_ts ON session_event(ts);
+'''
+
+# 旧版本创建的数据库文件缺少的列
+_MIGRATIONS = (
+    ('session_state', 'owner_pid', 'INTEGER'),
+    ('session_state', 'claimed_at', 'REAL'),
+    ('session_state', 'reset_gen', 'INTEGER NOT NULL DEFAULT 0'),
+)
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # Windows 上 os.kill 会结束目标进程，只依靠超时判断
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+class SqliteBackend:
+    """多进程共享的会话状态：SQLite（WAL）存储 + 每进程一个变更检查线程"""
+
+    name = 'sqlite'
+    shared = True
+
+    def __init__(self, path='session_state.sqlite3', poll_interval=0.05, replay_size=None, retention=86400,
+                 claim_timeout=300):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.replay_size = replay_size or int(os.getenv('EVENTS_REPLAY_SIZE', '500'))
+        self.retention = retention
+        self.claim_timeout = claim_timeout
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+        self._signals = {}
+        self._signals_lock = threading.Lock()
+        self._writes_since_trim = 0
+        # 本进程持有的会话的纪元：会话行被保留期清理删除后按原纪元重建，已发出的 ETag 仍然有效
+        self._epochs = {}
+        # 有连接的会话最多每隔这么久刷新一次 updated_at，不会被保留期清理
+        self.touch_interval = min(60.0, retention / 10) if retention > 0 else None
+        self.stats = {'local_wakeups': 0, 'remote_wakeups': 0, 'polls': 0, 'stale_claims': 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv('STATE_PATH', 'session_state.sqlite3'),
+            poll_interval=float(os.getenv('STATE_POLL_INTERVAL', '0.05')),
+            retention=float(os.getenv('STATE_RETENTION', '86400')),
+            claim_timeout=float(os.getenv('STATE_CLAIM_TIMEOUT', '300')),
+        )
+
+    def _connect(self):
+        # 自动提交模式，多语句写入显式使用 BEGIN IMMEDIATE；其他进程持有写锁时最多等待 10 秒
+        conn = sqlite3.connect(self.path, timeout=10, check_same_thread=False, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    def _db(self):
+        # 首次使用时才打开；预加载后 fork 出的工作进程不能沿用父进程的连接与检查线程
+        if self._conn is None or self._pid != os.getpid():
+            conn = self._connect()
+            conn.executescript(_SCHEMA)
+            self._migrate(conn)
+            self._conn, self._pid = conn, os.getpid()
+            self._signals = {}
+            threading.Thread(target=self._watch, name='state-watch', daemon=True).start()
+        return self._conn
+
+    def _migrate(self, conn):
+        for table, column, decl in _MIGRATIONS:
+            columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+            if column in columns:
+                continue
+            try:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+            except sqlite3.OperationalError as e:
+                # 多个进程同时启动时可能已被别的进程加上
+                if 'duplicate column' not in str(e):
+                    raise
+
+    def _read(self, sql, args):
+        with self._lock:
+            return self._db().execute(sql, args).fetchall()
+
+    def _write(self, sid, work):
+        with self._lock:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                result = work(db)
+                db.execute('COMMIT')
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            self._writes_since_trim += 1
+            if self._writes_since_trim >= 1000:
+                self._trim(db)
+        self.stats['local_wakeups'] += 1
+        self._signal(sid).notify()
+        return result
+
+    def _trim(self, db):
+        # 超过保留期没有更新的会话及其事件一并删除
+        self._writes_since_trim = 0
+        if self.retention > 0:
+            cutoff = time.time() - self.retention
+            db.execute('DELETE FROM session_event WHERE ts < ?', (cutoff,))
+            db.execute('DELETE FROM session_state WHERE updated_at < ?', (cutoff,))
+
+    def _signal(self, sid):
+        with self._signals_lock:
+            signal = self._signals.get(sid)
+            if signal is None:
+                signal = self._signals[sid] = _Signal()
+            return signal
+
+    def forget(self, sid):
+        with self._signals_lock:
+            signal = self._signals.pop(sid, None)
+            self._epochs.pop(sid, None)
+        if signal is not None:
+            signal.notify()
+
+    def _watch(self):
+        """检查其他进程的写入：data_version 变化后找出有新事件或新结果的会话，只唤醒这些会话"""
+        pid = os.getpid()
+        conn = self._connect()
+        last_event = conn.execute('SELECT COALESCE(MAX(id), 0) FROM session_event').fetchone()[0]
+        last_change = conn.execute('SELECT COALESCE(MAX(change_id), 0) FROM session_state').fetchone()[0]
+        data_version = None
+        while self._pid == pid:
+            time.sleep(self.poll_interval)
+            try:
+                current = conn.execute('PRAGMA data_version').fetchone()[0]
+                if current == data_version:
+                    continue
+                data_version = current
+                self.stats['polls'] += 1
+                changed = set()
+                for sid, event_id in conn.execute(
+                        'SELECT sid, MAX(id) FROM session_event WHERE id > ? GROUP BY sid', (last_event,)):
+                    changed.add(sid)
+                    last_event = max(last_event, event_id)
+                for sid, change_id in conn.execute(
+                        'SELECT sid, change_id FROM session_state WHERE change_id > ?', (last_change,)):
+                    changed.add(sid)
+                    last_change = max(last_change, change_id)
+            except sqlite3.Error as e:
+                print(f"⚠️ 检查共享会话状态失败: {e}")
+                continue
+            with self._signals_lock:
+                signals = [self._signals[sid] for sid in changed if sid in self._signals]
+            for signal in signals:
+                self.stats['remote_wakeups'] += 1
+                signal.notify()
+
+    # ---- 结果槽 ----
+
+    def ensure_session(self, sid):
+        """会话行不存在时创建，返回会话纪元（所有进程一致）"""
+        def work(db):
+            self._ensure_row(db, sid)
+            return db.execute('SELECT epoch FROM session_state WHERE sid = ?', (sid,)).fetchone()[0]
+        epoch = self._write(sid, work)
+        with self._signals_lock:
+            self._epochs[sid] = epoch
+        return epoch
+
+    def _ensure_row(self, db, sid):
+        # 本进程仍持有的会话，其行可能已超过保留期被删除：写入前按原纪元重建。旧版本号已随行删除，
+        # 重建后的版本号从当前毫秒时间起算，不会小于客户端手里的旧版本号
+        with self._signals_lock:
+            epoch = self._epochs.get(sid)
+        now = time.time()
+        if epoch is None:
+            db.execute('INSERT OR IGNORE INTO session_state (sid, epoch, updated_at) VALUES (?, ?, ?)',
+                       (sid, uuid.uuid4().hex[:8], now))
+        else:
+            db.execute('INSERT OR IGNORE INTO session_state (sid, epoch, version, updated_at) VALUES (?, ?, ?, ?)',
+                       (sid, epoch, int(now * 1000), now))
+
+    def touch(self, sid):
+        def work(db):
+            self._ensure_row(db, sid)
+            db.execute('UPDATE session_state SET updated_at = ? WHERE sid = ?', (time.time(), sid))
+        self._write(sid, work)
+
+    def load_state(self, sid):
+        rows = self._read('SELECT version, processing, owner_pid, claimed_at, result FROM session_state WHERE sid = ?',
+                          (sid,))
+        if not rows:
+            return 0, False, None
+        version, processing, owner_pid, claimed_at, result = rows[0]
+        processing = bool(processing) and not self._stale(owner_pid, claimed_at)
+        return version, processing, (json.loads(result) if result is not None else None)
+
+    def _stale(self, owner_pid, claimed_at):
+        """处理标记是否已失效：没有持有者、超时，或持有者进程已不存在（各工作进程在同一台机器上）"""
+        if owner_pid is None or claimed_at is None:
+            return True
+        if self.claim_timeout > 0 and time.time() - claimed_at > self.claim_timeout:
+            return True
+        return owner_pid != os.getpid() and not _pid_alive(owner_pid)
+
+    def claim(self, sid, force=False):
+        """把会话标记为由本进程处理；已被有效持有且 force=False 时返回 False"""
+        def work(db):
+            self._ensure_row(db, sid)
+            processing, owner_pid, claimed_at = db.execute(
+                'SELECT processing, owner_pid, claimed_at FROM session_state WHERE sid = ?', (sid,)).fetchone()
+            if processing and not force:
+                if not self._stale(owner_pid, claimed_at):
+                    return False
+                self.stats['stale_claims'] += 1
+                print(f"♻️ 会话 {sid} 的处理标记已失效（进程 {owner_pid}），重新占用")
+            now = time.time()
+            db.execute('UPDATE session_state SET processing = 1, owner_pid = ?, claimed_at = ?, updated_at = ? '
+                       'WHERE sid = ?', (os.getpid(), now, now, sid))
+            return True
+        return self._write(sid, work)
+
+    def release(self, sid):
+        """结束处理并把版本号加一；标记已被其他进程接管时只更新版本号"""
+        def work(db):
+            self._ensure_row(db, sid)
+            db.execute(
+                'UPDATE session_state SET processing = CASE WHEN owner_pid IS NULL OR owner_pid = ? THEN 0 ELSE processing END, '
+                'owner_pid = CASE WHEN owner_pid = ? THEN NULL ELSE owner_pid END, '
+                'version = version + 1, change_id = (SELECT COALESCE(MAX(change_id), 0) + 1 FROM session_state), '
+                'updated_at = ? WHERE sid = ?', (os.getpid(), os.getpid(), time.time(), sid))
+        self._write(sid, work)
+
+    def update_state(self, sid, bump=False, **fields):
+        """更新会话行；bump=True 时版本号加一，返回是否更新"""
+        columns = [f'{name} = ?' for name in fields] + ['updated_at = ?']
+        args = list(fields.values()) + [time.time()]
+        if bump:
+            columns.append('version = version + 1')
+            columns.append('change_id = (SELECT COALESCE(MAX(change_id), 0) + 1 FROM session_state)')
+        sql = f'UPDATE session_state SET {", ".join(columns)} WHERE sid = ?'
+        args.append(sid)
+        def work(db):
+            self._ensure_row(db, sid)
+            return db.execute(sql, args).rowcount > 0
+        return self._write(sid, work)
+
+    def load_generation(self, sid):
+        rows = self._read('SELECT reset_gen FROM session_state WHERE sid = ?', (sid,))
+        return rows[0][0] if rows else 0
+
+    def bump_generation(self, sid):
+        """会话被重置（清除结果、重置会话、开始转写）时加一，返回新的代次"""
+        def work(db):
+            self._ensure_row(db, sid)
+            db.execute('UPDATE session_state SET reset_gen = reset_gen + 1, updated_at = ? WHERE sid = ?',
+                       (time.time(), sid))
+            return db.execute('SELECT reset_gen FROM session_state WHERE sid = ?', (sid,)).fetchone()[0]
+        return self._write(sid, work)
+
+    def load_flag(self, sid, name):
+        rows = self._read(f'SELECT {name} FROM session_state WHERE sid = ?', (sid,))
+        return bool(rows and rows[0][0])
+
+    # ---- 事件 ----
+
+    def publish(self, sid, event_type, data, coalesce=False):
+        payload = json.dumps(data, ensure_ascii=False)
+        def work(db):
+            if coalesce:
+                db.execute('DELETE FROM session_event WHERE id = (SELECT MAX(id) FROM session_event WHERE sid = ?) '
+                           'AND type = ?', (sid, event_type))
+            cur = db.execute('INSERT INTO session_event (sid, type, data, ts) VALUES (?, ?, ?, ?)',
+                             (sid, event_type, payload, time.time()))
+            # 每次写入都按本会话裁剪，只保留最近 replay_size 条供断线补发；(sid, id) 索引上最多扫描 replay_size 项
+            floor = self._replay_floor(db, sid)
+            if floor:
+                db.execute('DELETE FROM session_event WHERE sid = ? AND id <= ?', (sid, floor))
+            return cur.lastrowid
+        return self._write(sid, work)
+
+    def _replay_floor(self, db, sid):
+        row = db.execute('SELECT id FROM session_event WHERE sid = ? ORDER BY id DESC LIMIT 1 OFFSET ?',
+                         (sid, self.replay_size)).fetchone()
+        return row[0] if row else 0
+
+    def events_since(self, sid, after_id, types=None):
+        sql = 'SELECT id, type, data, ts FROM session_event WHERE sid = ? AND id > ?'
+        args = [sid, after_id]
+        if types:
+            sql += f' AND type IN ({",".join("?" * len(types))})'
+            args.extend(types)
+        sql += ' ORDER BY id LIMIT ?'
+        args.append(self.replay_size)
+        return [(i, t, json.loads(d), ts) for i, t, d, ts in self._read(sql, args)]
+
+    def last_event_id(self, sid):
+        return self._read('SELECT COALESCE(MAX(id), 0) FROM session_event WHERE sid = ?', (sid,))[0][0]
+
+    def count_events(self, sid, event_type=None):
+        if event_type is None:
+            return self._read('SELECT COUNT(*) FROM session_event WHERE sid = ?', (sid,))[0][0]
+        return self._read('SELECT COUNT(*) FROM session_event WHERE sid = ? AND type = ?', (sid, event_type))[0][0]
+
+    def clear_events(self, sid):
+        # 自增ID不会复用，清空后事件ID继续递增
+        self._write(sid, lambda db: db.execute('DELETE FROM session_event WHERE sid = ?', (sid,)))
+
+    # ---- 工厂 ----
+
+    def result_slot(self, sid):
+        return SharedResultSlot(self, sid)
+
+    def event_channel(self, sid):
+        return SharedEventChannel(self, sid)
+
+    def snapshot(self):
+        with self._signals_lock:
+            watched = len(self._signals)
+        return {'backend': self.name, 'path': self.path, 'poll_interval': self.poll_interval,
+                'watched_sessions': watched, **self.stats}
+
+
+class SharedResultSlot:
+    """与 ResultSlot 接口相同，状态保存在共享数据库中"""
+
+    shared = True
+
+    def __init__(self, store, sid):
+        self.store = store
+        self.sid = sid
+        self.epoch = store.ensure_session(sid)
+        self._touched = time.monotonic()
+
+    @property
+    def version(self):
+        return self.state()[0]
+
+    @property
+    def processing(self):
+        return self.state()[1]
+
+    @property
+    def result(self):
+        return self.state()[2]
+
+    def set(self, result):
+        payload = json.dumps(result, ensure_ascii=False) if result is not None else None
+        self.store.update_state(self.sid, bump=True, result=payload)
+
+    def set_processing(self, processing):
+        if processing:
+            self.store.claim(self.sid, force=True)
+        else:
+            self.store.update_state(self.sid, processing=0, owner_pid=None)
+
+    def try_begin(self):
+        # 比较并设置在一个写事务内完成，多个进程同时开始处理时只有一个成功；失效的标记可以被接管
+        return self.store.claim(self.sid)
+
+    def end(self):
+        self.store.release(self.sid)
+
+    def touch(self):
+        # 会话仍在使用：按间隔刷新共享行的更新时间
+        interval = self.store.touch_interval
+        now = time.monotonic()
+        if interval is not None and now - self._touched >= interval:
+            self._touched = now
+            self.store.touch(self.sid)
+
+    def state(self):
+        return self.store.load_state(self.sid)
+
+    def _changed(self, after_version):
+        latest = []
+        def check():
+            latest[:] = [self.state()]
+            return latest[0][0] > after_version
+        return check, latest
+
+    def wait(self, after_version, timeout):
+        check, latest = self._changed(after_version)
+        self.store._signal(self.sid).wait(check, timeout)
+        return latest[0]
+
+    async def wait_async(self, after_version, timeout):
+        check, latest = self._changed(after_version)
+        await self.store._signal(self.sid).waiters.wait_for(check, timeout, blocking=True)
+        return latest[0]
+
+
+class SharedEventChannel:
+    """与 EventChannel 接口相同，事件保存在共享数据库中，事件ID在所有进程间递增"""
+
+    shared = True
+
+    def __init__(self, store, sid):
+        self.store = store
+        self.sid = sid
+        self.replay_size = store.replay_size
+        # 只表示本进程内的通道已关闭（会话被回收），不影响其他进程
+        self.closed = False
+        store.ensure_session(sid)
+
+    @property
+    def streaming(self):
+        # 连续转写在哪个进程运行，其他进程的旧版 /stream_* 接口也据此判断是否结束
+        return self.store.load_flag(self.sid, 'streaming')
+
+    @streaming.setter
+    def streaming(self, value):
+        self.store.update_state(self.sid, streaming=int(value))
+
+    @property
+    def generation(self):
+        # 会话的重置代次，所有进程一致
+        return self.store.load_generation(self.sid)
+
+    def bump_generation(self):
+        return self.store.bump_generation(self.sid)
+
+    def publish(self, event_type, data, coalesce=False):
+        return self.store.publish(self.sid, event_type, data, coalesce)
+
+    def topic(self, event_type):
+        return EventTopic(self, event_type)
+
+    @property
+    def last_id(self):
+        return self.store.last_event_id(self.sid)
+
+    def since(self, after_id, types=None):
+        return self.store.events_since(self.sid, after_id, types)
+
+    def wait(self, after_id, timeout, types=None):
+        events = []
+        def check():
+            events[:] = [] if self.closed else self.since(after_id, types)
+            return bool(events) or self.closed
+        self.store._signal(self.sid).wait(check, timeout)
+        return events
+
+    async def wait_async(self, after_id, timeout, types=None):
+        events = []
+        def check():
+            events[:] = [] if self.closed else self.since(after_id, types)
+            return bool(events) or self.closed
+        await self.store._signal(self.sid).waiters.wait_for(check, timeout, blocking=True)
+        return events
+
+    def clear(self):
+        self.store.clear_events(self.sid)
+
+    def close(self):
+        self.closed = True
+        self.store.forget(self.sid)
+
+    def qsize(self, event_type=None):
+        return self.store.count_events(self.sid, event_type)
+
+
+def backend_from_env():
+    name = os.getenv('STATE_BACKEND', 'memory').lower()
+    if name == 'sqlite':
+        return SqliteBackend.from_env()
+    if name != 'memory':
+        raise ValueError(f'未知的会话状态后端: {name}（可选 memory、sqlite）')
+    return MemoryBackend()
@@ -0,0 +1,214 @@
+import os
+import threading
+import time
+import uuid
+
+from translator import SocialAnxietyTranslator
+from audio_ingest import PushAudioSource
+from session_state import ResultSlot, backend_from_env
+
+SESSION_COOKIE = 'sa_sid'
+SESSION_HEADER = 'X-Session-Id'
+# /get_result 长轮询单次最多等待的秒数
+LONG_POLL_MAX = float(os.getenv('LONG_POLL_MAX', '25'))
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+def result_payload(version, processing, result):
+    """/get_result 的响应体"""
+    if processing:
+        body = {'status': 'processing'}
+        if result:
+            body['result'] = result
+    elif result:
+        body = {'status': 'completed', 'result': result}
+    else:
+        body = {'status': 'waiting'}
+    body['version'] = version
+    return body
+
+
+class Session:
+    """单个用户会话：独立的结果槽、处理标记以及转写/分析管线
+
+    结果槽与事件通道由状态后端提供，共享后端下多个工作进程各自持有同一会话的副本。
+    """
+
+    def __init__(self, sid, translator, state=None):
+        self.sid = sid
+        self.translator = translator
+        self.state = state if state is not None else ResultSlot()
+        self.lock = threading.Lock()
+        self.created_at = time.time()
+        self.last_seen = self.created_at
+
+    @property
+    def latest_result(self):
+        return self.state.result
+
+    @property
+    def is_processing(self):
+        return self.state.processing
+
+    @is_processing.setter
+    def is_processing(self, processing):
+        self.state.set_processing(processing)
+
+    @property
+    def result_version(self):
+        return self.state.version
+
+    @property
+    def epoch(self):
+        return self.state.epoch
+
+    def touch(self):
+        self.last_seen = time.time()
+        self.state.touch()
+
+    def set_result(self, result):
+        """更新结果并唤醒等待结果变化的连接"""
+        self.state.set(result)
+
+    def wait_result(self, after_version, timeout):
+        """阻塞直到结果版本号大于 after_version 或超时，返回 (版本号, 是否处理中, 结果)"""
+        return self.state.wait(after_version, timeout)
+
+    async def wait_result_async(self, after_version, timeout):
+        """wait_result 的协程版本，供 ASGI 模式使用"""
+        return await self.state.wait_async(after_version, timeout)
+
+    def result_state(self):
+        return self.state.state()
+
+    def result_etag(self, version):
+        return f'"{self.epoch}-{version}"'
+
+    def parse_result_wait(self, since=None, wait=None, if_none_match=None):
+        """解析长轮询参数，返回 (客户端已有的版本号或 None, 等待秒数)；参数不合法时抛出 ValueError
+
+        已有版本优先取 since 参数，其次取 If-None-Match 中属于本会话的 ETag；
+        比当前版本还新的（来自已重建的会话）视为没有。
+        """
+        known = None
+        if since not in (None, ''):
+            if not since.isdigit():
+                raise ValueError('since 必须是非负整数')
+            known = int(since)
+        elif if_none_match:
+            for tag in if_none_match.split(','):
+                epoch, _, version = tag.strip().removeprefix('W/').strip('"').partition('-')
+                if epoch == self.epoch and version.isdigit():
+                    known = int(version)
+                    break
+        if known is not None and known > self.result_version:
+            known = None
+        try:
+            seconds = float(wait) if wait not in (None, '') else 0.0
+        except ValueError:
+            raise ValueError('wait 必须是秒数')
+        if seconds < 0:
+            raise ValueError('wait 必须是秒数')
+        return known, min(seconds, LONG_POLL_MAX)
+
+    def try_begin_processing(self):
+        return self.state.try_begin()
+
+    def end_processing(self):
+        self.state.end()
+
+    def close(self):
+        try:
+            self.translator.stop_streaming()
+        except Exception:
+            pass
+        try:
+            if self.translator._manual_recording:
+                self.translator._manual_recording = False
+                self.translator._manual_stop.set()
+                # 本机麦克风由共享的采集引擎持有，这里只退订本会话的音频
+                if self.translator._manual_stream:
+                    self.translator._manual_stream.stop_stream()
+                    self.translator._manual_stream.close()
+        except Exception:
+            pass
+        try:
+            # 共享后端中回收的只是本进程的副本，其他进程仍可能在推送该会话的事件，不清空它们
+            self.translator._reset_stream_state(clear_events=not self.translator.events.shared, propagate=False)
+            self.translator.events.close()
+        except Exception:
+            pass
+
+
+class SessionRegistry:
+    """按会话ID管理会话，支持空闲过期回收与并发会话数上限"""
+
+    def __init__(self, max_sessions=None, idle_timeout=None, sweep_interval=30, backend=None):
+        self.max_sessions = max_sessions or int(os.getenv('MAX_SESSIONS', '50'))
+        self.idle_timeout = idle_timeout or float(os.getenv('SESSION_IDLE_TIMEOUT', '1800'))
+        self.sweep_interval = sweep_interval
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._last_sweep = 0.0
+        self.audio_input = os.getenv('AUDIO_INPUT', 'server').lower()
+        self.backend = backend or backend_from_env()
+
+    def _new_translator(self, sid):
+        events = self.backend.event_channel(sid)
+        if self.audio_input == 'browser':
+            # 浏览器推流：每个会话拥有独立的音频源，服务器无需声卡
+            return SocialAnxietyTranslator(audio_source=PushAudioSource(), session_id=sid, events=events)
+        # 麦克风在首次采集时才探测，进程内所有会话共用探测结果
+        return SocialAnxietyTranslator(session_id=sid, events=events)
+
+    def get(self, sid):
+        with self._lock:
+            session = self._sessions.get(sid)
+        if session:
+            session.touch()
+        return session
+
+    def get_or_create(self, sid=None):
+        self.sweep()
+        sid = sid or uuid.uuid4().hex
+        with self._lock:
+            session = self._sessions.get(sid)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    raise SessionLimitError(f'当前会话数已达上限({self.max_sessions})，请稍后再试')
+                session = Session(sid, self._new_translator(sid), self.backend.result_slot(sid))
+                self._sessions[sid] = session
+        session.touch()
+        return session
+
+    def remove(self, sid):
+        with self._lock:
+            session = self._sessions.pop(sid, None)
+        if session:
+            session.close()
+
+    def sweep(self, force=False):
+        now = time.time()
+        if not force and now - self._last_sweep < self.sweep_interval:
+            return
+        self._last_sweep = now
+        expired = []
+        with self._lock:
+            for sid, session in list(self._sessions.items()):
+                # 正在处理中的会话即使超时也保留，等待任务结束
+                if now - session.last_seen > self.idle_timeout and not session.is_processing:
+                    expired.append(self._sessions.pop(sid))
+        for session in expired:
+            print(f"♻️ 回收空闲会话: {session.sid}")
+            session.close()
+
+    def active(self):
+        with self._lock:
+            return list(self._sessions.values())
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
@@ -17,11 +17,31 @@ const micLevelFill = document.getElementById('micLevelFill');
 const micStateEl = document.getElementById('micState');
 const micLevelText = document.getElementById('micLevelText');
 
+// 每个标签页使用独立的会话ID，避免多个标签页互相覆盖结果
+const SESSION_ID = (() => {
+    let sid = sessionStorage.getItem('sa_sid');
+    if (!sid) {
+        sid = (window.crypto && crypto.randomUUID)
+            ? crypto.randomUUID().replace(/-/g, '')
+            : Date.now().toString(36) + Math.random().toString(36).slice(2);
+        sessionStorage.setItem('sa_sid', sid);
+    }
+    return sid;
+})();
+
+function apiFetch(url, options = {}) {
+    const headers = Object.assign({}, options.headers || {}, { 'X-Session-Id': SESSION_ID });
+    return fetch(url, Object.assign({}, options, { headers }));
+}
+
+// EventSource 无法设置请求头，通过查询参数携带会话ID
+function withSid(url) {
+    return url + (url.includes('?') ? '&' : '?') + 'sid=' + encodeURIComponent(SESSION_ID);
+}
+
 let isRecording = false;
-let checkResultInterval = null;
+let resultPoll = null;  // 长轮询的 AbortController
 let eventSource = null;
-let analysisSource = null;
-let summarySource = null;
 let micAudioContext = null;
 let micAnalyser = null;
 let micDataArray = null;
@@ -86,10 +106,11 @@ function clearResults() {
     stableUpdateStatus('准备就绪，点击录音按钮开始');
     
     // 停止检查结果
-    if (checkResultInterval) {
-        clearInterval(checkResultInterval);
-        checkResultInterval = null;
+    if (resultSource) {
+        resultSource.close();
+        resultSource = null;
     }
+    stopResultPoll();
 }
 
 async function initMicMonitor() {
@@ -157,10 +178,94 @@ async function ensureMicMonitor() {
     }
 }
 
+// 浏览器推流模式（AUDIO_INPUT=browser）：把麦克风音频上传给服务器识别
+const BROWSER_AUDIO = document.body.dataset.audioInput === 'browser';
+const UPLOAD_INTERVAL_MS = 200;
+let uploadNode = null;
+let uploadSourceNode = null;
+let uploadTimer = null;
+let uploadPending = [];
+let uploadChain = Promise.resolve();
+
+async function startAudioUpload() {
+    if (!BROWSER_AUDIO || uploadNode) return true;
+    const ok = await ensureMicMonitor();
+    if (!ok || !micAudioContext || !micStream) return false;
+    uploadSourceNode = micAudioContext.createMediaStreamSource(micStream);
+    uploadNode = micAudioContext.createScriptProcessor(4096, 1, 1);
+    uploadNode.onaudioprocess = (e) => {
+        const input = e.inputBuffer.getChannelData(0);
+        const pcm = new Int16Array(input.length);
+        for (let i = 0; i < input.length; i++) {
+            const v = Math.max(-1, Math.min(1, input[i]));
+            pcm[i] = v < 0 ? v * 0x8000 : v * 0x7fff;
+        }
+        uploadPending.push(pcm);
+    };
+    uploadSourceNode.connect(uploadNode);
+    uploadNode.connect(micAudioContext.destination);
+    uploadTimer = setInterval(flushAudioUpload, UPLOAD_INTERVAL_MS);
+    return true;
+}
+
+function flushAudioUpload() {
+    if (uploadPending.length === 0) return uploadChain;
+    const total = uploadPending.reduce((n, a) => n + a.length, 0);
+    const body = new Int16Array(total);
+    let offset = 0;
+    for (const a of uploadPending) {
+        body.set(a, offset);
+        offset += a.length;
+    }
+    uploadPending = [];
+    const rate = String(micAudioContext.sampleRate);
+    // 串行发送，保证服务器按顺序收到音频（重采样由服务器完成）
+    uploadChain = uploadChain.then(() => apiFetch('/ingest_audio', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/octet-stream',
+            'X-Sample-Rate': rate,
+            'X-Channels': '1',
+            'X-Sample-Format': 's16le'
+        },
+        body: body.buffer
+    })).catch((err) => console.error('音频上传失败:', err));
+    return uploadChain;
+}
+
+async function stopAudioUpload() {
+    if (!uploadNode) return;
+    clearInterval(uploadTimer);
+    uploadTimer = null;
+    uploadNode.disconnect();
+    uploadSourceNode.disconnect();
+    uploadNode = null;
+    uploadSourceNode = null;
+    await flushAudioUpload();
+}
+
+// 逐句分析：同一分句的流式片段与最终结果写入同一行
+function renderIntent(seq, text) {
+    if (text === undefined || text === null) return;
+    if (seq === undefined || seq === null) {
+        liveIntent.appendChild(document.createTextNode(text + '\n'));
+        return;
+    }
+    let line = liveIntent.querySelector(`[data-seq="${seq}"]`);
+    if (!line) {
+        line = document.createElement('div');
+        line.dataset.seq = String(seq);
+        liveIntent.appendChild(line);
+    }
+    line.textContent = text;
+}
+
+let transcriptFinal = '';
+
 // 开始连续转写
 async function startStreaming() {
     try {
-        const res = await fetch('/start_streaming', { method: 'POST' });
+        const res = await apiFetch('/start_streaming', { method: 'POST' });
         const data = await res.json();
         if (data.status !== 'streaming_started') {
             alert('启动连续转写失败');
@@ -168,59 +273,44 @@ async function startStreaming() {
         }
         stableUpdateStatus('📡 已启动连续转写...', true);
         isStreaming = true;
+        await startAudioUpload();
         liveTranscript.textContent = '';
+        transcriptFinal = '';
         stopStreamBtn.style.display = 'inline-block';
         liveIntent.textContent = '';
         liveSummary.textContent = '';
+        // 转写、分析、摘要共用一个事件流；断线后浏览器会带上 Last-Event-ID 自动补发
         if (eventSource) {
             eventSource.close();
         }
-        eventSource = new EventSource('/stream_transcription');
-        eventSource.onmessage = (e) => {
-            if (e.data && e.data.trim().length > 0) {
-                liveTranscript.textContent += e.data + '\n';
+        eventSource = new EventSource(withSid('/events'));
+        eventSource.addEventListener('segment', (e) => {
+            const obj = JSON.parse(e.data);
+            transcriptFinal += obj.segment + '\n';
+            liveTranscript.textContent = transcriptFinal;
+        });
+        // 实时识别的中间结果：临时显示在已确认文本之后，整句结果到达时被替换
+        eventSource.addEventListener('interim', (e) => {
+            const obj = JSON.parse(e.data);
+            liveTranscript.textContent = transcriptFinal + obj.interim;
+        });
+        eventSource.addEventListener('analysis', (e) => {
+            const obj = JSON.parse(e.data);
+            const text = obj.analysis !== undefined ? obj.analysis : obj.analysis_delta;
+            renderIntent(obj.seq, text);
+        });
+        eventSource.addEventListener('summary', (e) => {
+            const obj = JSON.parse(e.data);
+            liveSummary.textContent = obj.summary || obj.summary_delta || '';
+        });
+        eventSource.addEventListener('status', (e) => {
+            const obj = JSON.parse(e.data);
+            if (obj.streaming === false && isStreaming) {
+                stableUpdateStatus('⏹️ 连续转写已在服务器端停止');
             }
-        };
+        });
         eventSource.onerror = () => {
-            if (isStreaming) stableUpdateStatus('❌ 实时转写连接错误');
-        };
-
-        // 分析流
-        if (analysisSource) {
-            analysisSource.close();
-        }
-        analysisSource = new EventSource('/stream_analysis');
-        analysisSource.onmessage = (e) => {
-            if (e.data && e.data.trim().length > 0) {
-                let text = e.data;
-                try {
-                    const obj = JSON.parse(e.data);
-                    text = obj.analysis || e.data;
-                } catch (_) {}
-                liveIntent.textContent += text + '\n';
-            }
-        };
-        analysisSource.onerror = () => {
-            if (isStreaming) stableUpdateStatus('❌ 实时分析连接错误');
-        };
-
-        // 摘要流
-        if (summarySource) {
-            summarySource.close();
-        }
-        summarySource = new EventSource('/stream_summary');
-        summarySource.onmessage = (e) => {
-            if (e.data && e.data.trim().length > 0) {
-                let text = e.data;
-                try {
-                    const obj = JSON.parse(e.data);
-                    text = obj.summary || e.data;
-                } catch (_) {}
-                liveSummary.textContent = text;
-            }
-        };
-        summarySource.onerror = () => {
-            if (isStreaming) stableUpdateStatus('❌ 实时摘要连接错误');
+            if (isStreaming) stableUpdateStatus('⚠️ 实时连接中断，正在重连...');
         };
     } catch (err) {
         console.error(err);
@@ -231,19 +321,12 @@ async function startStreaming() {
 // 停止连续转写
 async function stopStreaming() {
     try {
-        await fetch('/stop_streaming', { method: 'POST' });
+        await stopAudioUpload();
+        await apiFetch('/stop_streaming', { method: 'POST' });
         if (eventSource) {
             eventSource.close();
             eventSource = null;
         }
-        if (analysisSource) {
-            analysisSource.close();
-            analysisSource = null;
-        }
-        if (summarySource) {
-            summarySource.close();
-            summarySource = null;
-        }
         stopStreamBtn.style.display = 'none';
         isStreaming = false;
         stableUpdateStatus('⏹️ 已停止连续转写');
@@ -271,7 +354,7 @@ async function startRecording() {
         if (!monitorOk) {
             micStateEl.textContent = '浏览器未授权';
         }
-        const response = await fetch('/begin_manual_recording', {
+        const response = await apiFetch('/begin_manual_recording', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -286,6 +369,7 @@ async function startRecording() {
             return;
         }
         
+        await startAudioUpload();
         stableUpdateStatus('🎤 正在录音，点击结束录音', true);
         stopRecordBtn.style.display = 'inline-block';
         
@@ -298,6 +382,7 @@ async function startRecording() {
 
 // 停止录音状态
 function stopRecording() {
+    stopAudioUpload();
     isRecording = false;
     recordBtn.classList.remove('recording');
     recordBtn.querySelector('.btn-text').textContent = '开始录音';
@@ -317,7 +402,8 @@ async function finishRecording() {
     loading.style.display = 'block';
     stableUpdateStatus('⏹️ 已结束录音，正在识别...', true);
     try {
-        const response = await fetch('/end_manual_recording', { method: 'POST' });
+        await stopAudioUpload();
+        const response = await apiFetch('/end_manual_recording', { method: 'POST' });
         const data = await response.json();
         if (data.error) {
             alert(data.error);
@@ -327,8 +413,7 @@ async function finishRecording() {
             originalText.textContent = data.result.original_text;
             translatedText.textContent = '分析中...';
             stableUpdateStatus('🧠 已识别，正在分析...', true);
-            if (checkResultInterval) { clearInterval(checkResultInterval); }
-            checkResultInterval = setInterval(checkResult, 1000);
+            openResultStream();
         } else if (data.status === 'completed' && data.result) {
             displayResult(data.result);
             stableUpdateStatus('✅ 分析完成！');
@@ -342,23 +427,76 @@ async function finishRecording() {
     }
 }
 
-// 检查结果
-async function checkResult() {
-    try {
-        const response = await fetch('/get_result');
-        const data = await response.json();
-        
+// 通过 SSE 实时接收分析结果（含生成中的文本），连接失败时退回长轮询
+let resultSource = null;
+function openResultStream() {
+    if (resultSource) resultSource.close();
+    stopResultPoll();
+    resultSource = new EventSource(withSid('/stream_result'));
+    resultSource.onmessage = (e) => {
+        let data = null;
+        try {
+            data = JSON.parse(e.data);
+        } catch (_) {
+            return;
+        }
         if (data.status === 'completed' && data.result) {
-            // 结果显示完成
             displayResult(data.result);
             stableUpdateStatus('✅ 分析完成！');
             stopRecording();
-            
-            // 停止检查
-            if (checkResultInterval) {
-                clearInterval(checkResultInterval);
-                checkResultInterval = null;
+            resultSource.close();
+            resultSource = null;
+        } else if (data.status === 'processing' && data.result) {
+            originalText.textContent = data.result.original_text;
+            translatedText.textContent = data.result.translation;
+            if (data.result.status_hint) {
+                stableUpdateStatus(data.result.status_hint, true);
             }
+        }
+    };
+    resultSource.onerror = () => {
+        if (!resultSource) return;
+        resultSource.close();
+        resultSource = null;
+        pollResult();
+    };
+}
+
+function stopResultPoll() {
+    if (resultPoll) {
+        resultPoll.abort();
+        resultPoll = null;
+    }
+}
+
+// 长轮询结果：带上已有的版本号，结果一变化服务器立即返回，无变化时最多挂起 25 秒后返回 304
+async function pollResult() {
+    stopResultPoll();
+    const controller = new AbortController();
+    resultPoll = controller;
+    let version = '';
+    while (resultPoll === controller) {
+        let data = null;
+        try {
+            const response = await apiFetch(`/get_result?since=${version}&wait=25`, { signal: controller.signal });
+            if (response.status === 304) continue;
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            data = await response.json();
+        } catch (error) {
+            if (controller.signal.aborted) return;
+            console.error('获取结果失败:', error);
+            stableUpdateStatus('获取结果失败');
+            stopRecording();
+            break;
+        }
+        version = data.version;
+
+        if (data.status === 'completed' && data.result) {
+            // 结果显示完成
+            displayResult(data.result);
+            stableUpdateStatus('✅ 分析完成！');
+            stopRecording();
+            break;
         } else if (data.status === 'processing') {
             stableUpdateStatus('正在分析中...', true);
             if (data.result && data.result.original_text) {
@@ -370,23 +508,14 @@ async function checkResult() {
         } else if (data.status === 'waiting') {
             stableUpdateStatus('等待处理结果...', true);
         }
-        
-    } catch (error) {
-        console.error('获取结果失败:', error);
-        stableUpdateStatus('获取结果失败');
-        stopRecording();
-        
-        if (checkResultInterval) {
-            clearInterval(checkResultInterval);
-            checkResultInterval = null;
-        }
     }
+    if (resultPoll === controller) resultPoll = null;
 }
 
 // 清除结果
 async function clearResult() {
     try {
-        await fetch('/clear_result', {
+        await apiFetch('/clear_result', {
             method: 'POST'
         });
         clearResults();
@@ -404,9 +533,8 @@ stopRecordBtn.addEventListener('click', finishRecording);
 resetSessionBtn.addEventListener('click', async () => {
     try {
         if (eventSource) { eventSource.close(); eventSource = null; }
-        if (analysisSource) { analysisSource.close(); analysisSource = null; }
-        if (summarySource) { summarySource.close(); summarySource = null; }
-        await fetch('/reset_session', { method: 'POST' });
+        await stopAudioUpload();
+        await apiFetch('/reset_session', { method: 'POST' });
         stopStreamBtn.style.display = 'none';
         window.location.reload();
     } catch (err) {
@@ -0,0 +1,123 @@
+import os
+import threading
+import time
+
+from workers import Superseded
+
+
+class RollingSummarizer:
+    """增量滚动摘要：合并短时间内的多次触发，每次只把上次摘要之后的新内容交给模型
+
+    - 触发后等待 window 秒无新触发再执行（持续有新内容时最多等待 max_wait 秒）
+    - 同一时间只有一次摘要在执行，执行期间的触发会在结束后合并为下一次
+    - reset 之后，仍在执行的旧摘要结果会被丢弃；代次检查与发布在同一把锁内完成，reset 不会插在两者之间，
+      publish 因此不能再调用 reset 或 trigger
+    """
+
+    def __init__(self, collect, summarize, publish, window=None, max_wait=None, executor=None):
+        self._collect = collect
+        self._summarize = summarize
+        self._publish = publish
+        self.window = window if window is not None else float(os.getenv('SUMMARY_DEBOUNCE', '2.0'))
+        self.max_wait = max_wait if max_wait is not None else float(os.getenv('SUMMARY_MAX_WAIT', '8.0'))
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._timer = None
+        self._first_trigger = None
+        self._last_trigger = None
+        self._running = False
+        self._dirty = False
+        self._epoch = 0
+        self.summary = ''
+        self._cursor = None
+        self.stats = {'triggers': 0, 'runs': 0, 'discarded': 0}
+
+    def trigger(self):
+        with self._lock:
+            now = time.monotonic()
+            self.stats['triggers'] += 1
+            self._last_trigger = now
+            if self._first_trigger is None:
+                self._first_trigger = now
+            if self._timer is None:
+                self._schedule(self.window)
+
+    def _schedule(self, delay):
+        self._timer = threading.Timer(max(delay, 0.0), self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            if self._first_trigger is None:
+                return
+            now = time.monotonic()
+            quiet_left = self.window - (now - self._last_trigger)
+            wait_left = self.max_wait - (now - self._first_trigger)
+            if quiet_left > 0 and wait_left > 0:
+                self._schedule(min(quiet_left, wait_left))
+                return
+            if self._running:
+                # 上一次摘要还没结束，结束后再合并执行
+                self._dirty = True
+                return
+            self._first_trigger = None
+            self._running = True
+            epoch = self._epoch
+        if self._executor is not None:
+            key = ('summary', id(self))
+            if not self._executor.submit(self._run, epoch, key=key, on_drop=lambda: self._finish(epoch)):
+                return
+        else:
+            threading.Thread(target=self._run, args=(epoch,), daemon=True).start()
+
+    def _run(self, epoch):
+        try:
+            with self._lock:
+                previous, cursor = self.summary, self._cursor
+            items, new_cursor = self._collect(cursor)
+            if not items:
+                return
+            self.stats['runs'] += 1
+            try:
+                ok, text = self._summarize(previous, items)
+            except Superseded:
+                # 排队或生成期间会话被重置
+                self.stats['discarded'] += 1
+                return
+            with self._lock:
+                if epoch != self._epoch:
+                    self.stats['discarded'] += 1
+                    return
+                if ok:
+                    self.summary = text
+                    self._cursor = new_cursor
+                self._publish(text)
+        finally:
+            self._finish(epoch)
+
+    def _finish(self, epoch):
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._running = False
+            rerun = self._dirty
+            self._dirty = False
+            if rerun:
+                self._first_trigger = None
+        if rerun:
+            self.trigger()
+
+    def reset(self):
+        with self._lock:
+            self._epoch += 1
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            self._first_trigger = None
+            self._last_trigger = None
+            self._running = False
+            self._dirty = False
+            self.summary = ''
+            self._cursor = None
@@ -0,0 +1,71 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 测试直接导入仓库根目录下的模块
+sys.path.insert(0, ROOT)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+ASR_PORT = _free_port()
+LLM_PORT = _free_port()
+
+# translator 与 dashscope 在导入时读取这些配置：识别与大模型都指向本地模拟服务，不访问声卡与云端
+os.environ.update({
+    'HEADLESS': '1',
+    'DASHSCOPE_API_KEY': 'fake',
+    'LLM_BASE_URL': f'http://127.0.0.1:{LLM_PORT}/compatible-mode/v1',
+    'DASHSCOPE_HTTP_BASE_URL': f'http://127.0.0.1:{LLM_PORT}/api/v1',
+    'DASHSCOPE_WEBSOCKET_BASE_URL': f'ws://127.0.0.1:{ASR_PORT}/api-ws/v1/inference',
+    'ASR_BACKENDS': 'paraformer',
+    'STREAMING_ASR': 'paraformer',
+    'AUDIO_INPUT': 'browser',
+    'STATE_BACKEND': 'memory',
+    'LLM_CACHE_ENABLED': '0',
+    'PHRASEBOOK_ENABLED': '0',
+    'TRANSCRIPT_ENABLED': '0',
+    # 分析结果触发的滚动摘要不在测试期间执行，模拟服务关闭后也不会再有请求
+    'SUMMARY_DEBOUNCE': '3600',
+    'SUMMARY_MAX_WAIT': '3600',
+})
+
+
+def _start_server(script, port, extra=()):
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, 'bench', script), '--port', str(port), *extra],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError(f'模拟服务 {script} 启动超时')
+
+
+@pytest.fixture(scope='session')
+def fake_llm():
+    proc = _start_server('fake_llm_server.py', LLM_PORT, ('--token-interval', '0.01'))
+    yield proc
+    proc.kill()
+    proc.wait()
+
+
+@pytest.fixture(scope='session')
+def fake_asr():
+    proc = _start_server('fake_asr_server.py', ASR_PORT)
+    yield proc
+    proc.kill()
+    proc.wait()
@@ -0,0 +1,23 @@
+import numpy as np
+
+from audio_ingest import PushAudioSource
+
+
+def test_second_ingest_rejected_until_first_ends():
+    source = PushAudioSource()
+    assert source.try_begin_ingest()
+    assert not source.try_begin_ingest()
+    source.end_ingest()
+    assert source.try_begin_ingest()
+
+
+def test_new_ingest_drops_partial_frame():
+    source = PushAudioSource()
+    assert source.try_begin_ingest()
+    # 半个采样留在 carry 里，下一路上传不能把它拼到自己的开头
+    source.feed(b'\x01', 16000)
+    source.end_ingest()
+    assert source.try_begin_ingest()
+    pcm = np.full(4, 1000, dtype='<i2').tobytes()
+    assert source.feed(pcm, 16000) == 4
+    assert np.frombuffer(source._stream.read(4), dtype='<i2').tolist() == [999, 999, 999, 999]
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from llm_router import CircuitBreaker, LLMUnavailable, ModelEndpoint, ModelRouter
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record(False)
+    assert breaker.state == 'open'
+
+
+def _router(endpoints, **kwargs):
+    kwargs.setdefault('hedge_delay', 0.05)
+    kwargs.setdefault('min_hedge_delay', 0.01)
+    return ModelRouter(endpoints, deadline=2.0, **kwargs)
+
+
+def test_breaker_opens_and_probe_closes():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    _open(breaker)
+    assert not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    # 探测进行中只放行一次
+    assert not breaker.allow()
+    breaker.record(True)
+    assert breaker.state == 'closed'
+
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record(False)
+    assert breaker.state == 'open'
+
+
+def test_abandon_releases_probe():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    _open(breaker)
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.abandon()
+    assert breaker.allow()
+
+
+def test_probe_losing_hedge_can_probe_again():
+    calls = {'primary': 0}
+
+    def slow_primary(req, timeout):
+        calls['primary'] += 1
+        # 模拟流式读取：被放弃时立即退出
+        req.cancelled.wait(timeout)
+        raise TimeoutError('cancelled')
+
+    primary = ModelEndpoint('primary', slow_primary, breaker=CircuitBreaker(1, 0.01))
+    backup = ModelEndpoint('backup', lambda req, timeout: 'backup text')
+    router = _router([primary, backup])
+    _open(primary.breaker)
+    time.sleep(0.02)
+
+    assert router.call('segment', [], 'p', 0.2) == ('backup text', 'backup')
+    time.sleep(0.05)
+    assert primary.breaker.state == 'half_open'
+    assert primary.breaker.available()
+
+    assert router.call('segment', [], 'p', 0.2) == ('backup text', 'backup')
+    time.sleep(0.05)
+    assert calls['primary'] == 2
+
+
+def test_probe_cancelled_before_start_is_released():
+    started = []
+
+    def hanging_primary(req, timeout):
+        # 一直占着唯一的线程，直到调用方在截止时间后放弃这次尝试
+        req.cancelled.wait(timeout + 1)
+        raise TimeoutError('cancelled')
+
+    def backup_call(req, timeout):
+        started.append(True)
+        return 'backup text'
+
+    primary = ModelEndpoint('primary', hanging_primary)
+    backup = ModelEndpoint('backup', backup_call, breaker=CircuitBreaker(1, 0.01))
+    # 只有一个线程：对冲出去的 backup 探测只能排队，截止时间到达时它在开始前就被取消
+    router = _router([primary, backup], max_workers=1)
+    _open(backup.breaker)
+    time.sleep(0.02)
+
+    with pytest.raises(LLMUnavailable):
+        router.call('segment', [], 'p', 0.2, deadline=0.3)
+    assert not started
+    assert backup.breaker.available()
+    assert backup.breaker.allow()
+
+
+def test_all_failing_raises_unavailable():
+    def broken(req, timeout):
+        raise RuntimeError('boom')
+
+    router = _router([ModelEndpoint('a', broken), ModelEndpoint('b', broken)])
+    with pytest.raises(LLMUnavailable):
+        router.call('segment', [], 'p', 0.2)
+
+
+def test_async_probe_losing_hedge_can_probe_again():
+    calls = {'primary': 0}
+
+    async def slow_primary(req, timeout):
+        calls['primary'] += 1
+        await asyncio.sleep(timeout)
+
+    async def fast_backup(req, timeout):
+        return 'backup text'
+
+    primary = ModelEndpoint('primary', None, slow_primary, breaker=CircuitBreaker(1, 0.01))
+    backup = ModelEndpoint('backup', None, fast_backup)
+    router = _router([primary, backup])
+    _open(primary.breaker)
+    time.sleep(0.02)
+
+    for _ in range(2):
+        assert asyncio.run(router.call_async('segment', [], 'p', 0.2)) == ('backup text', 'backup')
+    assert calls['primary'] == 2
+    assert primary.breaker.available()
@@ -0,0 +1,47 @@
+import json
+
+from phrasebook import PhraseBook
+
+ENTRIES = {'entries': [
+    {'id': 'treat_meal', 'phrases': ['改天请你吃饭', '有空一起吃饭'], 'type': '客套话',
+     'intent': '只是礼貌寒暄', 'reply': '好呀，有空再约', 'exclude': ['几点', '明天']},
+    {'id': 'next_time', 'phrases': ['下次一定'], 'type': '推辞', 'intent': '委婉拒绝', 'reply': '好的'},
+]}
+
+
+def _book(tmp_path, raw=ENTRIES, **kwargs):
+    path = tmp_path / 'phrases.json'
+    path.write_text(json.dumps(raw, ensure_ascii=False), encoding='utf-8')
+    return PhraseBook(path=str(path), **kwargs), path
+
+
+def test_hit_requires_coverage(tmp_path):
+    book, _ = _book(tmp_path)
+    assert book.match('改天请你吃饭！')[0] == 'hit'
+    outcome, entry, phrase = book.match('改天请你吃饭，顺便聊聊我们下个季度的项目预算安排')
+    assert outcome == 'partial'
+    assert entry['id'] == 'treat_meal' and phrase == '改天请你吃饭'
+    assert book.match('今天天气不错')[0] == 'miss'
+
+
+def test_exclude_word_and_conflicting_types_are_ambiguous(tmp_path):
+    book, _ = _book(tmp_path)
+    assert book.match('明天改天请你吃饭')[0] == 'ambiguous'
+    assert book.match('改天请你吃饭下次一定')[0] == 'ambiguous'
+
+
+def test_lookup_renders_stage_template(tmp_path):
+    book, _ = _book(tmp_path)
+    assert book.lookup('改天请你吃饭', 'segment') == '类型：客套话\n真实意图：只是礼貌寒暄\n建议回应：好呀，有空再约'
+    assert book.lookup('改天请你吃饭', 'translate').startswith('分析: 常见客套话')
+    assert book.lookup('今天天气不错', 'segment') is None
+    counts = book.snapshot()['stages']['segment']
+    assert (counts['hit'], counts['miss'], counts['hit_rate']) == (1, 1, 0.5)
+
+
+def test_broken_file_keeps_previous_dictionary(tmp_path):
+    book, path = _book(tmp_path, reload_interval=0)
+    assert book.match('下次一定')[0] == 'hit'
+    path.write_text('{"entries": [{"phrases": []', encoding='utf-8')
+    assert not book.reload()
+    assert book.match('下次一定')[0] == 'hit'
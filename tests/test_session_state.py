@@ -0,0 +1,39 @@
+from session_state import SharedResultSlot, SqliteBackend
+
+
+def _backend(tmp_path, **kwargs):
+    return SqliteBackend(path=str(tmp_path / 'state.sqlite3'), **kwargs)
+
+
+def _drop_row(store, sid):
+    # 模拟保留期清理：删除会话行，本进程仍持有该会话
+    store._write(sid, lambda db: db.execute('DELETE FROM session_state WHERE sid = ?', (sid,)))
+
+
+def test_claim_recreates_trimmed_row(tmp_path):
+    store = _backend(tmp_path)
+    slot = SharedResultSlot(store, 'trimmedsid01')
+    slot.set({'original_text': 'a'})
+    slot.set({'original_text': 'b'})
+    version = slot.version
+    _drop_row(store, slot.sid)
+    assert slot.try_begin()
+    assert slot.processing
+    slot.set({'original_text': 'c'})
+    # 重建的行沿用原纪元，版本号不会回退到客户端已知的版本之下
+    assert store.ensure_session(slot.sid) == slot.epoch
+    assert slot.version > version
+    assert slot.result == {'original_text': 'c'}
+
+
+def test_touch_refreshes_updated_at(tmp_path):
+    store = _backend(tmp_path, retention=1)
+    slot = SharedResultSlot(store, 'touchedsid01')
+    slot._touched -= store.touch_interval
+    store._write(slot.sid, lambda db: db.execute('UPDATE session_state SET updated_at = 0 WHERE sid = ?', (slot.sid,)))
+    slot.touch()
+    updated_at = store._read('SELECT updated_at FROM session_state WHERE sid = ?', (slot.sid,))[0][0]
+    assert updated_at > 0
+    # 刷新后的行不会被保留期清理
+    store._write(slot.sid, lambda db: store._trim(db))
+    assert store._read('SELECT sid FROM session_state WHERE sid = ?', (slot.sid,))
@@ -0,0 +1,46 @@
+import pytest
+
+import handlers
+from sessions import LONG_POLL_MAX, Session
+
+
+def _session():
+    session = Session('etagsession01', translator=None)
+    session.set_result({'original_text': 'a'})
+    session.set_result({'original_text': 'b'})
+    return session
+
+
+def test_since_takes_precedence_over_etag():
+    session = _session()
+    etag = session.result_etag(1)
+    assert session.parse_result_wait('2', '5', etag) == (2, 5.0)
+    assert session.parse_result_wait(None, None, etag) == (1, 0.0)
+
+
+def test_etag_from_other_epoch_or_future_version_is_ignored():
+    session = _session()
+    assert session.parse_result_wait(None, '1', '"deadbeef-2"') == (None, 1.0)
+    assert session.parse_result_wait(None, '1', f'W/"{session.epoch}-2", "x-1"') == (2, 1.0)
+    # 比当前版本还新的版本号来自已重建的会话
+    assert session.parse_result_wait('9', None, None) == (None, 0.0)
+
+
+def test_wait_is_validated_and_capped():
+    session = _session()
+    assert session.parse_result_wait(None, '9999', None) == (None, LONG_POLL_MAX)
+    for since, wait in (('-1', None), ('abc', None), (None, 'soon'), (None, '-2')):
+        with pytest.raises(ValueError):
+            session.parse_result_wait(since, wait, None)
+    with pytest.raises(handlers.BadRequest):
+        handlers.result_wait(session, {'wait': 'soon'}, {})
+
+
+def test_result_reply_returns_304_when_unchanged():
+    session = _session()
+    state = session.result_state()
+    body, headers = handlers.result_reply(session, state[0], state)
+    assert body is None
+    assert headers['ETag'] == session.result_etag(state[0])
+    body, _ = handlers.result_reply(session, state[0] - 1, state)
+    assert body['result'] == {'original_text': 'b'}
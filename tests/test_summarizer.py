@@ -0,0 +1,43 @@
+import threading
+import time
+
+from summarizer import RollingSummarizer
+
+
+def _summarizer(publish, summarize=None):
+    return RollingSummarizer(lambda cursor: (['item'], 1), summarize or (lambda previous, items: (True, 'summary')),
+                             publish, window=0.01, max_wait=0.05)
+
+
+def test_reset_waits_for_publish_in_progress():
+    published = threading.Event()
+    reset_done = []
+
+    def publish(text):
+        # 发布期间另一个线程重置：reset 必须等发布结束，不能插在代次检查与发布之间
+        t = threading.Thread(target=lambda: (summarizer.reset(), reset_done.append(time.monotonic())))
+        t.start()
+        t.join(0.05)
+        reset_done.append(('publishing', t.is_alive()))
+        published.set()
+
+    summarizer = _summarizer(publish)
+    summarizer.trigger()
+    assert published.wait(2)
+    time.sleep(0.05)
+    assert reset_done[0] == ('publishing', True)
+    assert summarizer.summary == ''
+
+
+def test_reset_during_summarize_discards_result():
+    published = []
+
+    def summarize(previous, items):
+        summarizer.reset()
+        return True, 'stale'
+
+    summarizer = _summarizer(published.append, summarize)
+    summarizer.trigger()
+    time.sleep(0.2)
+    assert published == []
+    assert summarizer.stats['discarded'] == 1
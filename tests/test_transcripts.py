@@ -0,0 +1,29 @@
+from transcripts import TranscriptLog, TranscriptStore
+
+
+def test_log_since_keeps_cursor_past_tail(tmp_path):
+    store = TranscriptStore(path=str(tmp_path / 't.sqlite3'))
+    log = TranscriptLog(store, 'transcriptsid1', 'segment', tail_size=3)
+    for i in range(5):
+        log.append(f's{i}', i)
+    assert log.total == 5
+    # 游标之后的记录已有部分只在磁盘上，内存中只能取到仍保留的
+    assert log.since(1) == ['s2', 's3', 's4']
+    assert log.since(3) == ['s3', 's4']
+    assert log.since(5) == []
+    log.clear()
+    assert log.since(0) == [] and log.total == 0
+    assert store.count('transcriptsid1') == 5
+
+
+def test_store_pages_with_cursor_and_kinds(tmp_path):
+    store = TranscriptStore(path=str(tmp_path / 't.sqlite3'))
+    for i in range(5):
+        store.append('pagedsid0001', 'segment', f's{i}', i)
+        store.append('pagedsid0001', 'analysis', f'a{i}', i)
+    store.append('othersid0001', 'segment', 'other')
+    items, after = store.page('pagedsid0001', 0, 4, ['segment'])
+    assert [i['text'] for i in items] == ['s0', 's1', 's2', 's3']
+    items, after = store.page('pagedsid0001', after, 4, ['segment'])
+    assert [i['text'] for i in items] == ['s4'] and after is None
+    assert len(list(store.iter_all('pagedsid0001', batch=3))) == 10
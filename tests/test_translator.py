@@ -0,0 +1,91 @@
+import time
+
+import numpy as np
+
+from asr_backends import ParaformerStream
+from audio_ingest import PushAudioSource
+from translator import SocialAnxietyTranslator, _load_dashscope
+
+RATE = 16000
+
+
+def _speech(segments, seed=0):
+    """合成音频：底噪中夹着若干段带包络的谐波（模拟语音），每段后停顿 1 秒"""
+    rng = np.random.default_rng(seed)
+    parts = [rng.normal(0, 30, RATE // 2)]
+    for seconds in segments:
+        t = np.arange(int(RATE * seconds)) / RATE
+        voice = sum(np.sin(2 * np.pi * 180 * k * t) / k for k in (1, 2, 3))
+        parts.append(2500 * voice * (0.6 + 0.4 * np.sin(2 * np.pi * 3 * t)) + rng.normal(0, 30, len(t)))
+        parts.append(rng.normal(0, 30, RATE))
+    return np.clip(np.concatenate(parts), -32768, 32767).astype('<i2').tobytes()
+
+
+def _wait_for(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _analyses(translator):
+    return [e[2] for e in translator.events.since(0, ('analysis',)) if 'analysis' in e[2]]
+
+
+def test_translate_politeness_streams_from_fake_llm(fake_llm):
+    translator = SocialAnxietyTranslator(session_id='translatetest01')
+    partials = []
+    result = translator.translate_politeness('改天请你吃饭', on_delta=partials.append)
+    assert '客套话' in result
+    assert partials
+
+
+def test_batch_analysis_is_split_back_in_order(fake_llm):
+    translator = SocialAnxietyTranslator(session_id='batchtest00001')
+    tickets = [translator._resequencer.ticket() for _ in range(3)]
+    translator._analyze_batch([(f'第{i}句', ticket) for i, ticket in enumerate(tickets)])
+    analyses = _analyses(translator)
+    assert [a['seq'] for a in analyses] == [0, 1, 2]
+    assert '第1条的真实意图' in analyses[0]['analysis']
+    assert '第3条的真实意图' in analyses[2]['analysis']
+
+
+def test_reset_discards_analysis_in_flight(fake_llm):
+    translator = SocialAnxietyTranslator(session_id='resettest00001')
+    ticket = translator._resequencer.ticket()
+    translator._reset_stream_state()
+    translator._analyze_segment_uncached('改天请你吃饭', ticket)
+    assert _analyses(translator) == []
+
+
+def test_paraformer_stream_sends_interims_and_finals(fake_asr):
+    interims, finals = [], []
+    stream = ParaformerStream(_load_dashscope, interims.append, finals.append)
+    stream.start()
+    pcm = _speech([1.5, 1.5])
+    for offset in range(0, len(pcm), 3200):
+        stream.send(pcm[offset:offset + 3200])
+    stream.stop()
+    assert not stream.failed
+    assert finals == ['第1句话', '第2句话']
+    # 中间结果只是整句的前缀，不会进入分析
+    assert interims and all('第1句话'.startswith(t) or '第2句话'.startswith(t) for t in interims)
+
+
+def test_realtime_streaming_end_to_end(fake_asr, fake_llm):
+    source = PushAudioSource()
+    translator = SocialAnxietyTranslator(session_id='realtimetest01', audio_source=source)
+    assert translator.start_streaming()
+    try:
+        pcm = _speech([1.5])
+        for offset in range(0, len(pcm), 3200):
+            source.feed(pcm[offset:offset + 3200], RATE)
+            time.sleep(0.02)
+        assert _wait_for(lambda: _analyses(translator))
+    finally:
+        translator.stop_streaming()
+    segments = [e[2]['segment'] for e in translator.events.since(0, ('segment',))]
+    assert segments == ['第1句话']
+    assert _analyses(translator)[0]['seq'] == 0
@@ -0,0 +1,50 @@
+import numpy as np
+
+from vad import VADSegmenter
+
+RATE = 16000
+
+
+def _pcm(*parts, seed=0):
+    """parts 为 (秒数, 是否语音)：语音为带包络的谐波，其余为底噪"""
+    rng = np.random.default_rng(seed)
+    out = []
+    for seconds, voiced in parts:
+        t = np.arange(int(RATE * seconds)) / RATE
+        signal = rng.normal(0, 30, len(t))
+        if voiced:
+            signal += 2500 * sum(np.sin(2 * np.pi * 180 * k * t) / k for k in (1, 2, 3))
+        out.append(signal)
+    return np.clip(np.concatenate(out), -32768, 32767).astype('<i2').tobytes()
+
+
+def _segments(pcm, chunk, **kwargs):
+    vad = VADSegmenter(RATE, **kwargs)
+    segments = []
+    for offset in range(0, len(pcm), chunk):
+        segments += vad.feed(pcm[offset:offset + chunk])
+    tail = vad.flush()
+    return [len(s) // vad.frame_bytes for s in segments + ([tail] if tail else [])]
+
+
+def test_splits_on_pauses_and_drops_short_noise():
+    pcm = _pcm((0.5, False), (1.0, True), (0.2, False), (0.5, True), (1.0, False), (0.1, True), (1.0, False),
+               (0.9, True), (1.0, False))
+    # 0.2 秒的停顿短于拖尾，前两段语音合为一段；0.1 秒的噪声丢弃
+    frames = _segments(pcm, 2048, hangover=0.5, pre_roll=0.3)
+    assert len(frames) == 2
+    assert frames[0] > frames[1]
+
+
+def test_long_speech_is_force_split():
+    frames = _segments(_pcm((0.5, False), (5.0, True), (1.0, False)), 2048, max_segment=2.0, pre_roll=0)
+    assert len(frames) == 3
+    assert frames[0] == frames[1] == 67
+
+
+def test_result_does_not_depend_on_chunk_size():
+    pcm = _pcm((0.5, False), (1.0, True), (0.7, False), (1.5, True), (1.0, False))
+    expected = _segments(pcm, len(pcm))
+    assert len(expected) == 2
+    for chunk in (320, 960, 2048, 6400):
+        assert _segments(pcm, chunk) == expected
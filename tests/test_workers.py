@@ -0,0 +1,219 @@
+import threading
+import time
+
+import pytest
+
+from workers import BoundedExecutor, KeyedSerialExecutor, MicroBatcher, PriorityScheduler, Resequencer, Superseded
+
+
+class _SlowTake(MicroBatcher):
+    def _take(self):
+        # 取出分句后稍等再重新调度，让其他会话的调度任务先占满队列
+        batch = super()._take()
+        time.sleep(0.02)
+        return batch
+
+
+def test_block_pool_does_not_deadlock_on_batcher_reschedule():
+    # 单线程、队列长度 1：排空任务在工作线程中重新调度时，队列已被其他会话占满也不能阻塞等待自己
+    pool = BoundedExecutor(max_workers=1, max_queue=1, overflow='block')
+    done = []
+
+    def run_single(text, ticket):
+        time.sleep(0.05)
+        done.append(text)
+
+    def run_batch(items):
+        for item in items:
+            run_single(*item)
+
+    first = _SlowTake(run_single, run_batch, pool, max_batch=1)
+    second = MicroBatcher(run_single, run_batch, pool, max_batch=1)
+    for i in range(3):
+        first.add(f'a{i}', None)
+    time.sleep(0.02)
+    # 第二个会话的调度任务会在队列空出时立即占满队列
+    adder = threading.Thread(target=lambda: [second.add(f'b{i}', None) for i in range(2)], daemon=True)
+    adder.start()
+    deadline = time.monotonic() + 5
+    while len(done) < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(done) == ['a0', 'a1', 'a2', 'b0', 'b1']
+
+
+def _gate_pool(**kwargs):
+    # 唯一的工作线程先被占住，之后提交的任务只能排队
+    pool = BoundedExecutor(max_workers=1, **kwargs)
+    gate = threading.Event()
+    started = threading.Event()
+    pool.submit(lambda: (started.set(), gate.wait(5)))
+    assert started.wait(2)
+    return pool, gate
+
+
+def _drain(pool):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        snap = pool.snapshot()
+        if not snap['queue_depth'] and not snap['active']:
+            return
+        time.sleep(0.01)
+
+
+def test_drop_oldest_drops_and_reports():
+    pool, gate = _gate_pool(max_queue=2, overflow='drop_oldest')
+    ran, dropped = [], []
+    for i in range(3):
+        assert pool.submit(ran.append, i, on_drop=lambda i=i: dropped.append(i))
+    gate.set()
+    _drain(pool)
+    assert dropped == [0]
+    assert ran == [1, 2]
+    assert pool.snapshot()['dropped'] == 1
+
+
+def test_coalesce_merges_or_rejects():
+    pool, gate = _gate_pool(max_queue=1, overflow='coalesce')
+    ran, rejected = [], []
+
+    def job(items):
+        ran.append(list(items))
+
+    def merge(old, new):
+        old[0].extend(new[0])
+        return old
+
+    assert pool.submit(job, [1], merge=merge)
+    assert pool.submit(job, [2], merge=merge)
+    # 不可合并的任务在队列满时被拒绝
+    assert not pool.submit(ran.append, 'other', on_drop=lambda: rejected.append('other'))
+    gate.set()
+    _drain(pool)
+    assert ran == [[1, 2]]
+    assert rejected == ['other']
+    assert pool.snapshot()['coalesced'] == 1
+
+
+def test_same_key_replaces_queued_job():
+    pool, gate = _gate_pool(max_queue=4, overflow='drop_oldest')
+    ran, dropped = [], []
+    pool.submit(ran.append, 'old', key='k', on_drop=lambda: dropped.append('old'))
+    pool.submit(ran.append, 'new', key='k')
+    gate.set()
+    _drain(pool)
+    assert ran == ['new']
+    assert dropped == ['old']
+
+
+def test_block_applies_backpressure_to_outside_submitters():
+    pool, gate = _gate_pool(max_queue=1, overflow='block')
+    ran = []
+    pool.submit(ran.append, 1)
+    blocked = threading.Thread(target=pool.submit, args=(ran.append, 2))
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+    gate.set()
+    blocked.join(2)
+    _drain(pool)
+    assert ran == [1, 2]
+
+
+def test_resequencer_emits_in_ticket_order():
+    out = []
+    reseq = Resequencer(lambda result, seq: out.append((seq, result)))
+    tickets = [reseq.ticket() for _ in range(4)]
+    tickets[2].publish('c', 2)
+    tickets[0].publish('a', 0)
+    assert out == [(0, 'a')]
+    # 跳过的顺序号不输出，也不再挡住后面的结果
+    tickets[1].skip()
+    assert out == [(0, 'a'), (2, 'c')]
+    tickets[3].publish('d', 3)
+    assert [seq for seq, _ in out] == [0, 2, 3]
+
+
+def test_resequencer_close_discards_pending():
+    out = []
+    reseq = Resequencer(lambda result: out.append(result))
+    first, second = reseq.ticket(), reseq.ticket()
+    second.publish('late')
+    reseq.close()
+    first.publish('early')
+    assert out == []
+    assert not first.alive
+
+
+def test_scheduler_prefers_higher_priority():
+    scheduler = PriorityScheduler(max_active=1)
+    assert scheduler.acquire('summary')
+    order = []
+
+    def waiter(klass):
+        assert scheduler.acquire(klass, timeout=5)
+        order.append(klass)
+        scheduler.release(klass)
+
+    threads = [threading.Thread(target=waiter, args=(klass,)) for klass in ('summary', 'segment', 'interactive')]
+    for t in threads:
+        t.start()
+        time.sleep(0.05)
+    scheduler.release('summary')
+    for t in threads:
+        t.join(5)
+    assert order == ['interactive', 'segment', 'summary']
+
+
+def test_scheduler_class_limit_leaves_room_for_interactive():
+    scheduler = PriorityScheduler(max_active=2, limits={'segment': 1})
+    assert scheduler.acquire('segment')
+    assert not scheduler.acquire('segment', timeout=0.05)
+    assert scheduler.acquire('interactive', timeout=0.05)
+    assert scheduler.snapshot()['classes']['segment']['timeouts'] == 1
+
+
+def test_scheduler_prune_supersedes_waiters():
+    scheduler = PriorityScheduler(max_active=1)
+    assert scheduler.acquire('interactive')
+    alive = [True]
+    result = []
+
+    def waiter():
+        try:
+            result.append(scheduler.acquire('segment', alive=lambda: alive[0], timeout=5))
+        except Superseded:
+            result.append('superseded')
+
+    t = threading.Thread(target=waiter)
+    t.start()
+    time.sleep(0.05)
+    alive[0] = False
+    scheduler.prune()
+    t.join(2)
+    assert result == ['superseded']
+    with pytest.raises(Superseded):
+        scheduler.acquire('segment', alive=lambda: False)
+
+
+def test_keyed_serial_executor_orders_per_key_only():
+    writer = KeyedSerialExecutor(max_workers=2)
+    slow_started = threading.Event()
+    release = threading.Event()
+    order = []
+
+    def slow(tag):
+        slow_started.set()
+        release.wait(5)
+        order.append(tag)
+
+    first = writer.submit('a', slow, 'a1')
+    second = writer.submit('a', order.append, 'a2')
+    assert slow_started.wait(2)
+    # 另一个 key 不用等待 a 的慢任务
+    writer.submit('b', order.append, 'b1').result(2)
+    assert order == ['b1']
+    release.set()
+    second.result(2)
+    assert first.done()
+    assert order == ['b1', 'a1', 'a2']
+    assert writer.snapshot()['keys'] == 0
@@ -0,0 +1,165 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from itertools import islice
+
+TRANSCRIPT_KINDS = ('segment', 'analysis', 'summary', 'reset')
+EXPORT_FORMATS = {'jsonl': 'application/x-ndjson; charset=utf-8', 'txt': 'text/plain; charset=utf-8'}
+PAGE_LIMIT = 500
+_KIND_LABELS = {'segment': '语句', 'analysis': '分析', 'summary': '摘要', 'reset': '——'}
+
+
+def parse_kinds(raw):
+    """解析 kind 查询参数（逗号分隔），未知类型抛出 ValueError"""
+    kinds = [k.strip() for k in (raw or '').split(',') if k.strip()]
+    unknown = [k for k in kinds if k not in TRANSCRIPT_KINDS]
+    if unknown:
+        raise ValueError(f'未知的记录类型: {", ".join(unknown)}')
+    return kinds or None
+
+
+def format_entry(item, fmt):
+    """导出时的一行：jsonl 为原始字段，txt 为带时间的可读文本"""
+    if fmt == 'jsonl':
+        return json.dumps(item, ensure_ascii=False) + '\n'
+    stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(item['ts']))
+    return f"[{stamp}] {_KIND_LABELS.get(item['kind'], item['kind'])}: {item['text']}\n"
+
+
+class TranscriptStore:
+    """会话转写记录：追加写入 SQLite（WAL），按会话分页读取与导出，超过保留期的记录定期删除"""
+
+    def __init__(self, path='transcripts.sqlite3', retention_days=30, enabled=True):
+        self.path = path
+        self.retention = retention_days * 24 * 3600
+        self.enabled = enabled and bool(path)
+        self._lock = threading.Lock()
+        self._conn = None
+        self._writes_since_trim = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            path=os.getenv('TRANSCRIPT_PATH', 'transcripts.sqlite3'),
+            retention_days=float(os.getenv('TRANSCRIPT_RETENTION_DAYS', '30')),
+            enabled=os.getenv('TRANSCRIPT_ENABLED', '1') not in ('0', 'false', 'False'),
+        )
+
+    def _db(self):
+        # 首次写入时才打开数据库，避免拖慢启动
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS transcript ('
+                'id INTEGER PRIMARY KEY AUTOINCREMENT, session TEXT NOT NULL, kind TEXT NOT NULL, '
+                'seq INTEGER, text TEXT NOT NULL, created_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_transcript_session ON transcript(session, id)')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_transcript_created ON transcript(created_at)')
+            conn.commit()
+            self._conn = conn
+        return self._conn
+
+    def append(self, session, kind, text, seq=None):
+        if not self.enabled or not text:
+            return None
+        now = time.time()
+        with self._lock:
+            try:
+                db = self._db()
+                cur = db.execute(
+                    'INSERT INTO transcript (session, kind, seq, text, created_at) VALUES (?, ?, ?, ?, ?)',
+                    (session, kind, seq, text, now)
+                )
+                db.commit()
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= 500:
+                    self._trim(db, now)
+                return cur.lastrowid
+            except sqlite3.Error as e:
+                print(f"⚠️ 写入转写记录失败: {e}")
+                return None
+
+    def _trim(self, db, now):
+        self._writes_since_trim = 0
+        if self.retention > 0:
+            db.execute('DELETE FROM transcript WHERE created_at < ?', (now - self.retention,))
+            db.commit()
+
+    def page(self, session, after=0, limit=100, kinds=None):
+        """返回 id 大于 after 的至多 limit 条记录（按写入顺序），以及下一页的游标（没有更多时为 None）"""
+        if not self.enabled:
+            return [], None
+        sql = 'SELECT id, kind, seq, text, created_at FROM transcript WHERE session = ? AND id > ?'
+        args = [session, after]
+        if kinds:
+            sql += f' AND kind IN ({",".join("?" * len(kinds))})'
+            args.extend(kinds)
+        sql += ' ORDER BY id LIMIT ?'
+        args.append(limit + 1)
+        with self._lock:
+            try:
+                rows = self._db().execute(sql, args).fetchall()
+            except sqlite3.Error as e:
+                print(f"⚠️ 读取转写记录失败: {e}")
+                return [], None
+        items = [{'id': r[0], 'kind': r[1], 'seq': r[2], 'text': r[3], 'ts': r[4]} for r in rows[:limit]]
+        return items, (items[-1]['id'] if len(rows) > limit else None)
+
+    def iter_all(self, session, kinds=None, batch=500):
+        """逐页遍历某个会话的全部记录，导出时内存占用只与 batch 有关"""
+        after = 0
+        while True:
+            items, after = self.page(session, after, batch, kinds)
+            yield from items
+            if after is None:
+                return
+
+    def count(self, session):
+        if not self.enabled:
+            return 0
+        with self._lock:
+            try:
+                return self._db().execute('SELECT COUNT(*) FROM transcript WHERE session = ?', (session,)).fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"⚠️ 读取转写记录失败: {e}")
+                return 0
+
+
+class TranscriptLog:
+    """一类记录（分句或分析）：内存中只保留最近 tail_size 条供摘要使用，全部记录追加写入磁盘
+
+    total 为累计条数，since(n) 取第 n 条之后仍在内存中的记录（更早的已只在磁盘上）。
+    """
+
+    def __init__(self, store, session, kind, tail_size=200):
+        self.store = store
+        self.session = session
+        self.kind = kind
+        self._tail = deque(maxlen=tail_size)
+        self.total = 0
+
+    def append(self, text, seq=None):
+        self._tail.append(text)
+        self.total += 1
+        self.store.append(self.session, self.kind, text, seq)
+
+    def since(self, index):
+        skip = max(index - (self.total - len(self._tail)), 0)
+        return list(islice(self._tail, skip, None))
+
+    def clear(self):
+        # 只清空内存，磁盘上的历史保留
+        self._tail.clear()
+        self.total = 0
+
+    def __len__(self):
+        return self.total
+
+    def __iter__(self):
+        return iter(list(self._tail))
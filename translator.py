@@ -1,129 +1,598 @@
 import speech_recognition as sr
-import dashscope
-from dashscope import Generation
+import asyncio
 import os
 from dotenv import load_dotenv
 import json
-import requests
-from openai import OpenAI
-import queue
+import math
 import time
 import threading
-from dashscope.audio.asr import Recognition
-from http import HTTPStatus
-import io
-import wave
-import pyaudio
+import queue
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from llm_cache import LLMCache
+from phrasebook import PhraseBook
+from transcripts import TranscriptStore, TranscriptLog
+from workers import BoundedExecutor, Resequencer, MicroBatcher, Superseded
+from summarizer import RollingSummarizer
+from events import EventChannel
+from metrics import STAGE_SECONDS, FAILURES
+from llm_router import ModelRouter, ModelEndpoint, LLMUnavailable
+from asr_backends import HedgedRecognizer, ParaformerStream
+from vad import VADSegmenter
+from audio_ingest import PcmBuffer, LinearResampler, decode_pcm, to_int16_bytes, TARGET_RATE
+from capture import CaptureEngine, get_engine
 
 load_dotenv()
 api_key = os.getenv('DASHSCOPE_API_KEY')
-# 配置OpenAI兼容模式
-client = OpenAI(
-    api_key=api_key,
-    base_url="https://dashscope.aliyuncs.com/compatible-mode/v1"
-)
+# OpenAI 兼容接口地址，压测时可指向本地模拟服务
+LLM_BASE_URL = os.getenv('LLM_BASE_URL', 'https://dashscope.aliyuncs.com/compatible-mode/v1')
+# 大模型 HTTP 连接池大小（保持长连接），默认与模型路由的并发线程数一致
+LLM_POOL_SIZE = int(os.getenv('LLM_POOL_SIZE', os.getenv('LLM_WORKERS', '16')))
+
+# openai / dashscope / pyaudio 导入较慢，首次用到时才加载，保证服务快速启动
+client = None
+_dashscope = None
+_client_lock = threading.Lock()
+
+
+def _http_limits():
+    import httpx
+    return httpx.Limits(max_connections=LLM_POOL_SIZE, max_keepalive_connections=LLM_POOL_SIZE, keepalive_expiry=60)
+
+
+def _get_client():
+    # 配置OpenAI兼容模式；整个进程共用一个客户端及其长连接池
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                from openai import OpenAI, DefaultHttpxClient
+                client = OpenAI(
+                    api_key=api_key,
+                    base_url=LLM_BASE_URL,
+                    # 重试与降级交给 llm_router，避免客户端内部退避重试吃掉截止时间
+                    max_retries=0,
+                    http_client=DefaultHttpxClient(limits=_http_limits())
+                )
+    return client
+
+
+def _load_dashscope():
+    global _dashscope
+    if _dashscope is None:
+        import dashscope
+        import dashscope.audio.asr
+        dashscope.api_key = api_key
+        _dashscope = dashscope
+    return _dashscope
+
+
+# 无头模式：不访问本机声卡（浏览器推流或纯接口部署）
+HEADLESS = os.getenv('HEADLESS', '0') in ('1', 'true', 'True')
+MIC_CACHE_PATH = os.getenv('MIC_CACHE_PATH', '.mic_device.json')
+_device_lock = threading.Lock()
+_device_choice = {}
+
+
+def _load_cached_device():
+    try:
+        with open(MIC_CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _save_cached_device(index, name):
+    try:
+        with open(MIC_CACHE_PATH, 'w', encoding='utf-8') as f:
+            json.dump({'index': index, 'name': name}, f, ensure_ascii=False)
+    except OSError as e:
+        print(f"⚠️ 无法保存麦克风选择: {e}")
+
+
+def _try_device(index):
+    try:
+        with sr.Microphone(device_index=index, sample_rate=16000, chunk_size=1024):
+            pass
+        return True
+    except Exception as e:
+        print(f"❌ 设备 {index} 不可用: {e}")
+        return False
+
+
+def _discover_device():
+    """探测可用麦克风：优先使用上次保存的选择，失败时再逐个尝试"""
+    available_mics = sr.Microphone.list_microphone_names()
+    cached = _load_cached_device()
+    if cached:
+        idx = cached.get('index')
+        if idx is None or (idx < len(available_mics) and available_mics[idx] == cached.get('name')):
+            if _try_device(idx):
+                print(f"✅ 使用上次的麦克风设备: {cached.get('name')}")
+                return idx
+    print(f"可用麦克风设备: {available_mics}")
+    for i, mic_name in enumerate(available_mics):
+        print(f"尝试麦克风设备 {i}: {mic_name}")
+        if _try_device(i):
+            print(f"✅ 使用麦克风设备 {i}: {mic_name}")
+            _save_cached_device(i, mic_name)
+            return i
+    print("使用默认麦克风")
+    _save_cached_device(None, 'default')
+    return None
+
+
+def _resolve_microphone(device_index=None):
+    """首次采集时才确定麦克风，整个进程只探测一次；返回该设备共享的常驻采集引擎"""
+    if HEADLESS:
+        print("ℹ️ 无头模式，不使用本机麦克风")
+        return None
+    try:
+        with _device_lock:
+            if device_index is None:
+                if 'index' not in _device_choice:
+                    _device_choice['index'] = _discover_device()
+                device_index = _device_choice['index']
+        return get_engine(device_index)
+    except Exception as e:
+        print(f"❌ 无法初始化麦克风: {e}")
+        return None
+
+# 常见客套话反复出现，缓存分析结果以节省调用
+llm_cache = LLMCache.from_env()
 
-dashscope.api_key = api_key
+# 固定说法的客套话直接查本地短语词典，把握不足的才交给大模型
+phrasebook = PhraseBook.from_env()
+
+# 转写记录：全部写入磁盘，内存中每类只保留最近 TRANSCRIPT_TAIL 条供摘要使用
+transcript_store = TranscriptStore.from_env()
+TRANSCRIPT_TAIL = int(os.getenv('TRANSCRIPT_TAIL', '200'))
+
+# 连续转写的分析与摘要共用固定大小的线程池，避免每个分句都新建线程
+analysis_pool = BoundedExecutor.from_env('ANALYSIS', max_workers=4, max_queue=32, overflow='coalesce')
+summary_pool = BoundedExecutor.from_env('SUMMARY', max_workers=2, max_queue=16, overflow='drop_oldest')
+
+# 语音识别在 Google / Sphinx / Paraformer 之间对冲调用，取最先返回的可信结果
+asr = HedgedRecognizer.from_env(_load_dashscope)
+
+# 连续转写引擎：vad 为本地分段后逐段识别；paraformer 为实时流式识别，可输出中间结果
+STREAMING_ASR = os.getenv('STREAMING_ASR', 'vad')
+REALTIME_RETRY_INTERVAL = float(os.getenv('REALTIME_RETRY_INTERVAL', '1.0'))
+# 共享状态后端下，采集所在进程每隔多少秒检查一次是否已在其他进程被停止或重置
+SHARED_STOP_POLL = float(os.getenv('SHARED_STOP_POLL', '1.0'))
+
+# 手动录音过程中在停顿处切出的片段，提前在后台识别
+manual_asr_pool = ThreadPoolExecutor(max_workers=int(os.getenv('MANUAL_ASR_WORKERS', '4')), thread_name_prefix='manual-asr')
+
+
+# 流式输出：边生成边推送给前端，STREAM_PUSH_INTERVAL 控制推送的最小间隔（秒）
+LLM_STREAMING = os.getenv('LLM_STREAMING', '1') not in ('0', 'false', 'False')
+STREAM_PUSH_INTERVAL = float(os.getenv('STREAM_PUSH_INTERVAL', '0.08'))
+
+
+class _DeltaCollector:
+    """流式输出的累积与限频推送，同步与协程两种调用共用"""
+
+    def __init__(self, on_delta):
+        self.on_delta = on_delta
+        self.parts = []
+        self.last_push = 0.0
+
+    def feed(self, chunk):
+        if not chunk.choices:
+            return
+        delta = chunk.choices[0].delta.content
+        if not delta:
+            return
+        self.parts.append(delta)
+        now = time.monotonic()
+        if now - self.last_push >= STREAM_PUSH_INTERVAL:
+            self.on_delta(self.text())
+            self.last_push = now
+
+    def text(self):
+        return ''.join(self.parts)
+
+
+def _chat_completion_call(model, messages, temperature, on_delta, timeout=None, attempt=None):
+    """调用 OpenAI 兼容接口；传入 on_delta 时以流式方式回调当前已生成的全部文本
+
+    httpx 的超时只限制单次读写，流式响应每来一块就重新计时；attempt（路由的一次尝试）给出整次生成的
+    截止时间，被放弃或超时时关闭连接。
+    """
+    if on_delta is None or not LLM_STREAMING:
+        completion = _get_client().chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=False,
+            temperature=temperature,
+            timeout=timeout
+        )
+        return completion.choices[0].message.content
+    collector = _DeltaCollector(on_delta)
+    stream = _get_client().chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        temperature=temperature,
+        timeout=timeout
+    )
+    if attempt is not None:
+        attempt.on_cancel = stream.close
+    try:
+        for chunk in stream:
+            if attempt is not None and attempt.expired():
+                raise TimeoutError(f'{model} 生成超过截止时间或已被放弃')
+            collector.feed(chunk)
+    finally:
+        stream.close()
+    return collector.text()
+
+
+_async_client = None
+
+
+def _get_async_client():
+    # 异步客户端只在 ASGI 模式下用到，首次调用时再创建
+    global _async_client
+    if _async_client is None:
+        from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+        _async_client = AsyncOpenAI(
+            api_key=api_key,
+            base_url=LLM_BASE_URL,
+            max_retries=0,
+            http_client=DefaultAsyncHttpxClient(limits=_http_limits())
+        )
+    return _async_client
+
+
+async def _chat_completion_async_call(model, messages, temperature, on_delta, timeout=None):
+    """_chat_completion_call 的协程版本"""
+    async_client = _get_async_client()
+    if on_delta is None or not LLM_STREAMING:
+        completion = await async_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=False,
+            temperature=temperature,
+            timeout=timeout
+        )
+        return completion.choices[0].message.content
+    collector = _DeltaCollector(on_delta)
+    stream = await async_client.chat.completions.create(
+        model=model,
+        messages=messages,
+        stream=True,
+        temperature=temperature,
+        timeout=timeout
+    )
+    try:
+        async for chunk in stream:
+            collector.feed(chunk)
+    finally:
+        # 落选或超时的协程被取消时同样断开连接
+        await stream.close()
+    return collector.text()
+
+
+def _generation_call(model, prompt, temperature, timeout=None):
+    """调用 dashscope Generation 接口（不支持流式），非 200 响应视为失败"""
+    response = _load_dashscope().Generation.call(
+        model=model,
+        prompt=prompt,
+        stream=False,
+        temperature=temperature,
+        request_timeout=max(1, math.ceil(timeout)) if timeout else None
+    )
+    if getattr(response, 'status_code', None) != 200:
+        raise RuntimeError(f"{model} 返回 {getattr(response, 'status_code', None)}: {getattr(response, 'message', 'unknown error')}")
+    return response.output.text
+
+
+# 模型路由：qwen3-max 为主模型，qwen-turbo 为备用；熔断、对冲与截止时间见 llm_router.ModelRouter
+llm_router = ModelRouter.from_env([
+    ModelEndpoint(
+        'qwen3-max',
+        lambda req, timeout: _chat_completion_call('qwen3-max', req.messages, req.temperature, req.on_delta, timeout, req),
+        lambda req, timeout: _chat_completion_async_call('qwen3-max', req.messages, req.temperature, req.on_delta, timeout),
+    ),
+    ModelEndpoint(
+        'qwen-turbo',
+        lambda req, timeout: _generation_call('qwen-turbo', req.prompt, req.temperature, timeout),
+    ),
+], stages=('translate', 'segment', 'batch', 'summary'),
+   # 按键触发的翻译优先于分句分析，摘要最后；各类另有并发上限（LLM_SLOTS_<CLASS>）
+   stage_classes={'translate': 'interactive', 'segment': 'segment', 'batch': 'segment', 'summary': 'summary'})
+LLM_MODELS = tuple(e.name for e in llm_router.endpoints)
+
+
+def _politeness_prompt(text):
+    return f"""
+        你是一个社交意图分析专家。请分析以下中文文本，判断说话者是否在说客套话，
+        并给出其真实意图。如果是客套话，请直接翻译出真实含义；如果不是客套话，
+        请说明这是真诚的表达。
+        
+        文本: "{text}"
+        
+        请按照以下格式回复：
+        分析: [简要分析]
+        类型: [客套话/真诚表达]
+        真实意图: [翻译后的真实含义，如果是客套话]
+        建议回应: [给社恐人士的建议回应]
+        """
+
+
+def _politeness_messages(prompt):
+    return [
+        {"role": "system", "content": "你是一个专业的社交意图分析专家，擅长识别中文客套话和分析真实意图。"},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def _segment_prompt(text):
+    return f"请分析是否为客套话，并给出真实意图与建议回应：{text}"
+
+
+def _segment_messages(text):
+    return [
+        {"role": "system", "content": "你是一个社交意图分析专家，识别中文客套话并给出真实意图与建议回应"},
+        {"role": "user", "content": f"文本：{text}\n请输出：类型、真实意图、建议回应"}
+    ]
+
+
+def _ticket_alive(ticket):
+    # 分句的顺序号随重置作废，可直接作为代次标记
+    return (lambda: ticket.alive) if ticket is not None else None
+
+
+def _batch_messages(texts):
+    numbered = "\n".join(f"{i}. {t}" for i, t in enumerate(texts, 1))
+    return [
+        {"role": "system", "content": "你是一个社交意图分析专家，识别中文客套话并给出真实意图与建议回应"},
+        {"role": "user", "content": (
+            f"下面是按编号排列的{len(texts)}条文本，请逐条分析，输出：类型、真实意图、建议回应。\n"
+            "只输出 JSON 数组，不要输出其他内容，格式为 "
+            '[{"id": 1, "analysis": "类型：…\\n真实意图：…\\n建议回应：…"}]\n'
+            f"{numbered}"
+        )}
+    ]
+
+
+def _split_batch_result(raw, count):
+    """把批量分析的 JSON 结果拆回每条分句；缺失或无法解析的条目为 None"""
+    results = [None] * count
+    start, end = (raw or '').find('['), (raw or '').rfind(']')
+    if start < 0 or end <= start:
+        return results
+    try:
+        items = json.loads(raw[start:end + 1])
+    except ValueError:
+        return results
+    for item in items if isinstance(items, list) else ():
+        try:
+            idx = int(item.get('id')) - 1
+        except (AttributeError, TypeError, ValueError):
+            continue
+        analysis = item.get('analysis')
+        if 0 <= idx < count and isinstance(analysis, str) and analysis.strip():
+            results[idx] = analysis.strip()
+    return results
 
 class SocialAnxietyTranslator:
-    def __init__(self):
+    def __init__(self, device_index=None, audio_source=None, session_id=None, events=None):
         self.recognizer = sr.Recognizer()
+        # 转写记录按会话ID保存，同一会话重启服务后仍能取回历史
+        self.session_id = session_id or uuid.uuid4().hex
         
-        # 尝试多个麦克风设备
-        self.microphone = None
-        self.stream_queue = queue.Queue()
-        self.analysis_queue = queue.Queue()
-        self.summary_queue = queue.Queue()
-        self.segments_log = []
-        self.analysis_log = []
-        self._stop_listening = None
+        # 麦克风在首次采集时才探测；浏览器推流模式下音频来自网页上传，不需要本机声卡
+        self.audio_source = audio_source
+        self._device_index = device_index
+        self._microphone = audio_source
+        self._mic_resolved = audio_source is not None
+        # 转写、分析、摘要与状态共用一个事件通道，由 /events 统一推送（多进程部署时由共享的状态后端提供）
+        self.events = events if events is not None else EventChannel()
+        self.stream_queue = self.events.topic('segment')
+        self.analysis_queue = self.events.topic('analysis')
+        self.summary_queue = self.events.topic('summary')
+        self.segments_log = TranscriptLog(transcript_store, self.session_id, 'segment', TRANSCRIPT_TAIL)
+        self.analysis_log = TranscriptLog(transcript_store, self.session_id, 'analysis', TRANSCRIPT_TAIL)
+        self._stream_stop = None
         self._streaming = False
-        self._pa = None
         self._manual_stream = None
-        self._manual_frames = []
         self._manual_recording = False
         self._manual_rate = 16000
         self._manual_channels = 1
         self._manual_chunk = 1024
+        self._manual_buffer = PcmBuffer(self._manual_rate, 2 * self._manual_channels)
+        self._manual_chunks = []
         self._manual_thread = None
-        available_mics = sr.Microphone.list_microphone_names()
-        print(f"可用麦克风设备: {available_mics}")
-        
-        # 尝试找到合适的麦克风
-        for i, mic_name in enumerate(available_mics):
-            try:
-                print(f"尝试麦克风设备 {i}: {mic_name}")
-                test_mic = sr.Microphone(device_index=i, sample_rate=16000, chunk_size=1024)
-                with test_mic as source:
-                    self.recognizer.adjust_for_ambient_noise(source, duration=0.5)
-                self.microphone = test_mic
-                print(f"✅ 使用麦克风设备 {i}: {mic_name}")
-                break
-            except Exception as e:
-                print(f"❌ 设备 {i} 不可用: {e}")
-                continue
-        
-        if self.microphone is None:
-            # 使用默认麦克风
-            try:
-                self.microphone = sr.Microphone(sample_rate=16000, chunk_size=1024)
-                print("使用默认麦克风")
-            except Exception as e:
-                print(f"❌ 无法初始化麦克风: {e}")
-                raise Exception("无法找到可用的麦克风设备")
+        # 采集线程写缓冲区、切片与结束时取最后一段都在这把锁下进行；每次录音各有一个停止标志，
+        # 上一次录音的采集线程即使还阻塞在读取上，醒来后也不会再写入新的缓冲区
+        self._manual_lock = threading.Lock()
+        self._manual_stop = threading.Event()
+        self._resequencer = Resequencer(self._on_analysis)
+        # 每次重置加一；调用大模型时带上发起时的值，重置之后排队中的调用被丢弃、返回的结果不再使用
+        self.generation = 0
+        # 共享状态后端下会话也可能在其他工作进程被重置，记下本进程已同步到的共享重置代次
+        self._generation_lock = threading.Lock()
+        self._shared_generation = self.events.generation
+        self._batcher = MicroBatcher.from_env(self._analyze_segment, self._analyze_batch, analysis_pool,
+                                              on_reject=self._reject_segments)
+        self._summarizer = RollingSummarizer(self._collect_summary_input, self._update_summary, self._publish_summary, executor=summary_pool)
+    @property
+    def microphone(self):
+        if not self._mic_resolved:
+            self._microphone = _resolve_microphone(self._device_index)
+            self._mic_resolved = True
+        return self._microphone
 
-    
+    @microphone.setter
+    def microphone(self, value):
+        self._microphone = value
+        self._mic_resolved = True
+
+    def _input_source(self):
+        """采集用的 AudioSource：浏览器推流源本身，或常驻采集引擎的一份订阅"""
+        source = self.microphone
+        if isinstance(source, CaptureEngine):
+            return source.source()
+        return source
+
+    def _apply_noise_floor(self, source):
+        """用持续跟踪的噪音基底设置识别阈值，省去录音前的校准；样本还不够时返回 False"""
+        noise = getattr(source, 'noise', None)
+        if noise is None or not noise.ready:
+            return False
+        self.recognizer.energy_threshold = noise.energy_threshold(self.recognizer.dynamic_energy_ratio)
+        return True
 
     def start_streaming(self):
         if self._streaming:
             return True
         self._reset_stream_state()
-        def _callback(recognizer, audio):
-            try:
-                text = recognizer.recognize_google(audio, language='zh-CN')
-                if text:
-                    self.segments_log.append(text)
-                    self.stream_queue.put(text)
-                    threading.Thread(target=self._analyze_segment, args=(text,), daemon=True).start()
-            except Exception:
-                pass
         try:
-            self._stop_listening = self.recognizer.listen_in_background(self.microphone, _callback, phrase_time_limit=5)
+            source = self._input_source()
+            if source is None:
+                raise RuntimeError('没有可用的音频输入')
+            if self.audio_source is not None:
+                self.audio_source.open_stream()
+            stop = threading.Event()
+            self._stream_stop = stop
+            if STREAMING_ASR == 'paraformer':
+                threading.Thread(target=self._stream_realtime, args=(source, stop), daemon=True).start()
+            else:
+                segments = queue.Queue()
+                threading.Thread(target=self._stream_capture, args=(source, stop, segments), daemon=True).start()
+                threading.Thread(target=self._stream_recognize, args=(segments,), daemon=True).start()
             self._streaming = True
+            self.events.streaming = True
+            self.events.publish('status', {'streaming': True})
+            if self.events.shared:
+                threading.Thread(target=self._follow_shared_state, args=(stop,), daemon=True).start()
             return True
         except Exception as e:
             print(f"❌ 无法启动连续转写: {e}")
             self._streaming = False
             return False
 
-    def stop_streaming(self):
-        if self._stop_listening:
+    def _stream_capture(self, source, stop, segments):
+        # 采集线程只负责读音频和做语音活动检测，识别交给另一个线程，避免识别耗时导致丢帧
+        try:
+            with source as s:
+                vad = VADSegmenter.from_env(s.SAMPLE_RATE)
+                while not stop.is_set():
+                    data = s.stream.read(s.CHUNK)
+                    if not data:
+                        continue
+                    for segment in vad.feed(data):
+                        segments.put(sr.AudioData(segment, s.SAMPLE_RATE, s.SAMPLE_WIDTH))
+                tail = vad.flush()
+                if tail:
+                    segments.put(sr.AudioData(tail, s.SAMPLE_RATE, s.SAMPLE_WIDTH))
+        except Exception as e:
+            print(f"❌ 连续转写采集中断: {e}")
+        finally:
+            segments.put(None)
+
+    def _stream_recognize(self, segments):
+        resequencer = self._resequencer
+        while True:
+            audio = segments.get()
+            if audio is None:
+                return
             try:
-                self._stop_listening(wait_for_stop=False)
+                text, _ = asr.recognize(audio)
             except Exception:
-                pass
+                continue
+            # 识别期间会话被重置时，不再把旧音频的结果写入新的转写
+            if text and resequencer is self._resequencer:
+                self._emit_segment(text)
+
+    def _stream_realtime(self, source, stop):
+        # 实时识别：音频帧直接推给 Paraformer，中间结果只用于字幕，整句结果才进入分析
+        resequencer = self._resequencer
+        def _interim(text):
+            if resequencer is self._resequencer:
+                self.events.publish('interim', {'interim': text}, coalesce=True)
+        def _final(text):
+            if resequencer is self._resequencer:
+                self._emit_segment(text)
+        stream = ParaformerStream(_load_dashscope, _interim, _final)
+        try:
+            with source as s:
+                resampler = LinearResampler(s.SAMPLE_RATE) if s.SAMPLE_RATE != TARGET_RATE else None
+                stream.start()
+                while not stop.is_set():
+                    data = s.stream.read(s.CHUNK)
+                    if not data:
+                        continue
+                    if resampler is not None:
+                        data = to_int16_bytes(resampler.process(decode_pcm(data)))
+                    if stream.failed:
+                        print(f"⚠️ 实时识别会话中断，正在重连: {stream.error}")
+                        stream.stop()
+                        time.sleep(REALTIME_RETRY_INTERVAL)
+                        stream.start()
+                    stream.send(data)
+        except Exception as e:
+            print(f"❌ 实时识别中断: {e}")
+        finally:
+            # stop 会等待服务端返回最后一句的结果
+            stream.stop()
+
+    def _emit_segment(self, text):
+        self.segments_log.append(text, len(self.segments_log))
+        self.stream_queue.put({'segment': text})
+        self._dispatch_analysis(text)
+
+    def _follow_shared_state(self, stop):
+        # 共享状态后端下停止与重置请求可能落在其他工作进程，它只能清除共享的转写标记、增加重置代次；
+        # 采集所在进程据此重置本进程的管线并自行停止
+        while not stop.wait(SHARED_STOP_POLL):
+            self._sync_shared_generation()
+            if not self.events.streaming:
+                if self._stream_stop is stop:
+                    self.stop_streaming()
+                return
+
+    def stop_streaming(self):
+        if self._stream_stop is not None:
+            self._stream_stop.set()
+            self._stream_stop = None
+        if self._streaming or (self.events.shared and self.events.streaming):
+            self.events.streaming = False
+            self.events.publish('status', {'streaming': False})
         self._streaming = False
 
     def start_manual_recording(self):
         if self._manual_recording:
             return True
         try:
-            self._pa = pyaudio.PyAudio()
-            _kwargs = {}
-            try:
-                _dev = getattr(self.microphone, 'device_index', None)
-                if _dev is not None:
-                    _kwargs['input_device_index'] = _dev
-            except Exception:
-                pass
-            self._manual_stream = self._pa.open(format=pyaudio.paInt16, channels=self._manual_channels, rate=self._manual_rate, input=True, frames_per_buffer=self._manual_chunk, **_kwargs)
-            self._manual_frames = []
+            source = self.audio_source if self.audio_source is not None else self.microphone
+            if source is None:
+                raise RuntimeError('没有可用的音频输入')
+            # 本机麦克风由常驻采集引擎保持打开，这里只是订阅一份音频
+            with STAGE_SECONDS.time(stage='mic_open'):
+                self._manual_stream = source.open_stream()
+            stop = threading.Event()
+            with self._manual_lock:
+                self._manual_stop = stop
+                self._manual_buffer.clear()
+                self._manual_chunks = []
             self._manual_recording = True
             def _capture():
-                while self._manual_recording:
+                vad = VADSegmenter.from_env(self._manual_rate)
+                stream = self._manual_stream
+                while not stop.is_set():
                     try:
-                        data = self._manual_stream.read(self._manual_chunk, exception_on_overflow=False)
-                        self._manual_frames.append(data)
+                        data = stream.read(self._manual_chunk, exception_on_overflow=False)
+                        with self._manual_lock:
+                            if stop.is_set():
+                                break
+                            self._manual_buffer.write(data)
+                            # 检测到一句话结束（已处于停顿中）就把目前为止的录音切出来，边录边识别
+                            if vad.feed(data):
+                                self._cut_manual_chunk()
                     except Exception:
                         break
             self._manual_thread = threading.Thread(target=_capture, daemon=True)
@@ -135,138 +604,284 @@ class SocialAnxietyTranslator:
             return False
 
     def stop_manual_recording(self):
-        if not self._manual_recording and not self._manual_frames:
+        if not self._manual_recording and not len(self._manual_buffer) and not self._manual_chunks:
             return None
+        # 从点击结束到拿到文本的耗时
+        with STAGE_SECONDS.time(stage='manual_stop'):
+            return self._finish_manual_recording()
+
+    def _finish_manual_recording(self):
         try:
             self._manual_recording = False
+            # 持锁置停止标志：此后采集线程不会再写缓冲区或切片，即使下面的等待超时也不会与收尾交错
+            with self._manual_lock:
+                self._manual_stop.set()
+            # 再停止输入流唤醒阻塞中的读取，采集线程随即退出
+            stream, self._manual_stream = self._manual_stream, None
             try:
-                if self._manual_thread and self._manual_thread.is_alive():
-                    self._manual_thread.join(timeout=1.0)
+                if stream:
+                    stream.stop_stream()
             except Exception:
                 pass
-            self._manual_thread = None
-            time.sleep(0.05)
             try:
-                if self._manual_stream:
-                    self._manual_stream.stop_stream()
-                    self._manual_stream.close()
+                if self._manual_thread and self._manual_thread.is_alive():
+                    self._manual_thread.join(timeout=1.0)
             except Exception:
                 pass
+            self._manual_thread = None
             try:
-                if self._pa:
-                    self._pa.terminate()
+                if stream:
+                    stream.close()
             except Exception:
                 pass
-            pcm = b''.join(self._manual_frames)
-            self._manual_frames = []
-            buf = io.BytesIO()
-            wf = wave.open(buf, 'wb')
-            wf.setnchannels(self._manual_channels)
-            wf.setsampwidth(2)
-            wf.setframerate(self._manual_rate)
-            wf.writeframes(pcm)
-            wf.close()
-            buf.seek(0)
-            with sr.AudioFile(buf) as source:
-                audio = self.recognizer.record(source)
-            try:
-                text = self.recognizer.recognize_google(audio, language='zh-CN')
-                return text
-            except Exception:
+            # 之前的片段已在录音过程中识别，这里只需识别最后一段再按顺序拼接
+            with self._manual_lock:
+                self._cut_manual_chunk()
+                chunks, self._manual_chunks = self._manual_chunks, []
+            texts = []
+            for fut in chunks:
                 try:
-                    text = self.recognizer.recognize_sphinx(audio, language='zh-CN')
-                    return text
-                except Exception:
-                    pass
-            return None
+                    text = fut.result()
+                except Exception as e:
+                    print(f"⚠️ 录音片段识别失败: {e}")
+                    text = None
+                if text:
+                    texts.append(text)
+            return '，'.join(texts) or None
         except Exception as e:
             print(f"❌ 手动录音处理失败: {e}")
             return None
 
-    def _reset_stream_state(self):
-        try:
-            while True:
-                self.stream_queue.get_nowait()
-        except queue.Empty:
-            pass
-        try:
-            while True:
-                self.analysis_queue.get_nowait()
-        except queue.Empty:
-            pass
-        try:
-            while True:
-                self.summary_queue.get_nowait()
-        except queue.Empty:
-            pass
+    def _cut_manual_chunk(self):
+        # 调用方须持有 _manual_lock
+        if not len(self._manual_buffer):
+            return
+        # 录音缓冲区直接作为 AudioData 交给识别后端，不再经过 WAV 编码与解析
+        audio = self._manual_buffer.to_audio_data()
+        self._manual_chunks.append(manual_asr_pool.submit(self._transcribe_chunk, audio))
+
+    def _transcribe_chunk(self, audio):
+        text, _ = asr.recognize(audio)
+        return text
+
+    def _generation_alive(self):
+        # 先读共享的重置代次：会话在其他进程被重置时本地代次随之加一，进行中的调用同样作废
+        generation = self.generation
+        def alive():
+            if self.generation != generation:
+                return False
+            self._sync_shared_generation()
+            return self.generation == generation
+        return alive
+
+    def _sync_shared_generation(self):
+        """会话已在其他工作进程被重置时同样重置本进程的管线（排队的分句、进行中的分析与摘要），返回是否发生了重置"""
+        if not self.events.shared:
+            return False
+        current = self.events.generation
+        with self._generation_lock:
+            if current == self._shared_generation:
+                return False
+            self._shared_generation = current
+        print(f"🔄 会话 {self.session_id} 已在其他工作进程重置，丢弃本进程重置前的工作")
+        self._reset_stream_state(clear_events=False, propagate=False)
+        return True
+
+    def _reset_stream_state(self, clear_events=True, propagate=True):
+        # propagate：共享状态后端下把重置代次加一，其他进程中这个会话的管线随之重置
+        if propagate and self.events.shared:
+            with self._generation_lock:
+                self._shared_generation = self.events.bump_generation()
+        self.generation += 1
+        llm_router.scheduler.prune()
+        if clear_events:
+            self.events.clear()
+            self.events.publish('status', {'reset': True})
+        if len(self.segments_log) or len(self.analysis_log):
+            # 磁盘上的历史保留，只记一条分隔标记
+            transcript_store.append(self.session_id, 'reset', '重新开始')
         self.segments_log.clear()
         self.analysis_log.clear()
+        # 旧的顺序器作废，重置前仍在进行的分析结果不会再进入队列
+        self._resequencer.close()
+        self._resequencer = Resequencer(self._on_analysis)
+        self._batcher.clear()
+        self._summarizer.reset()
 
-    def _analyze_segment(self, text):
+    def _dispatch_analysis(self, text):
+        ticket = self._resequencer.ticket()
+        quick = phrasebook.lookup(text, 'segment')
+        if quick:
+            print(f"⚡ 命中常用短语: {text}")
+            self._emit_analysis(ticket, quick)
+            return
+        # 排队期间到达的多个分句会被合并成一次调用
+        self._batcher.add(text, ticket)
+
+    def _on_analysis(self, result, ok=True, seq=None):
+        if ok:
+            self.analysis_log.append(result, seq)
+        self.analysis_queue.put({'analysis': result, 'seq': seq})
+        if ok:
+            # 摘要会合并短时间内的多次触发，调用次数随对话时长而非分句数增长
+            self._summarizer.trigger()
+
+    def _emit_analysis(self, ticket, result, ok=True):
+        # 发布前确认会话没有在其他进程被重置；重置后旧顺序器已关闭，旧分句的结果不会再进入队列
+        superseded = self._sync_shared_generation()
+        if ticket is None:
+            if not superseded:
+                self._on_analysis(result, ok)
+        else:
+            ticket.publish(result, ok, ticket.seq)
+
+    def _analysis_delta_sink(self, ticket):
+        # 生成中的分析直接推送（带分句序号），最终结果仍按顺序由顺序器输出
+        seq = ticket.seq if ticket else None
+        def _push(partial):
+            if ticket is None or ticket.alive:
+                self.analysis_queue.put({'analysis_delta': partial, 'seq': seq})
+        return _push
+
+    def _reject_segments(self, items):
+        # 分析线程池已满且无法合并，给这些分句输出失败结果，前端能看到而不是一直等待
+        for text, ticket in items:
+            print(f"⚠️ 分析队列已满，放弃分析: {text}")
+            FAILURES.inc(stage='segment')
+            self._emit_analysis(ticket, '分析失败: 分析队列已满，请稍后再试', False)
+
+    def _analyze_segment(self, text, ticket=None):
         try:
-            print(f"分析分句: {text}")
-            completion = client.chat.completions.create(
-                model="qwen3-max",
-                messages=[
-                    {"role": "system", "content": "你是一个社交意图分析专家，识别中文客套话并给出真实意图与建议回应"},
-                    {"role": "user", "content": f"文本：{text}\n请输出：类型、真实意图、建议回应"}
-                ],
-                stream=False,
-                temperature=0.2
-            )
-            result = completion.choices[0].message.content
-            self.analysis_log.append(result)
-            self.analysis_queue.put(result)
-            threading.Thread(target=self._update_summary, daemon=True).start()
+            cached = llm_cache.get(text, 'segment', LLM_MODELS, 0.2)
         except Exception as e:
-            print(f"AI分析失败: {e}")
+            self._fail_segment(text, ticket, e)
+            return
+        if cached:
+            print(f"⚡ 命中分析缓存: {text}")
+            self._finish_segment(text, ticket, cached)
+            return
+        self._analyze_segment_uncached(text, ticket)
+
+    def _analyze_batch(self, items):
+        """一次调用分析多条分句，结果按编号拆回各自的顺序号"""
+        misses = []
+        for text, ticket in items:
             try:
-                response = Generation.call(
-                    model='qwen-turbo',
-                    prompt=f"请分析是否为客套话，并给出真实意图与建议回应：{text}",
-                    stream=False,
-                    temperature=0.2
-                )
-                if hasattr(response, 'status_code') and response.status_code == 200:
-                    self.analysis_log.append(response.output.text)
-                    self.analysis_queue.put(response.output.text)
-                    threading.Thread(target=self._update_summary, daemon=True).start()
-                else:
-                    self.analysis_queue.put(f"分析失败: {getattr(response, 'message', 'unknown error')}")
-            except Exception as e2:
-                self.analysis_queue.put(f"分析失败: {e2}")
-
-    def _update_summary(self):
+                cached = llm_cache.get(text, 'segment', LLM_MODELS, 0.2)
+            except Exception as e:
+                self._fail_segment(text, ticket, e)
+                continue
+            if cached:
+                self._finish_segment(text, ticket, cached)
+            else:
+                misses.append((text, ticket))
+        if len(misses) <= 1:
+            for text, ticket in misses:
+                self._analyze_segment_uncached(text, ticket)
+            return
+        try:
+            print(f"批量分析{len(misses)}条分句")
+            messages = _batch_messages([t for t, _ in misses])
+            raw, model = llm_router.call('batch', messages, messages[-1]['content'], 0.2,
+                                         alive=_ticket_alive(misses[0][1]))
+            results = _split_batch_result(raw, len(misses))
+        except Superseded:
+            print(f"🗑️ 会话已重置，丢弃{len(misses)}条分句的批量分析")
+            return
+        except Exception as e:
+            # 路由层已尝试过全部模型（或出现意外错误），不再逐条重试，避免在故障期间成倍放大等待时间
+            print(f"批量分析失败: {e}")
+            for text, ticket in misses:
+                self._fail_segment(text, ticket, e)
+            return
+        for (text, ticket), result in zip(misses, results):
+            if result:
+                self._finish_segment(text, ticket, result, model)
+            else:
+                # 模型漏掉或格式不对的条目单独重试
+                self._analyze_segment_uncached(text, ticket)
+
+    def _analyze_segment_uncached(self, text, ticket=None):
+        try:
+            print(f"分析分句: {text}")
+            result, model = llm_router.call('segment', _segment_messages(text), _segment_prompt(text), 0.2,
+                                            on_delta=self._analysis_delta_sink(ticket), alive=_ticket_alive(ticket))
+        except Superseded:
+            print(f"🗑️ 会话已重置，丢弃分析: {text}")
+            return
+        except Exception as e:
+            self._fail_segment(text, ticket, e)
+            return
+        self._finish_segment(text, ticket, result, model)
+
+    def _finish_segment(self, text, ticket, result, model=None):
+        # model 为 None 表示结果来自缓存，不再写回
+        try:
+            if model is not None:
+                llm_cache.set(text, 'segment', model, 0.2, result)
+            self._emit_analysis(ticket, result)
+        except Exception as e:
+            self._fail_segment(text, ticket, e)
+
+    def _fail_segment(self, text, ticket, error):
+        """输出分句的失败结果；每条分句都必须以结果或 skip 结束，否则顺序器会一直等待它的顺序号"""
+        print(f"AI分析失败: {error}")
+        FAILURES.inc(stage='segment')
+        try:
+            self._emit_analysis(ticket, f"分析失败: {error}", False)
+        except Exception as e:
+            print(f"❌ 输出分析失败结果时出错: {e}")
+            if ticket is not None:
+                ticket.skip()
+
+    def _publish_summary(self, summary):
+        self.summary_queue.put({'summary': summary})
+
+    def _collect_summary_input(self, cursor):
+        # 只取上次摘要之后新增的语句与分析
+        seg_start, ana_start = cursor or (0, 0)
+        segments = self.segments_log.since(seg_start)
+        analyses = self.analysis_log.since(ana_start)
+        if not segments and not analyses:
+            return None, cursor
+        return (segments, analyses), (self.segments_log.total, self.analysis_log.total)
+
+    def _update_summary(self, previous, items):
+        with STAGE_SECONDS.time(stage='summary'):
+            ok, summary = self._update_summary_call(previous, items)
+        if ok:
+            transcript_store.append(self.session_id, 'summary', summary)
+        return ok, summary
+
+    def _update_summary_call(self, previous, items):
+        segments, analyses = items
+        content = "\n".join([f"- 语句: {s}" for s in segments]) + "\n" + \
+                  "\n".join([f"- 分析: {a}" for a in analyses])
+        if previous:
+            user_prompt = f"当前摘要：\n{previous}\n\n新增内容：\n{content}\n请在当前摘要基础上合并新增内容，输出不超过5条的要点摘要"
+        else:
+            user_prompt = f"请基于以下内容生成不超过5条的要点摘要：\n{content}"
+        # 会话在本进程或其他进程被重置时抛出 Superseded；共享代次在这里（摘要器的锁外）同步，
+        # 发布摘要时摘要器持有自己的锁，不能再重置它
+        alive = self._generation_alive()
         try:
-            last_segments = self.segments_log[-5:]
-            last_analyses = self.analysis_log[-5:]
-            content = "\n".join([f"- 语句: {s}" for s in last_segments]) + "\n" + \
-                      "\n".join([f"- 分析: {a}" for a in last_analyses])
-            completion = client.chat.completions.create(
-                model="qwen3-max",
-                messages=[
+            summary, _ = llm_router.call(
+                'summary',
+                [
                     {"role": "system", "content": "你是摘要助手，请将最近语句与分析总结为简洁中文要点，突出真实意图与互动建议"},
-                    {"role": "user", "content": f"请基于以下内容生成不超过5条的要点摘要：\n{content}"}
+                    {"role": "user", "content": user_prompt}
                 ],
-                stream=False,
-                temperature=0.2
+                user_prompt,
+                0.2,
+                on_delta=lambda partial: self.summary_queue.put({'summary_delta': partial}),
+                alive=alive
             )
-            summary = completion.choices[0].message.content
-            self.summary_queue.put(summary)
-        except Exception as e:
-            try:
-                response = Generation.call(
-                    model='qwen-turbo',
-                    prompt=f"请对以下内容生成简洁要点摘要：\n{content}",
-                    stream=False,
-                    temperature=0.2
-                )
-                if hasattr(response, 'status_code') and response.status_code == 200:
-                    self.summary_queue.put(response.output.text)
-                else:
-                    self.summary_queue.put(f"摘要失败: {getattr(response, 'message', 'unknown error')}")
-            except Exception as e2:
-                self.summary_queue.put(f"摘要失败: {e2}")
+            if not alive():
+                raise Superseded()
+            return True, summary
+        except LLMUnavailable as e:
+            FAILURES.inc(stage='summary')
+            return False, f"摘要失败: {e}"
         
     def speech_to_text(self):
         """将语音转换为文本"""
@@ -278,13 +893,14 @@ class SocialAnxietyTranslator:
             print("🎤 正在激活麦克风...")
             
             # 重新检查麦克风状态
-            with self.microphone as source:
+            with self._input_source() as source:
                 print("✅ 麦克风已激活")
                 print("🎤 请说话...（最多10秒）")
                 
-                # 调整环境噪音
-                print("🔊 调整环境噪音...")
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                # 调整环境噪音：采集常驻时直接使用持续跟踪的噪音基底
+                if not self._apply_noise_floor(source):
+                    print("🔊 调整环境噪音...")
+                    self.recognizer.adjust_for_ambient_noise(source, duration=1)
                 print("✅ 环境噪音调整完成")
                 
                 # 监听语音 - 关键步骤！
@@ -311,88 +927,77 @@ class SocialAnxietyTranslator:
             print(f"错误类型: {type(e).__name__}")
             return None
             
-        try:
-            print("🧠 正在识别语音...")
-            text = self.recognizer.recognize_google(audio, language='zh-CN')
-            print(f"🎯 识别到的文本: {text}")
+        print("🧠 正在识别语音...")
+        text, backend = asr.recognize(audio)
+        if text:
+            print(f"🎯 识别到的文本（{backend}）: {text}")
             return text
-        except sr.UnknownValueError:
-            print("❌ 无法识别语音内容")
-            print("🔄 尝试备用识别引擎...")
-            try:
-                text = self.recognizer.recognize_sphinx(audio, language='zh-CN')
-                print(f"🎯 Sphinx识别结果: {text}")
-                return text
-            except Exception as sphinx_e:
-                print(f"❌ 备用识别也失败: {sphinx_e}")
-                return None
-        except sr.RequestError as e:
-            print(f"❌ 语音识别服务错误: {e}")
-            print("💡 请检查网络连接")
-            return None
+        print("❌ 无法识别语音内容")
+        print("💡 请检查网络连接或重新录音")
+        return None
         
-    def translate_politeness(self, text):
-        """使用大模型判断是否为客套话并翻译真实意图"""
+    def translate_politeness(self, text, on_delta=None, alive=None):
+        """使用大模型判断是否为客套话并翻译真实意图；on_delta 用于流式接收生成中的文本
+
+        alive 为发起时取得的代次标记（缺省为当前代次），会话在此之后被重置时抛出 Superseded。
+        """
         if not text:
             return None
-            
-        prompt = f"""
-        你是一个社交意图分析专家。请分析以下中文文本，判断说话者是否在说客套话，
-        并给出其真实意图。如果是客套话，请直接翻译出真实含义；如果不是客套话，
-        请说明这是真诚的表达。
-        
-        文本: "{text}"
-        
-        请按照以下格式回复：
-        分析: [简要分析]
-        类型: [客套话/真诚表达]
-        真实意图: [翻译后的真实含义，如果是客套话]
-        建议回应: [给社恐人士的建议回应]
-        """
-        
+        alive = alive or self._generation_alive()
+        ready = self._translate_lookup(text, alive)
+        if ready:
+            return ready
+        prompt = _politeness_prompt(text)
         try:
-            # 使用OpenAI兼容模式调用qwen3-max
-            print(f"🤖 正在调用qwen3-max模型分析文本: {text}")
-            
-            completion = client.chat.completions.create(
-                model="qwen3-max",
-                messages=[
-                    {"role": "system", "content": "你是一个专业的社交意图分析专家，擅长识别中文客套话和分析真实意图。"},
-                    {"role": "user", "content": prompt}
-                ],
-                stream=False,
-                temperature=0.7
-            )
-            
-            result = completion.choices[0].message.content
-            print(f"✅ AI分析结果: {result}")
-            return result
-            
-        except Exception as e:
-            print(f"❌ 调用大模型API时出错: {e}")
-            print("🔄 尝试使用备用方法...")
-            
-            # 备用方法：使用原来的dashscope方法
-            try:
-                response = Generation.call(
-                    model='qwen-turbo',
-                    prompt=prompt,
-                    stream=False,
-                    temperature=0.7
-                )
-                
-                if response.status_code == 200:
-                    result = response.output.text
-                    print(f"✅ 备用方法成功: {result}")
-                    return result
-                else:
-                    print(f"❌ 备用方法也失败: {response.status_code}")
-                    return None
-                    
-            except Exception as e2:
-                print(f"❌ 所有方法都失败: {e2}")
-                return None
-        
+            # 由路由层选择模型：qwen3-max 优先，出错、过慢或熔断时改用 qwen-turbo
+            print(f"🤖 正在调用大模型分析文本: {text}")
+            result, model = llm_router.call('translate', _politeness_messages(prompt), prompt, 0.7, on_delta=on_delta,
+                                            alive=alive)
+        except LLMUnavailable as e:
+            return self._translate_failed(e)
+        return self._translate_done(text, model, result)
+
+    async def translate_politeness_async(self, text, on_delta=None, alive=None):
+        """translate_politeness 的协程版本：大模型走异步客户端，缓存读写放到线程中，供 ASGI 模式使用"""
+        if not text:
+            return None
+        alive = alive or self._generation_alive()
+        ready = await asyncio.to_thread(self._translate_lookup, text, alive)
+        if ready:
+            return ready
+        prompt = _politeness_prompt(text)
+        try:
+            print(f"🤖 正在调用大模型分析文本: {text}")
+            result, model = await llm_router.call_async('translate', _politeness_messages(prompt), prompt, 0.7,
+                                                        on_delta=on_delta, alive=alive)
+        except LLMUnavailable as e:
+            return self._translate_failed(e)
+        return await asyncio.to_thread(self._translate_done, text, model, result)
+
+    def _translate_lookup(self, text, alive):
+        """调用大模型之前：会话已重置时抛出 Superseded，命中常用短语或缓存时直接返回结果"""
+        if not alive():
+            raise Superseded()
+        quick = phrasebook.lookup(text, 'translate')
+        if quick:
+            print(f"⚡ 命中常用短语: {text}")
+            return quick
+        cached = llm_cache.get(text, 'translate', LLM_MODELS, 0.7)
+        if cached:
+            print(f"⚡ 命中分析缓存: {text}")
+            return cached
+        return None
+
+    def _translate_done(self, text, model, result):
+        print(f"✅ AI分析结果（{model}）: {result}")
+        llm_cache.set(text, 'translate', model, 0.7, result)
+        return result
+
+    def _translate_failed(self, error):
+        print(f"❌ 所有方法都失败: {error}")
+        FAILURES.inc(stage='translate')
+        return None
+
     def process_audio(self):
         """完整的语音处理流程"""
         print("=== 社恐翻译器启动 ===")
@@ -415,19 +1020,25 @@ class SocialAnxietyTranslator:
         for attempt in range(1, max_attempts + 1):
             try:
                 on_status('🎤 正在激活麦克风...')
-                with self.microphone as source:
+                opened = time.perf_counter()
+                with self._input_source() as source:
+                    STAGE_SECONDS.observe(time.perf_counter() - opened, stage='mic_open', outcome='ok')
                     on_status('✅ 麦克风已激活')
-                    on_status('🔊 正在校准环境噪音...')
-                    self.recognizer.adjust_for_ambient_noise(source, duration=0.8)
+                    # 采集常驻时噪音基底一直在更新，只有样本不足（刚启动）时才需要校准
+                    if not self._apply_noise_floor(source):
+                        on_status('🔊 正在校准环境噪音...')
+                        with STAGE_SECONDS.time(stage='calibration'):
+                            self.recognizer.adjust_for_ambient_noise(source, duration=0.8)
                     self.recognizer.dynamic_energy_threshold = True
                     self.recognizer.pause_threshold = 0.5
                     self.recognizer.non_speaking_duration = 0.15
                     on_status(f'🎤 麦克风就绪（第{attempt}次），请开始说话')
-                    audio = self.recognizer.listen(
-                        source,
-                        timeout=15,
-                        phrase_time_limit=8
-                    )
+                    with STAGE_SECONDS.time(stage='capture'):
+                        audio = self.recognizer.listen(
+                            source,
+                            timeout=15,
+                            phrase_time_limit=8
+                        )
                     on_status('⏹️ 录音完成，正在识别...')
             except sr.WaitTimeoutError:
                 on_status(f'❌ 未检测到语音（第{attempt}次），正在重试')
@@ -435,49 +1046,15 @@ class SocialAnxietyTranslator:
             except Exception:
                 on_status(f'❌ 录音出错（第{attempt}次），正在重试')
                 continue
-            # 识别阶段
-            try:
-                on_status('🧠 正在识别语音...')
-                result = self.recognizer.recognize_google(audio, language='zh-CN', show_all=True)
-                if isinstance(result, dict) and 'alternative' in result and len(result['alternative']) > 0:
-                    text = result['alternative'][0].get('transcript', '')
-                else:
-                    text = result if isinstance(result, str) else ''
-                if text and text.strip():
-                    on_status('✅ 已识别，正在分析...')
-                    return text.strip()
-                else:
-                    raise sr.UnknownValueError()
-            except sr.UnknownValueError:
-                on_status(f'❌ 无法识别（第{attempt}次），尝试备用识别')
-                try:
-                    text = self.recognizer.recognize_sphinx(audio, language='zh-CN')
-                    if text and text.strip():
-                        on_status('✅ 已识别，正在分析...')
-                        return text.strip()
-                except Exception:
-                    pass
-                try:
-                    wav_path = "/tmp/social_anxiety_input.wav"
-                    wav_data = audio.get_wav_data(convert_rate=16000, convert_width=2)
-                    with open(wav_path, "wb") as f:
-                        f.write(wav_data)
-                    recognition = Recognition(model='paraformer-realtime-v2', format='wav', sample_rate=16000, language_hints=['zh'], callback=None)
-                    result = recognition.call(wav_path)
-                    if result.status_code == HTTPStatus.OK:
-                        sentences = result.get_sentence()
-                        joined = "".join([s.get('text') if isinstance(s, dict) else str(s) for s in sentences])
-                        if joined.strip():
-                            on_status('✅ 已识别，正在分析...')
-                            return joined.strip()
-                except Exception:
-                    pass
-                on_status(f'❌ 识别失败（第{attempt}次）')
-                continue
-            except sr.RequestError:
-                on_status(f'❌ 语音识别服务错误（第{attempt}次）')
-                continue
+            # 识别阶段：多个识别后端对冲调用，取最先返回的可信结果
+            on_status('🧠 正在识别语音...')
+            text, _ = asr.recognize(audio)
+            if text:
+                on_status('✅ 已识别，正在分析...')
+                return text
+            on_status(f'❌ 识别失败（第{attempt}次）')
         on_status('❌ 多次尝试仍未识别，请检查麦克风并重试')
+        FAILURES.inc(stage='asr')
         return None
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+import os
+from collections import deque
+
+import numpy as np
+
+
+class VADSegmenter:
+    """帧级语音活动检测：按短时能量 + 过零率判断语音帧，在自然停顿处切分语音段
+
+    - 噪声基底随非语音帧自适应更新，阈值为基底的 threshold 倍
+    - 语音结束后保留 hangover 秒的拖尾，期间重新出现语音则继续同一段
+    - 每段前补 pre_roll 秒的起始音频，避免吞掉首字
+    - 短于 min_speech 秒的语音段视为噪声丢弃，长于 max_segment 秒时强制切分
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, threshold=3.0, min_energy=60.0,
+                 min_speech=0.3, max_segment=10.0, hangover=0.5, pre_roll=0.3,
+                 noise_alpha=0.05, zcr_threshold=0.25):
+        self.sample_rate = sample_rate
+        self.frame_len = max(int(sample_rate * frame_ms / 1000), 1)
+        self.frame_bytes = self.frame_len * 2
+        frame_sec = self.frame_len / sample_rate
+        self.threshold = threshold
+        self.min_energy = min_energy
+        self.min_speech_frames = max(int(round(min_speech / frame_sec)), 1)
+        self.max_segment_frames = max(int(round(max_segment / frame_sec)), 1)
+        self.hangover_frames = max(int(round(hangover / frame_sec)), 1)
+        self.noise_alpha = noise_alpha
+        self.zcr_threshold = zcr_threshold
+        self.noise_floor = None
+        self._carry = b''
+        self._pre_roll = deque(maxlen=max(int(round(pre_roll / frame_sec)), 1))
+        self._pre_roll_enabled = pre_roll > 0
+        self._segment = None
+        self._voiced = 0
+        self._silence = 0
+
+    @classmethod
+    def from_env(cls, sample_rate=16000):
+        return cls(
+            sample_rate=sample_rate,
+            frame_ms=int(os.getenv('VAD_FRAME_MS', '30')),
+            threshold=float(os.getenv('VAD_THRESHOLD', '3.0')),
+            min_speech=float(os.getenv('VAD_MIN_SPEECH', '0.3')),
+            max_segment=float(os.getenv('VAD_MAX_SEGMENT', '10')),
+            hangover=float(os.getenv('VAD_HANGOVER', '0.5')),
+            pre_roll=float(os.getenv('VAD_PRE_ROLL', '0.3')),
+        )
+
+    @property
+    def in_speech(self):
+        return self._segment is not None
+
+    def _classify(self, frames):
+        """向量化计算每帧的能量与过零率，返回 (能量, 疑似清音) 数组"""
+        samples = frames.astype(np.float32)
+        energy = np.sqrt(np.mean(samples * samples, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / float(self.frame_len)
+        return energy, zcr >= self.zcr_threshold
+
+    def feed(self, pcm):
+        """送入一段 16 位单声道 PCM，返回本次切出的完整语音段（bytearray 列表）"""
+        data = self._carry + bytes(pcm)
+        usable = len(data) - len(data) % self.frame_bytes
+        self._carry = data[usable:]
+        if not usable:
+            return []
+        frames = np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, self.frame_len)
+        energy, unvoiced = self._classify(frames)
+        if self.noise_floor is None:
+            self.noise_floor = max(float(np.percentile(energy, 20)), self.min_energy)
+        segments = []
+        raw = memoryview(data)
+        # 逐帧递推：每帧的阈值取决于前面各帧的判定结果（噪声基底随判定更新），无法整块预先算出；
+        # 能量与过零率已向量化，循环内只剩标量运算
+        noise_floor, alpha, ratio, min_energy = self.noise_floor, self.noise_alpha, self.threshold, self.min_energy
+        for i, (e, is_unvoiced) in enumerate(zip(energy.tolist(), unvoiced.tolist())):
+            threshold = max(noise_floor, min_energy) * ratio
+            # 浊音靠能量判断；清音（擦音等）能量较低但过零率高，放宽一半阈值
+            speech = e >= threshold or (is_unvoiced and e >= threshold * 0.5)
+            if speech:
+                # 持续的语音中基底只缓慢上升，防止环境噪声突然变大后一直判为语音
+                noise_floor += alpha * 0.002 * (e - noise_floor)
+            else:
+                noise_floor += alpha * (e - noise_floor)
+            segment = self._step(raw[i * self.frame_bytes:(i + 1) * self.frame_bytes], speech)
+            if segment:
+                segments.append(segment)
+        self.noise_floor = noise_floor
+        return segments
+
+    def _step(self, frame, speech):
+        if self._segment is None:
+            if not speech:
+                if self._pre_roll_enabled:
+                    self._pre_roll.append(bytes(frame))
+                return None
+            self._segment = bytearray(b''.join(self._pre_roll))
+            self._pre_roll.clear()
+            self._voiced = 0
+            self._silence = 0
+        self._segment += frame
+        if speech:
+            self._voiced += 1
+            self._silence = 0
+        else:
+            self._silence += 1
+        if self._silence >= self.hangover_frames:
+            return self._finish()
+        if self._voiced + self._silence >= self.max_segment_frames:
+            # 过长的语音段强制切分，下一帧开始新的一段
+            return self._finish()
+        return None
+
+    def _finish(self):
+        segment, voiced = self._segment, self._voiced
+        self._segment = None
+        self._voiced = 0
+        self._silence = 0
+        if voiced < self.min_speech_frames:
+            return None
+        return segment
+
+    def flush(self):
+        """结束采集：返回尚未结束的语音段（若足够长）"""
+        self._carry = b''
+        self._pre_roll.clear()
+        if self._segment is None:
+            return None
+        return self._finish()
+
+
+
+class NoiseFloor:
+    """持续跟踪环境噪音的 RMS 能量（与 speech_recognition 的 energy_threshold 同一量纲）
+
+    安静帧按 alpha 平滑更新，疑似语音帧（高于基底 speech_ratio 倍）不参与更新；
+    全零帧（推流断档时补的静音）忽略。采集常驻时录音前无需再单独校准。
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=30, alpha=0.05, speech_ratio=3.0, warmup=0.5):
+        self.frame_len = max(int(sample_rate * frame_ms / 1000), 1)
+        self.alpha = alpha
+        self.speech_ratio = speech_ratio
+        self.warmup_frames = max(int(warmup * sample_rate / self.frame_len), 1)
+        self.value = None
+        self.frames = 0
+        self._carry = b''
+
+    @property
+    def ready(self):
+        return self.value is not None and self.frames >= self.warmup_frames
+
+    def update(self, pcm):
+        data = self._carry + bytes(pcm)
+        usable = len(data) - len(data) % (self.frame_len * 2)
+        self._carry = data[usable:]
+        if not usable:
+            return
+        frames = np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, self.frame_len).astype(np.float32)
+        energy = np.sqrt(np.mean(frames * frames, axis=1))
+        for e in energy[energy > 0]:
+            e = float(e)
+            if self.value is None:
+                self.value = e
+            elif e < self.value * self.speech_ratio:
+                self.value += self.alpha * (e - self.value)
+            self.frames += 1
+
+    def energy_threshold(self, ratio=1.5):
+        """与 adjust_for_ambient_noise 一致：阈值为噪音能量的 ratio 倍"""
+        return self.value * ratio
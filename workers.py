@@ -0,0 +1,583 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+OVERFLOW_POLICIES = ('drop_oldest', 'block', 'coalesce')
+
+
+class _Job:
+    __slots__ = ('fn', 'args', 'key', 'merge', 'on_drop')
+
+    def __init__(self, fn, args, key, merge, on_drop):
+        self.fn = fn
+        self.args = args
+        self.key = key
+        self.merge = merge
+        self.on_drop = on_drop
+
+    def drop(self):
+        if self.on_drop:
+            try:
+                self.on_drop()
+            except Exception as e:
+                print(f"⚠️ 丢弃任务回调出错: {e}")
+
+
+class BoundedExecutor:
+    """固定线程数 + 有界队列的执行器，队列满时按策略处理：
+
+    - drop_oldest：丢弃最早排队的任务
+    - block：提交方阻塞等待空位（对上游形成背压）；本池工作线程提交的后续任务（如分批调度）不阻塞，
+      能合并时合并进排队任务，否则直接入队（可暂时超出队列上限），避免所有工作线程互相等待
+    - coalesce：把新任务合并进最近一个可合并的排队任务（同一 fn 且带 merge），无法合并时拒绝；
+      merge(旧参数, 新参数) 返回合并后的参数，合并后的任务要完成两者的工作，新任务不会再触发 on_drop
+
+    提交时带 key 的任务，若已有同 key 的任务在排队，则直接用新任务替换旧任务。
+    """
+
+    def __init__(self, max_workers=4, max_queue=32, overflow='drop_oldest', name='worker'):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f'未知的溢出策略: {overflow}')
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.overflow = overflow
+        self.name = name
+        self._jobs = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._active = 0
+        self._shutdown = False
+        self._local = threading.local()
+        self.stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0, 'dropped': 0, 'coalesced': 0}
+
+    @classmethod
+    def from_env(cls, prefix, max_workers, max_queue, overflow):
+        return cls(
+            max_workers=int(os.getenv(f'{prefix}_WORKERS', str(max_workers))),
+            max_queue=int(os.getenv(f'{prefix}_QUEUE_SIZE', str(max_queue))),
+            overflow=os.getenv(f'{prefix}_OVERFLOW', overflow),
+            name=prefix.lower(),
+        )
+
+    def submit(self, fn, *args, key=None, merge=None, on_drop=None):
+        """提交任务；被拒绝时返回 False 并调用 on_drop"""
+        job = _Job(fn, args, key, merge, on_drop)
+        dropped = []
+        accepted = True
+        with self._cond:
+            if self._shutdown:
+                accepted = False
+            elif key is not None and self._replace_same_key(job, dropped):
+                pass
+            else:
+                if len(self._jobs) >= self.max_queue:
+                    if self.overflow == 'block' and getattr(self._local, 'worker', False):
+                        if self._merge_into_pending(job):
+                            job = None
+                    elif self.overflow == 'block':
+                        self._cond.wait_for(lambda: len(self._jobs) < self.max_queue or self._shutdown)
+                    elif self.overflow == 'drop_oldest':
+                        dropped.append(self._jobs.popleft())
+                        self.stats['dropped'] += 1
+                    elif self._merge_into_pending(job):
+                        job = None
+                    else:
+                        accepted = False
+                if accepted and job is not None and not self._shutdown:
+                    self._jobs.append(job)
+                    self._ensure_workers()
+                    self._cond.notify_all()
+                elif self._shutdown:
+                    accepted = False
+            if accepted:
+                self.stats['submitted'] += 1
+            else:
+                self.stats['rejected'] += 1
+        for old in dropped:
+            old.drop()
+        if not accepted:
+            job.drop()
+        return accepted
+
+    def _replace_same_key(self, job, dropped):
+        for i, pending in enumerate(self._jobs):
+            if pending.key == job.key:
+                self._jobs[i] = job
+                dropped.append(pending)
+                self.stats['coalesced'] += 1
+                self._cond.notify_all()
+                return True
+        return False
+
+    def _merge_into_pending(self, job):
+        for pending in reversed(self._jobs):
+            if pending.merge is not None and pending.fn == job.fn:
+                pending.args = pending.merge(pending.args, job.args)
+                self.stats['coalesced'] += 1
+                return True
+        return False
+
+    def _ensure_workers(self):
+        self._threads = [t for t in self._threads if t.is_alive()]
+        if len(self._threads) < self.max_workers and len(self._jobs) > 0:
+            t = threading.Thread(target=self._worker, name=f'{self.name}-{len(self._threads)}', daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _worker(self):
+        self._local.worker = True
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._jobs or self._shutdown)
+                if self._shutdown and not self._jobs:
+                    return
+                job = self._jobs.popleft()
+                self._active += 1
+                self._cond.notify_all()
+            try:
+                job.fn(*job.args)
+                ok = True
+            except Exception as e:
+                print(f"❌ 后台任务失败({self.name}): {e}")
+                ok = False
+            with self._cond:
+                self._active -= 1
+                self.stats['completed' if ok else 'failed'] += 1
+
+    def shutdown(self):
+        with self._cond:
+            self._shutdown = True
+            self._cond.notify_all()
+
+    def snapshot(self):
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update({
+                'queue_depth': len(self._jobs),
+                'active': self._active,
+                'max_workers': self.max_workers,
+                'max_queue': self.max_queue,
+                'overflow': self.overflow,
+            })
+        return stats
+
+
+class KeyedSerialExecutor:
+    """按 key 串行、不同 key 并行的执行器：同一 key 的任务按提交顺序逐个执行，所有 key 共用固定大小的线程池
+
+    每执行完一个任务，同一 key 的下一个任务重新排到线程池队尾，任务很多的 key 不会一直占着线程。
+    """
+
+    def __init__(self, max_workers=4, name='serial'):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._queues = {}
+        self._lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        """返回 concurrent.futures.Future"""
+        future = Future()
+        with self._lock:
+            queue = self._queues.get(key)
+            if queue is not None:
+                # 同一 key 已有任务在执行或排队，排在它们之后
+                queue.append((fn, args, future))
+                return future
+            self._queues[key] = deque()
+        self._pool.submit(self._run, key, fn, args, future)
+        return future
+
+    def _run(self, key, fn, args, future):
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+        with self._lock:
+            queue = self._queues[key]
+            if not queue:
+                del self._queues[key]
+                return
+            fn, args, future = queue.popleft()
+        self._pool.submit(self._run, key, fn, args, future)
+
+    def snapshot(self):
+        with self._lock:
+            return {'max_workers': self.max_workers, 'keys': len(self._queues),
+                    'queue_depth': sum(len(q) for q in self._queues.values())}
+
+
+class Resequencer:
+    """按提交顺序输出乱序完成的结果；丢弃的任务需调用 skip 以免阻塞后续结果"""
+
+    _SKIP = object()
+
+    def __init__(self, emit):
+        self._emit = emit
+        self._next_ticket = 0
+        self._next_emit = 0
+        self._ready = {}
+        self._lock = threading.Lock()
+        self.closed = False
+
+    def ticket(self):
+        with self._lock:
+            seq = self._next_ticket
+            self._next_ticket += 1
+        return Ticket(self, seq)
+
+    def _publish(self, seq, item):
+        with self._lock:
+            if self.closed or seq < self._next_emit:
+                return
+            self._ready[seq] = item
+            # 在锁内按序输出，保证多个工作线程并发完成时顺序不乱
+            while self._next_emit in self._ready:
+                ready = self._ready.pop(self._next_emit)
+                self._next_emit += 1
+                if ready is not self._SKIP:
+                    self._emit(*ready)
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            self._ready.clear()
+
+    def pending(self):
+        with self._lock:
+            return len(self._ready)
+
+
+class Ticket:
+    __slots__ = ('_owner', 'seq')
+
+    def __init__(self, owner, seq):
+        self._owner = owner
+        self.seq = seq
+
+    @property
+    def alive(self):
+        return not self._owner.closed
+
+    def publish(self, *item):
+        self._owner._publish(self.seq, item)
+
+    def skip(self):
+        self._owner._publish(self.seq, Resequencer._SKIP)
+
+
+class MicroBatcher:
+    """把同一会话中排队等待的分句打包成一次调用
+
+    - 调度任务在线程池中排队期间到达的分句会被攒在一起；执行时最多取 limit 个、
+      且估算 token 不超过 token_budget，只有一个时仍按单句处理
+    - limit 按积压与观测耗时自适应：仍有积压且耗时未超过 target_latency 时加一，
+      超过时减半（加性增、乘性减）
+    """
+
+    ITEM_OVERHEAD = 120  # 每条分句预留的输出 token
+
+    def __init__(self, run_single, run_batch, executor, max_batch=8, token_budget=2000, target_latency=4.0,
+                 on_reject=None):
+        self._run_single = run_single
+        self._run_batch = run_batch
+        self._on_reject = on_reject
+        self._executor = executor
+        self.max_batch = max(1, max_batch)
+        self.token_budget = token_budget
+        self.target_latency = target_latency
+        self.limit = min(2, self.max_batch)
+        self.latency = None
+        self._pending = deque()
+        self._scheduled = False
+        self._lock = threading.Lock()
+        self.stats = {'items': 0, 'runs': 0, 'batches': 0, 'batched_items': 0, 'dropped': 0}
+
+    @classmethod
+    def from_env(cls, run_single, run_batch, executor, on_reject=None):
+        return cls(
+            run_single, run_batch, executor,
+            max_batch=int(os.getenv('ANALYSIS_BATCH_MAX', '8')),
+            token_budget=int(os.getenv('ANALYSIS_BATCH_TOKENS', '2000')),
+            target_latency=float(os.getenv('ANALYSIS_BATCH_TARGET_LATENCY', '4.0')),
+            on_reject=on_reject,
+        )
+
+    def add(self, text, ticket):
+        with self._lock:
+            self._pending.append((text, ticket))
+            self.stats['items'] += 1
+            if self._scheduled:
+                return
+            self._scheduled = True
+        self._schedule()
+
+    def _schedule(self):
+        # 线程池队列满时，调度任务并入排队中的其他调度任务（一次排空多个会话），而不是被拒绝
+        batchers = [self]
+        self._executor.submit(_drain_batchers, batchers, key=('batch', id(self)), merge=_merge_drains,
+                              on_drop=lambda: [b._on_dropped() for b in batchers])
+
+    def _take(self):
+        batch = []
+        tokens = 0
+        while self._pending and len(batch) < self.limit:
+            cost = len(self._pending[0][0]) + self.ITEM_OVERHEAD
+            if batch and tokens + cost > self.token_budget:
+                break
+            batch.append(self._pending.popleft())
+            tokens += cost
+        return batch
+
+    def _drain(self):
+        with self._lock:
+            batch = self._take()
+            backlog = len(self._pending)
+            # 剩余分句交给下一个调度任务，可由其他空闲线程并行处理
+            self._scheduled = backlog > 0
+        if backlog:
+            self._schedule()
+        if not batch:
+            return
+        start = time.monotonic()
+        if len(batch) == 1:
+            self._run_single(*batch[0])
+        else:
+            self._run_batch(batch)
+        self._observe(time.monotonic() - start, len(batch), backlog)
+
+    def _observe(self, elapsed, size, backlog):
+        with self._lock:
+            self.stats['runs'] += 1
+            if size > 1:
+                self.stats['batches'] += 1
+                self.stats['batched_items'] += size
+            self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+            if elapsed > self.target_latency:
+                self.limit = max(1, self.limit // 2)
+            elif backlog > 0:
+                self.limit = min(self.max_batch, self.limit + 1)
+
+    def _on_dropped(self):
+        # 调度任务被线程池拒绝或丢弃，排队中的分句以失败结果输出，而不是静默跳过
+        with self._lock:
+            self._scheduled = False
+            dropped = list(self._pending)
+            self._pending.clear()
+            self.stats['dropped'] += len(dropped)
+        if self._on_reject is not None:
+            self._on_reject(dropped)
+        else:
+            self._skip(dropped)
+
+    def clear(self):
+        """丢弃尚未处理的分句（会话重置时调用，释放它们的顺序号）"""
+        with self._lock:
+            dropped = list(self._pending)
+            self._pending.clear()
+            self.stats['dropped'] += len(dropped)
+        self._skip(dropped)
+
+    @staticmethod
+    def _skip(items):
+        for _, ticket in items:
+            if ticket is not None:
+                ticket.skip()
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update({
+                'pending': len(self._pending),
+                'limit': self.limit,
+                'latency': round(self.latency, 4) if self.latency is not None else None,
+            })
+        stats['calls_saved'] = stats['batched_items'] - stats['batches']
+        return stats
+
+
+def _drain_batchers(batchers):
+    for batcher in list(batchers):
+        batcher._drain()
+
+
+def _merge_drains(pending_args, new_args):
+    # 排空是幂等的，同一会话只需出现一次
+    batchers = pending_args[0]
+    batchers.extend(b for b in new_args[0] if b not in batchers)
+    return pending_args
+
+
+class Superseded(Exception):
+    """任务所属的会话状态已被重置（清除结果、重置会话），不再执行，结果也不再使用"""
+
+
+class _SlotWaiter:
+    __slots__ = ('klass', 'alive', 'state', '_event', '_loop', '_future')
+
+    def __init__(self, klass, alive, loop=None):
+        self.klass = klass
+        self.alive = alive
+        self.state = None  # granted / superseded
+        self._event = threading.Event() if loop is None else None
+        self._loop = loop
+        self._future = loop.create_future() if loop is not None else None
+
+    def finish(self, state):
+        self.state = state
+        if self._loop is None:
+            self._event.set()
+        else:
+            self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self._future.done():
+            self._future.set_result(self.state)
+
+
+class PriorityScheduler:
+    """按优先级分配大模型调用名额：interactive（用户按键触发）> segment（分句分析）> summary（摘要）
+
+    - 总并发不超过 max_active，每类另有各自的上限；低优先级的上限之和小于总数时，交互请求总有空位
+    - 名额空出时先满足高优先级的等待者，同级按先来后到；某类达到自身上限时不挡住更低的类
+    - 等待者的 alive 返回 False（所属会话已重置）时在分配前剔除，等待方收到 Superseded
+    """
+
+    CLASSES = ('interactive', 'segment', 'summary')
+
+    def __init__(self, max_active=8, limits=None):
+        self.max_active = max_active
+        self.limits = {klass: max_active for klass in self.CLASSES}
+        self.limits.update(limits or {})
+        self._active = {klass: 0 for klass in self.CLASSES}
+        self._waiting = {klass: deque() for klass in self.CLASSES}
+        self._lock = threading.Lock()
+        self.stats = {klass: {'granted': 0, 'queued': 0, 'superseded': 0, 'timeouts': 0, 'wait_seconds': 0.0}
+                      for klass in self.CLASSES}
+
+    @classmethod
+    def from_env(cls):
+        max_active = int(os.getenv('LLM_SLOTS', '8'))
+        # 默认分句分析最多占一半、摘要占八分之一，其余名额总是留给交互请求
+        defaults = {'interactive': max_active, 'segment': max(1, max_active // 2), 'summary': max(1, max_active // 8)}
+        return cls(
+            max_active=max_active,
+            limits={klass: int(os.getenv(f'LLM_SLOTS_{klass.upper()}', str(n))) for klass, n in defaults.items()},
+        )
+
+    def _try_grant(self, klass, alive):
+        """无需排队时直接占用名额；同类或更高优先级已有人排队时不插队"""
+        if alive is not None and not alive():
+            self.stats[klass]['superseded'] += 1
+            raise Superseded()
+        rank = self.CLASSES.index(klass)
+        if any(self._waiting[k] for k in self.CLASSES[:rank + 1]):
+            return False
+        if sum(self._active.values()) >= self.max_active or self._active[klass] >= self.limits[klass]:
+            return False
+        self._active[klass] += 1
+        self.stats[klass]['granted'] += 1
+        return True
+
+    def _dispatch(self):
+        # 调用方持有锁
+        for klass in self.CLASSES:
+            queue = self._waiting[klass]
+            while queue:
+                waiter = queue[0]
+                if waiter.alive is not None and not waiter.alive():
+                    queue.popleft()
+                    self.stats[klass]['superseded'] += 1
+                    waiter.finish('superseded')
+                    continue
+                if sum(self._active.values()) >= self.max_active:
+                    return
+                if self._active[klass] >= self.limits[klass]:
+                    break
+                queue.popleft()
+                self._active[klass] += 1
+                self.stats[klass]['granted'] += 1
+                waiter.finish('granted')
+
+    def _abandon(self, waiter):
+        """等待被取消：仍在队列中则移除，已分到的名额归还"""
+        with self._lock:
+            if waiter.state is None:
+                self._waiting[waiter.klass].remove(waiter)
+            elif waiter.state == 'granted':
+                self._active[waiter.klass] -= 1
+                self._dispatch()
+
+    def acquire(self, klass, alive=None, timeout=None):
+        """取得一个名额返回 True，超时返回 False；所属会话已重置时抛出 Superseded"""
+        start = time.monotonic()
+        with self._lock:
+            if self._try_grant(klass, alive):
+                return True
+            waiter = _SlotWaiter(klass, alive)
+            self._waiting[klass].append(waiter)
+            self.stats[klass]['queued'] += 1
+            self._dispatch()
+        waiter._event.wait(timeout)
+        return self._settle(waiter, start)
+
+    async def acquire_async(self, klass, alive=None, timeout=None):
+        """acquire 的协程版本，供 ASGI 模式使用"""
+        start = time.monotonic()
+        with self._lock:
+            if self._try_grant(klass, alive):
+                return True
+            waiter = _SlotWaiter(klass, alive, asyncio.get_running_loop())
+            self._waiting[klass].append(waiter)
+            self.stats[klass]['queued'] += 1
+            self._dispatch()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+        return self._settle(waiter, start)
+
+    def _settle(self, waiter, start):
+        with self._lock:
+            stats = self.stats[waiter.klass]
+            stats['wait_seconds'] += time.monotonic() - start
+            if waiter.state is None:
+                # state 只在持锁时改变，仍为 None 说明还在队列中
+                self._waiting[waiter.klass].remove(waiter)
+                stats['timeouts'] += 1
+                return False
+        if waiter.state == 'superseded':
+            raise Superseded()
+        return True
+
+    def release(self, klass):
+        with self._lock:
+            self._active[klass] -= 1
+            self._dispatch()
+
+    def prune(self):
+        """立即剔除所有已失效的等待者（会话重置时调用），不必等它们排到队首"""
+        with self._lock:
+            for klass in self.CLASSES:
+                queue = self._waiting[klass]
+                for waiter in [w for w in queue if w.alive is not None and not w.alive()]:
+                    queue.remove(waiter)
+                    self.stats[klass]['superseded'] += 1
+                    waiter.finish('superseded')
+            self._dispatch()
+
+    def snapshot(self):
+        with self._lock:
+            classes = {}
+            for klass in self.CLASSES:
+                stats = dict(self.stats[klass])
+                stats['wait_seconds'] = round(stats['wait_seconds'], 4)
+                stats.update(active=self._active[klass], waiting=len(self._waiting[klass]), limit=self.limits[klass])
+                classes[klass] = stats
+        return {'max_active': self.max_active, 'classes': classes}